@@ -1,76 +1,55 @@
 import sqlite3
 import os
 import json
-import shutil
-from datetime import datetime
-from threading import Thread
+import csv
+import gzip
+import io
+import hashlib
+import tempfile
+from datetime import datetime, timedelta
+from threading import Thread, Lock, BoundedSemaphore, Event
+from collections import deque, OrderedDict
+from itertools import chain
+import queue
 import time
-from flask import Flask, jsonify, request, send_from_directory, session, redirect, url_for, render_template
+import click
+from flask import Flask, Response, jsonify, request, send_file, send_from_directory, session, redirect, url_for, render_template
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import ClosingIterator
 from werkzeug.security import generate_password_hash, check_password_hash
 
-# ==========================
-# SISTEMA DE BACKUP
-# ==========================
-BACKUP_FOLDER = 'backups'
-BACKUP_INTERVAL = 3600  # 1 hora
-MAX_BACKUPS = 48  # Últimos 2 dias
-
-def criar_pasta_backup():
-    if not os.path.exists(BACKUP_FOLDER):
-        os.makedirs(BACKUP_FOLDER)
-        print(f"📁 Pasta de backups criada: {BACKUP_FOLDER}")
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
 
-def fazer_backup():
-    try:
-        criar_pasta_backup()
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        db_files = {
-            'menu': MENU_DB_PATH,
-            'pedidos': PEDIDOS_DB_PATH,
-            'config': CONFIG_DB_PATH
-        }
-        
-        for nome, arquivo in db_files.items():
-            if os.path.exists(arquivo):
-                backup_filename = f"{nome}_backup_{timestamp}.db"
-                backup_path = os.path.join(BACKUP_FOLDER, backup_filename)
-                shutil.copy2(arquivo, backup_path)
-                tamanho_mb = os.path.getsize(backup_path) / (1024 * 1024)
-                print(f"✅ Backup: {backup_filename} ({tamanho_mb:.2f} MB)")
-        
-        limpar_backups_antigos()
-        return True
-    except Exception as e:
-        print(f"❌ Erro ao fazer backup: {e}")
-        return False
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-def limpar_backups_antigos():
-    try:
-        arquivos = []
-        for arquivo in os.listdir(BACKUP_FOLDER):
-            if arquivo.endswith('.db'):
-                caminho = os.path.join(BACKUP_FOLDER, arquivo)
-                arquivos.append((caminho, os.path.getmtime(caminho)))
-        
-        arquivos.sort(key=lambda x: x[1], reverse=True)
-        
-        if len(arquivos) > MAX_BACKUPS:
-            for arquivo, _ in arquivos[MAX_BACKUPS:]:
-                os.remove(arquivo)
-                print(f"🗑️ Backup antigo removido: {os.path.basename(arquivo)}")
-    except Exception as e:
-        print(f"⚠️ Erro ao limpar backups: {e}")
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
-def backup_automatico():
-    print(f"🔄 Backup automático iniciado (a cada {BACKUP_INTERVAL/60:.0f} min)")
-    while True:
-        time.sleep(BACKUP_INTERVAL)
-        print(f"\n🕒 {datetime.now().strftime('%H:%M:%S')} - Backup automático...")
-        fazer_backup()
+from backups import (
+    BACKUP_FOLDER, BACKUP_EXTENSOES, BACKUP_INCREMENTAL_FOLDER,
+    criar_pasta_backup, fazer_backup, backup_automatico, listar_cadeias, restaurar_cadeia
+)
+from barramento import (
+    BarramentoEventos, TransporteBarramento,
+    BARRAMENTO_ENDERECO, BARRAMENTO_ENTRADA_MAX, BARRAMENTO_TOKEN
+)
+from estaticos import ManifestoEstatico, ESTATICOS_MAX_AGE
+from hub import HubPedidos, HUB_HISTORICO, HUB_KEEPALIVE
 
+# ==========================
+# SISTEMA DE BACKUP
+# ==========================
+# Cópia, compressão e cadeias incrementais em backups.py; aqui só o agendamento
 def iniciar_backup_automatico():
     # ✅ Guard para evitar duplicação no reloader do Flask
     if os.environ.get("WERKZEUG_RUN_MAIN") != "true":
@@ -79,17 +58,34 @@ def iniciar_backup_automatico():
     print(f"\n{'='*50}")
     print("💾 Fazendo backup inicial...")
     print(f"{'='*50}")
-    fazer_backup()
-    backup_thread = Thread(target=backup_automatico, daemon=True)
+    fazer_backup(BANCOS_BACKUP)
+    backup_thread = Thread(target=backup_automatico, args=(BANCOS_BACKUP,), daemon=True)
     backup_thread.start()
 
+def backup_como_lider():
+    """
+    Agendador de backups no processo líder (servidor de produção).
+    Roda na thread do líder, que segura o lock enquanto o processo viver.
+    """
+    print(f"💾 Backup inicial (processo {os.getpid()})...")
+    fazer_backup(BANCOS_BACKUP)
+    backup_automatico(BANCOS_BACKUP)
+
+def tarefas_do_lider():
+    """
+    O que roda em um processo só: monitor de alertas de estoque e backups.
+    """
+    projecao_estoque.iniciar_monitor()
+    backup_como_lider()
+
 # ==========================
 # CONFIGURAÇÃO DO FLASK
 # ==========================
 app = Flask(__name__, static_folder='public', static_url_path='', template_folder='public')
 
 # ✅ CORS restrito à mesma origem (ou específico em produção)
-CORS(app, supports_credentials=True, origins=os.environ.get('CORS_ORIGINS', '*').split(','))
+CORS(app, supports_credentials=True, origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+     expose_headers=['ETag', 'X-Proximo-After-Id'])
 
 # ✅ SECRET_KEY de variável de ambiente
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-CHANGE-IN-PRODUCTION-' + os.urandom(24).hex())
@@ -105,20 +101,192 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 MENU_DB_PATH = 'sorveteria.db'
 PEDIDOS_DB_PATH = 'pedidos.db'
 CONFIG_DB_PATH = 'config.db'
+BANCOS_BACKUP = {'menu': MENU_DB_PATH, 'pedidos': PEDIDOS_DB_PATH, 'config': CONFIG_DB_PATH}
 
 # ✅ Senha admin de variável de ambiente
 ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
 ADMIN_PASSWORD_HASH = generate_password_hash(os.environ.get('ADMIN_PASSWORD', 'sorvete123'))
 
+# ==========================
+# COMPRESSÃO DE RESPOSTAS
+# ==========================
+COMPRESSAO_MIN_BYTES = int(os.environ.get('COMPRESSAO_MIN_BYTES', '1024'))  # Abaixo disso não compensa
+COMPRESSAO_MAX_BYTES = 8 * 1024 * 1024  # Acima disso passa direto (não bufferiza)
+COMPRESSAO_NIVEL_GZIP = int(os.environ.get('COMPRESSAO_NIVEL_GZIP', '6'))
+COMPRESSAO_NIVEL_BROTLI = int(os.environ.get('COMPRESSAO_NIVEL_BROTLI', '5'))
+COMPRESSAO_CACHE_ITENS = 64  # Corpos comprimidos guardados por (rota, ETag, codificação)
+COMPRESSAO_TIPOS = ('application/json', 'application/javascript', 'application/x-ndjson',
+                    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'image/svg+xml')
+
+class CompressaoRespostas:
+    """
+    Middleware WSGI que comprime JSON/texto conforme o Accept-Encoding:
+    - br (se o módulo brotli existir) ou gzip, só acima de COMPRESSAO_MIN_BYTES
+    - respostas com ETag têm o corpo comprimido guardado em LRU: enquanto a
+      versão não muda, os polls reaproveitam os bytes sem recomprimir
+    - não mexe em SSE, respostas já codificadas (estáticos pré-comprimidos),
+      streams sem Content-Length nem em HEAD/304
+    """
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        self._stats = {
+            'respostas': 0,
+            'comprimidas': 0,
+            'cache_hits': 0,
+            'bytes_originais': 0,
+            'bytes_enviados': 0,
+            'tempo_compressao_ms': 0.0
+        }
+    
+    @staticmethod
+    def _codificacao(accept_encoding):
+        aceitas = {}
+        for parte in accept_encoding.lower().split(','):
+            nome, _, params = parte.strip().partition(';')
+            q = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            aceitas[nome.strip()] = q
+        for cod in ('br', 'gzip'):
+            if cod == 'br' and brotli is None:
+                continue
+            if aceitas.get(cod, aceitas.get('*', 0)) > 0:
+                return cod
+        return None
+    
+    @staticmethod
+    def _comprimir(corpo, cod):
+        if cod == 'br':
+            return brotli.compress(corpo, quality=COMPRESSAO_NIVEL_BROTLI)
+        return gzip.compress(corpo, compresslevel=COMPRESSAO_NIVEL_GZIP, mtime=0)
+    
+    @staticmethod
+    def _repassar(escritos, corpo_iter):
+        """
+        Corpo sem compressão: o que a aplicação mandou pelo write() vem antes do iterável.
+        """
+        if not escritos:
+            return corpo_iter
+        return ClosingIterator(chain(escritos, corpo_iter), getattr(corpo_iter, 'close', None))
+    
+    def _comprimido(self, chave, corpo, cod):
+        if chave is not None:
+            with self._lock:
+                dados = self._cache.get(chave)
+                if dados is not None:
+                    self._cache.move_to_end(chave)
+                    self._stats['cache_hits'] += 1
+                    return dados
+        
+        inicio = time.perf_counter()
+        dados = self._comprimir(corpo, cod)
+        with self._lock:
+            self._stats['tempo_compressao_ms'] += (time.perf_counter() - inicio) * 1000
+            if chave is not None:
+                self._cache[chave] = dados
+                while len(self._cache) > COMPRESSAO_CACHE_ITENS:
+                    self._cache.popitem(last=False)
+        return dados
+    
+    def __call__(self, environ, start_response):
+        capturado = {}
+        escritos = []
+        
+        def _start_response(status, headers, exc_info=None):
+            capturado['status'] = status
+            capturado['headers'] = headers
+            capturado['exc_info'] = exc_info
+            return escritos.append
+        
+        corpo_iter = self.wsgi_app(environ, _start_response)
+        status, headers = capturado['status'], capturado['headers']
+        cabecalhos = {nome.lower(): valor for nome, valor in headers}
+        tipo = cabecalhos.get('content-type', '').split(';')[0].strip().lower()
+        tamanho = cabecalhos.get('content-length')
+        with self._lock:
+            self._stats['respostas'] += 1
+        
+        comprimivel = (
+            tipo in COMPRESSAO_TIPOS
+            and 'content-encoding' not in cabecalhos
+            and tamanho is not None and int(tamanho) <= COMPRESSAO_MAX_BYTES
+            and not status.startswith(('204', '206', '304'))
+        )
+        if not comprimivel:
+            start_response(status, headers, capturado['exc_info'])
+            return self._repassar(escritos, corpo_iter)
+        
+        if 'vary' in cabecalhos:
+            if 'accept-encoding' not in cabecalhos['vary'].lower():
+                headers = [(n, f"{v}, Accept-Encoding" if n.lower() == 'vary' else v) for n, v in headers]
+        else:
+            headers = headers + [('Vary', 'Accept-Encoding')]
+        
+        cod = self._codificacao(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if cod is None or environ.get('REQUEST_METHOD') == 'HEAD' or int(tamanho) < COMPRESSAO_MIN_BYTES:
+            start_response(status, headers, capturado['exc_info'])
+            return self._repassar(escritos, corpo_iter)
+        
+        try:
+            corpo = b''.join(escritos) + b''.join(corpo_iter)
+        finally:
+            if hasattr(corpo_iter, 'close'):
+                corpo_iter.close()
+        
+        etag = cabecalhos.get('etag')
+        chave = (environ.get('PATH_INFO'), environ.get('QUERY_STRING'), etag, cod) if etag else None
+        dados = self._comprimido(chave, corpo, cod)
+        if len(dados) >= len(corpo):
+            start_response(status, headers, capturado['exc_info'])
+            return [corpo]
+        
+        headers = [(n, v) for n, v in headers if n.lower() not in ('content-length', 'etag')]
+        headers.append(('Content-Encoding', cod))
+        headers.append(('Content-Length', str(len(dados))))
+        if etag:
+            # ETag fraca continua válida para a versão comprimida (RFC 9110 §8.8.1)
+            headers.append(('ETag', etag if etag.startswith('W/') else 'W/' + etag))
+        
+        with self._lock:
+            self._stats['comprimidas'] += 1
+            self._stats['bytes_originais'] += len(corpo)
+            self._stats['bytes_enviados'] += len(dados)
+        start_response(status, headers, capturado['exc_info'])
+        return [dados]
+    
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cache_itens'] = len(self._cache)
+        stats['bytes_economizados'] = stats['bytes_originais'] - stats['bytes_enviados']
+        stats['taxa'] = round(stats['bytes_enviados'] / stats['bytes_originais'], 3) if stats['bytes_originais'] else None
+        stats['tempo_compressao_ms'] = round(stats['tempo_compressao_ms'], 3)
+        stats['codificacoes'] = ['br', 'gzip'] if brotli is not None else ['gzip']
+        return stats
+
+compressao_respostas = CompressaoRespostas(app.wsgi_app)
+app.wsgi_app = compressao_respostas
+
 # ==========================
 # FUNÇÕES DE CONEXÃO
 # ==========================
-def get_db(path, timeout=10.0):
+# Conexões por banco: uma por thread de requisição (WEB_THREADS) + folga para
+# as threads de fundo (gravador, barramento, backups) e get_db aninhados
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', str(int(os.environ.get('WEB_THREADS', '16')) + 4)))
+DB_POOL_HEALTHCHECK = 30  # Segundos ociosa antes de revalidar a conexão
+
+def abrir_conexao(path, timeout=10.0, anexos=()):
     """
-    Retorna conexão SQLite com:
+    Abre conexão SQLite com:
     - PRAGMA foreign_keys=ON
     - journal_mode=WAL
     - timeout configurável
+    - anexos: ((alias, caminho), ...) anexados com ATTACH (ex.: 'menu')
     """
     conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
     conn.row_factory = sqlite3.Row
@@ -127,8 +295,180 @@ def get_db(path, timeout=10.0):
     conn.execute("PRAGMA foreign_keys = ON")
     conn.execute("PRAGMA journal_mode = WAL")
     
+    for alias, caminho in anexos:
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (caminho,))
+        conn.execute(f"PRAGMA {alias}.journal_mode = WAL")
+    
     return conn
 
+class ConexaoPool:
+    """
+    Conexão emprestada do pool. Repassa tudo para a conexão SQLite,
+    mas close() devolve a conexão ao pool em vez de fechá-la.
+    - `with get_db(...) as conn:` devolve ao sair do bloco; transação não
+      commitada é desfeita (diferente do `with` do sqlite3, que commita)
+    - empréstimo esquecido sem close() é devolvido quando o objeto é coletado
+    """
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+    
+    def __getattr__(self, nome):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise sqlite3.ProgrammingError('Conexão já devolvida ao pool')
+        return getattr(conn, nome)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, tipo, erro, tb):
+        self.close()
+        return False
+    
+    def __del__(self):
+        if self.__dict__.get('_conn') is not None:
+            print(f"⚠️ Conexão de {self._pool.path} não foi devolvida com close(): devolvendo ao pool")
+            self.close()
+    
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.devolver(conn)
+
+class PoolConexoes:
+    """
+    Pool de conexões de um banco SQLite.
+    - PRAGMAs aplicados uma única vez, na abertura da conexão
+    - No máximo `tamanho` conexões emprestadas ao mesmo tempo
+    - Conexões ociosas há mais de DB_POOL_HEALTHCHECK segundos são revalidadas
+    """
+    def __init__(self, path, tamanho=DB_POOL_SIZE, timeout=10.0, anexos=()):
+        self.path = path
+        self.tamanho = tamanho
+        self.timeout = timeout
+        self.anexos = anexos
+        self._livres = []  # (conn, ociosa_desde) - LIFO mantém as conexões quentes
+        self._lock = Lock()
+        self._vagas = BoundedSemaphore(tamanho)
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'esperas': 0,
+            'espera_total_ms': 0.0,
+            'espera_max_ms': 0.0,
+            'esgotado': 0,
+            'descartadas': 0
+        }
+    
+    def _saudavel(self, conn, ociosa_desde):
+        if time.monotonic() - ociosa_desde < DB_POOL_HEALTHCHECK:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+    
+    def _descartar(self, conn):
+        with self._lock:
+            self._stats['descartadas'] += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    
+    def adquirir(self):
+        inicio = time.perf_counter()
+        if not self._vagas.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['esgotado'] += 1
+            raise sqlite3.OperationalError(f'Pool esgotado: {self.path}')
+        espera_ms = (time.perf_counter() - inicio) * 1000
+        
+        try:
+            conn = None
+            while conn is None:
+                with self._lock:
+                    if not self._livres:
+                        break
+                    candidata, ociosa_desde = self._livres.pop()
+                if self._saudavel(candidata, ociosa_desde):
+                    conn = candidata
+                else:
+                    self._descartar(candidata)
+            
+            reaproveitada = conn is not None
+            if not reaproveitada:
+                conn = abrir_conexao(self.path, timeout=self.timeout, anexos=self.anexos)
+        except BaseException:
+            self._vagas.release()
+            raise
+        
+        with self._lock:
+            self._stats['hits' if reaproveitada else 'misses'] += 1
+            self._stats['esperas'] += 1
+            self._stats['espera_total_ms'] += espera_ms
+            self._stats['espera_max_ms'] = max(self._stats['espera_max_ms'], espera_ms)
+        
+        return ConexaoPool(self, conn)
+    
+    def devolver(self, conn):
+        try:
+            # Nunca devolve transação pendurada ao pool
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._descartar(conn)
+        else:
+            with self._lock:
+                self._livres.append((conn, time.monotonic()))
+        finally:
+            self._vagas.release()
+    
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['livres'] = len(self._livres)
+        stats['tamanho'] = self.tamanho
+        stats['espera_media_ms'] = round(stats['espera_total_ms'] / stats['esperas'], 3) if stats['esperas'] else 0.0
+        stats['espera_total_ms'] = round(stats['espera_total_ms'], 3)
+        stats['espera_max_ms'] = round(stats['espera_max_ms'], 3)
+        return stats
+
+_pools = {}
+_pools_lock = Lock()
+
+def obter_pool(path, timeout=10.0, anexos=()):
+    chave = path + ''.join(f"+{alias}" for alias, _ in anexos)
+    pool = _pools.get(chave)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(chave)
+            if pool is None:
+                pool = PoolConexoes(path, timeout=timeout, anexos=anexos)
+                _pools[chave] = pool
+    return pool
+
+def get_db(path, timeout=10.0):
+    """
+    Retorna conexão SQLite do pool do banco.
+    close() devolve a conexão ao pool.
+    """
+    return obter_pool(path, timeout).adquirir()
+
+# Conexão do caminho de escrita do pedido: pedidos.db com o cardápio anexado
+ANEXOS_PEDIDO = (('menu', MENU_DB_PATH),)
+
+def get_db_pedido(timeout=10.0):
+    """
+    Conexão do pool 'pedidos.db+menu': pedido e baixa de estoque na MESMA
+    transação (rollback desfaz os dois). Em WAL o COMMIT é atômico por
+    arquivo, não entre os dois: reconciliar_estoque_pedidos conserta um
+    commit interrompido no meio. Tabelas do cardápio como menu.<tabela>.
+    """
+    return obter_pool(PEDIDOS_DB_PATH, timeout, ANEXOS_PEDIDO).adquirir()
+
 # ==========================
 # INICIALIZAÇÃO DOS BANCOS
 # ==========================
@@ -218,31 +558,6 @@ def garantir_schema_base():
     
     print("✅ Esquema base garantido em todos os bancos")
 
-def init_estoque_db():
-    """
-    Adiciona coluna estoque se não existir.
-    """
-    conn = get_db(MENU_DB_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("PRAGMA table_info(produtos)")
-        colunas = [col[1] for col in cursor.fetchall()]
-        if 'estoque' not in colunas:
-            cursor.execute('ALTER TABLE produtos ADD COLUMN estoque INTEGER DEFAULT 999')
-            print("✅ Coluna estoque adicionada em produtos")
-        
-        cursor.execute("PRAGMA table_info(adicionais)")
-        colunas = [col[1] for col in cursor.fetchall()]
-        if 'estoque' not in colunas:
-            cursor.execute('ALTER TABLE adicionais ADD COLUMN estoque INTEGER DEFAULT 999')
-            print("✅ Coluna estoque adicionada em adicionais")
-        
-        conn.commit()
-    except Exception as e:
-        print(f"❌ Erro ao init estoque: {e}")
-    finally:
-        conn.close()
-
 def init_pedidos_adicionais_db():
     """
     Cria tabelas de adicionais e acompanhamentos vendidos.
@@ -308,6 +623,193 @@ def init_config_db():
     conn.close()
     print("✅ Configurações inicializadas")
 
+# ==========================
+# MIGRAÇÕES DE ESQUEMA (PRAGMA user_version)
+# ==========================
+def adicionar_coluna(cursor, tabela, coluna, definicao):
+    """
+    ALTER TABLE ADD COLUMN idempotente. Retorna True se a coluna foi criada.
+    """
+    colunas = [col[1] for col in cursor.execute(f"PRAGMA table_info({tabela})").fetchall()]
+    if coluna in colunas:
+        return False
+    cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
+    return True
+
+def _migracao_menu_estoque(cursor):
+    adicionar_coluna(cursor, 'produtos', 'estoque', 'INTEGER DEFAULT 999')
+    adicionar_coluna(cursor, 'adicionais', 'estoque', 'INTEGER DEFAULT 999')
+
+def _migracao_menu_colunas_legadas(cursor):
+    """
+    Bancos criados pela versão antiga do painel (como o sorveteria.db do
+    repositório) têm produtos.imagem_path e adicionais.adicional_categoria_id,
+    com categorias de adicionais separadas e ligadas aos produtos por
+    produto_adicional_links. O código usa produtos.imagem e adicionais.categoria_id.
+    """
+    colunas_produtos = [col[1] for col in cursor.execute("PRAGMA table_info(produtos)").fetchall()]
+    if 'imagem_path' in colunas_produtos and 'imagem' not in colunas_produtos:
+        cursor.execute("ALTER TABLE produtos RENAME COLUMN imagem_path TO imagem")
+        # Caminhos antigos eram relativos: a partir da raiz, como os do upload ('/uploads/...').
+        # URLs externas ficam como estão.
+        cursor.execute('''
+            UPDATE produtos SET imagem = '/' || imagem
+            WHERE imagem <> '' AND imagem NOT LIKE '/%' AND imagem NOT LIKE '%://%'
+        ''')
+    
+    colunas_adicionais = [col[1] for col in cursor.execute("PRAGMA table_info(adicionais)").fetchall()]
+    if adicionar_coluna(cursor, 'adicionais', 'categoria_id', 'INTEGER REFERENCES categorias(id)') \
+            and 'adicional_categoria_id' in colunas_adicionais:
+        # Cada grupo de adicionais vai para a categoria dos produtos ligados a
+        # ele (a de menor id, se estiver ligado a mais de uma)
+        cursor.execute('''
+            UPDATE adicionais SET categoria_id = (
+                SELECT MIN(p.categoria_id)
+                FROM produto_adicional_links l
+                JOIN produtos p ON p.id = l.produto_id
+                WHERE l.adicional_categoria_id = adicionais.adicional_categoria_id
+            )
+        ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_adicionais_categoria ON adicionais(categoria_id)")
+
+def _migracao_menu_movimentos_pedido(cursor):
+    # Baixa de pedido no diário: liga o movimento ao pedido que o causou
+    adicionar_coluna(cursor, 'movimentos_estoque', 'pedido_id', 'INTEGER')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_movimentos_pedido ON movimentos_estoque(pedido_id)")
+
+def _migracao_pedidos_seq_alteracao(cursor):
+    # ✅ Sequência de alteração: cresce a cada pedido criado ou status alterado
+    if adicionar_coluna(cursor, 'pedidos', 'seq_alteracao', 'INTEGER'):
+        cursor.execute("UPDATE pedidos SET seq_alteracao = id")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pedidos_seq_alteracao ON pedidos(seq_alteracao)")
+
+def _migracao_pedidos_rollups(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS vendas_dia (
+            data TEXT NOT NULL,
+            categoria_produto TEXT NOT NULL,
+            nome_acompanhamento TEXT NOT NULL,
+            quantidade INTEGER NOT NULL DEFAULT 0,
+            valor_total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (data, categoria_produto, nome_acompanhamento)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS vendas_hora (
+            data TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            categoria_produto TEXT NOT NULL,
+            nome_acompanhamento TEXT NOT NULL,
+            quantidade INTEGER NOT NULL DEFAULT 0,
+            valor_total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (data, hora, categoria_produto, nome_acompanhamento)
+        ) WITHOUT ROWID
+    ''')
+    # ✅ Backfill do histórico já existente
+    reconstruir_rollups(cursor)
+
+def _migracao_pedidos_ids_cardapio(cursor):
+    # Itens ligados ao cardápio pelo id: o nome pode mudar (ou repetir com outra caixa).
+    # Linhas antigas ficam com NULL: o cardápio não está anexado durante a migração.
+    adicionar_coluna(cursor, 'itens_pedido', 'produto_id', 'INTEGER')
+    adicionar_coluna(cursor, 'adicionais_pedido', 'adicional_id', 'INTEGER')
+
+# Cada passo: (versão, descrição, função(cursor) ou lista de SQL).
+# Passos novos entram SEMPRE no fim da lista, com a próxima versão.
+MIGRACOES = {
+    MENU_DB_PATH: [
+        (1, 'coluna estoque em produtos e adicionais', _migracao_menu_estoque),
+        (2, 'índices de busca por nome e categoria', [
+            "CREATE INDEX IF NOT EXISTS idx_produtos_nome ON produtos(nome COLLATE NOCASE)",
+            "CREATE INDEX IF NOT EXISTS idx_adicionais_nome ON adicionais(nome COLLATE NOCASE)",
+            "CREATE INDEX IF NOT EXISTS idx_produtos_categoria ON produtos(categoria_id)",
+        ]),
+        (3, 'variantes otimizadas das imagens', [
+            '''CREATE TABLE IF NOT EXISTS imagens_otimizadas (
+                original TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                variantes TEXT NOT NULL,
+                criado_em TEXT NOT NULL
+            )''',
+        ]),
+        (4, 'diário de movimentos de estoque', [
+            '''CREATE TABLE IF NOT EXISTS movimentos_estoque (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tabela TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                estoque_anterior INTEGER NOT NULL,
+                estoque_novo INTEGER NOT NULL,
+                motivo TEXT,
+                criado_em TEXT NOT NULL
+            )''',
+            "CREATE INDEX IF NOT EXISTS idx_movimentos_item ON movimentos_estoque(tabela, item_id, id)",
+        ]),
+        (5, 'colunas do esquema antigo (imagem_path, adicional_categoria_id)', _migracao_menu_colunas_legadas),
+        (6, 'pedido de origem nos movimentos de estoque', _migracao_menu_movimentos_pedido),
+    ],
+    PEDIDOS_DB_PATH: [
+        (1, 'sequência de alteração dos pedidos', _migracao_pedidos_seq_alteracao),
+        (2, 'índices de status, itens, adicionais e relatórios', [
+            "CREATE INDEX IF NOT EXISTS idx_pedidos_status ON pedidos(status, id)",
+            "CREATE INDEX IF NOT EXISTS idx_itens_pedido_pedido ON itens_pedido(pedido_id)",
+            "CREATE INDEX IF NOT EXISTS idx_adicionais_pedido_item ON adicionais_pedido(item_pedido_id)",
+            "CREATE INDEX IF NOT EXISTS idx_acompanhamentos_data ON acompanhamentos_vendidos(data, hora, categoria_produto)",
+        ]),
+        (3, 'rollups de vendas por dia e por hora', _migracao_pedidos_rollups),
+        (4, 'id do cardápio nos itens e adicionais do pedido', _migracao_pedidos_ids_cardapio),
+        (5, 'pedidos já conferidos pela reconciliação de estoque', [
+            '''CREATE TABLE IF NOT EXISTS pedidos_reconciliados (
+                pedido_id INTEGER PRIMARY KEY,
+                motivo TEXT NOT NULL,
+                criado_em TEXT NOT NULL
+            )''',
+        ]),
+    ],
+    CONFIG_DB_PATH: [],
+}
+
+def migrar_banco(path, passos):
+    """
+    Aplica os passos com versão maior que o user_version do banco.
+    Cada passo roda em sua própria transação junto com o novo user_version,
+    então rodar de novo (ou em vários processos ao mesmo tempo) é seguro.
+    """
+    conn = get_db(path)
+    try:
+        for versao, descricao, passo in passos:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= versao:
+                    conn.rollback()
+                    continue
+                
+                cursor = conn.cursor()
+                if callable(passo):
+                    passo(cursor)
+                else:
+                    for sql in passo:
+                        cursor.execute(sql)
+                cursor.execute(f"PRAGMA user_version = {int(versao)}")
+                conn.commit()
+                print(f"✅ {path}: migração {versao} aplicada ({descricao})")
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.close()
+
+def executar_migracoes():
+    """
+    Roda as migrações pendentes de todos os bancos. Idempotente.
+    """
+    for path, passos in MIGRACOES.items():
+        try:
+            migrar_banco(path, passos)
+        except Exception as e:
+            print(f"❌ Erro ao migrar {path}: {e}")
+            raise
+
 # ==========================
 # HELPERS DE VALIDAÇÃO
 # ==========================
@@ -333,163 +835,1550 @@ def require_auth(f):
     return wrapper
 
 # ==========================
-# HELPERS DE ESTOQUE
+# CATÁLOGO DO CARDÁPIO (CACHE)
 # ==========================
-def verificar_estoque_disponivel(itens):
+class VersaoBanco:
     """
-    Verifica se há estoque suficiente para todos os itens do pedido.
-    Retorna (sucesso: bool, mensagem: str, faltantes: list)
+    Detecta commits de qualquer conexão/processo no banco via PRAGMA data_version.
+    Usa uma conexão própria, que nunca escreve.
     """
-    conn_menu = get_db(MENU_DB_PATH)
-    cursor = conn_menu.cursor()
-    faltantes = []
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = Lock()
     
-    try:
-        for item in itens:
-            # Aceita 'produto_id' ou 'produto' (nome)
-            produto_id = item.get('produto_id')
-            produto_nome = item.get('produto', '').strip()
-            quantidade = item.get('quantidade', 1)
-            
-            if produto_id:
-                produto = cursor.execute(
-                    "SELECT id, nome, estoque FROM produtos WHERE id = ?",
-                    (produto_id,)
-                ).fetchone()
-            else:
-                # Case-insensitive
-                produto = cursor.execute(
-                    "SELECT id, nome, estoque FROM produtos WHERE LOWER(nome) = LOWER(?)",
-                    (produto_nome,)
-                ).fetchone()
-            
-            if not produto:
-                faltantes.append({
-                    'item': produto_nome or f"ID {produto_id}",
-                    'motivo': 'Produto não encontrado'
-                })
-                continue
-            
-            if produto['estoque'] < quantidade:
-                faltantes.append({
-                    'item': produto['nome'],
-                    'disponivel': produto['estoque'],
-                    'solicitado': quantidade
-                })
-            
-            # Verificar adicionais
-            for adicional_item in item.get('adicionais', []):
-                adicional_nome = adicional_item.get('nome', '').strip()
-                adicional_qtd = adicional_item.get('quantidade', 1)
-                
-                adicional = cursor.execute(
-                    "SELECT nome, estoque FROM adicionais WHERE LOWER(nome) = LOWER(?)",
-                    (adicional_nome,)
-                ).fetchone()
-                
-                if adicional and adicional['estoque'] < adicional_qtd * quantidade:
-                    faltantes.append({
-                        'item': adicional['nome'],
-                        'disponivel': adicional['estoque'],
-                        'solicitado': adicional_qtd * quantidade
-                    })
-        
-        if faltantes:
-            mensagens = []
-            for f in faltantes:
-                if 'motivo' in f:
-                    mensagens.append(f"{f['item']}: {f['motivo']}")
-                else:
-                    mensagens.append(
-                        f"{f['item']}: disponível {f['disponivel']}, solicitado {f['solicitado']}"
-                    )
-            return False, "; ".join(mensagens), faltantes
+    def atual(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = abrir_conexao(self.path)
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+BOOT_ID = os.urandom(4).hex()  # data_version recomeça a cada processo
+
+class VersaoRecurso:
+    """
+    Versão barata de um recurso: contador local (invalidar()) + data_version do banco.
+    Consultar a versão não lê nenhuma tabela.
+    """
+    def __init__(self, nome, path):
+        self.nome = nome
+        self._versao_banco = VersaoBanco(path)
+        self._versao_local = 0
+        self._lock = Lock()
+    
+    def invalidar(self):
+        with self._lock:
+            self._versao_local += 1
+    
+    def atual(self):
+        return (self._versao_local, self._versao_banco.atual())
+    
+    def etag(self, chave=''):
+        local, banco = self.atual()
+        etag = f"{self.nome}-{BOOT_ID}-{local}-{banco}"
+        if chave:
+            etag += '-' + hashlib.sha1(chave.encode('utf-8')).hexdigest()[:12]
+        return etag
+
+class SnapshotCatalogo:
+    """
+    Foto imutável do cardápio: nome/id -> id, preço, categoria e estoque.
+    Nomes são comparados sem diferenciar maiúsculas.
+    """
+    def __init__(self, versao, categorias, produtos, adicionais):
+        self.versao = versao
+        self.categorias = {c['id']: c['nome'] for c in categorias}
+        self.produtos_por_id = {}
+        self.produtos_por_nome = {}
+        self.adicionais_por_id = {}
+        self.adicionais_por_nome = {}
         
-        return True, "Estoque suficiente", []
+        for row in produtos:
+            produto = dict(row)
+            produto['categoria'] = self.categorias.get(produto['categoria_id'], 'Outros')
+            self.produtos_por_id[produto['id']] = produto
+            self.produtos_por_nome.setdefault(produto['nome'].strip().lower(), produto)
+        
+        for row in adicionais:
+            adicional = dict(row)
+            self.adicionais_por_id[adicional['id']] = adicional
+            self.adicionais_por_nome.setdefault(adicional['nome'].strip().lower(), adicional)
     
-    finally:
-        conn_menu.close()
+    def produto(self, produto_id=None, nome=''):
+        if produto_id:
+            try:
+                return self.produtos_por_id.get(int(produto_id))
+            except (TypeError, ValueError):
+                return None
+        return self.produtos_por_nome.get(nome.strip().lower())
+    
+    def adicional(self, nome):
+        return self.adicionais_por_nome.get(nome.strip().lower())
+
+class CatalogoMenu:
+    """
+    Cache do cardápio em memória, reconstruído quando:
+    - save_menu chama invalidar()
+    - PRAGMA data_version indica commit de outra conexão (estoque, outro processo)
+    A troca do snapshot é atômica: leitores sempre veem uma versão completa.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.versao = VersaoRecurso('menu', path)
+        self._snapshot = None
+        self._lock = Lock()
+    
+    def invalidar(self):
+        self.versao.invalidar()
+    
+    def _carregar(self, versao):
+        conn = get_db(self.path)
+        try:
+            categorias = conn.execute("SELECT id, nome FROM categorias ORDER BY id").fetchall()
+            produtos = conn.execute(
+                "SELECT id, nome, preco, imagem, categoria_id, estoque FROM produtos ORDER BY id"
+            ).fetchall()
+            adicionais = conn.execute(
+                "SELECT id, nome, preco, categoria_id, estoque FROM adicionais ORDER BY id"
+            ).fetchall()
+        finally:
+            conn.close()
+        return SnapshotCatalogo(versao, categorias, produtos, adicionais)
+    
+    def obter(self):
+        versao = self.versao.atual()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.versao == versao:
+            return snapshot
+        
+        with self._lock:
+            versao = self.versao.atual()
+            if self._snapshot is None or self._snapshot.versao != versao:
+                self._snapshot = self._carregar(versao)
+            return self._snapshot
+
+catalogo_menu = CatalogoMenu(MENU_DB_PATH)
+versao_config = VersaoRecurso('config', CONFIG_DB_PATH)
+versao_pedidos = VersaoRecurso('pedidos', PEDIDOS_DB_PATH)
+
+def resposta_condicional(versao, gerar, chave=''):
+    """
+    GET condicional: se If-None-Match bate com a versão atual, responde 304
+    sem chamar `gerar` (nenhuma leitura de tabela). A versão é lida ANTES dos
+    dados, então uma escrita concorrente nunca fica escondida atrás de um 304.
+    """
+    etag = versao.etag(chave)
+    if request.if_none_match.contains_weak(etag):
+        resposta = Response(status=304)
+    else:
+        resposta = gerar()
+    resposta.set_etag(etag, weak=True)
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
 
-def decrementar_estoque_transacao(cursor_menu, itens):
+# ==========================
+# PLANO DO PEDIDO
+# ==========================
+def quantidade_pedido(valor, rotulo):
+    """
+    Quantidade de item ou adicional: inteiro positivo de verdade (como em
+    validar_ajustes). int() aceitaria 1.9, True e "3"; negativo devolveria estoque.
+    """
+    if type(valor) is not int or valor < 1:
+        raise ValueError(f"{rotulo}: quantidade deve ser um número inteiro maior que zero")
+    return valor
+
+def planejar_pedido(itens, catalogo):
     """
-    Decrementa estoque dentro de uma transação.
-    Lança exceção se algo falhar.
+    Resolve cada produto e adicional do pedido UMA vez no catálogo e monta o plano
+    consumido pela validação, pelo cálculo do total, pela gravação e pela baixa de estoque.
+    
+    Retorna dict com:
+    - itens: produto resolvido, quantidade, preço unitário, categoria e adicionais
+    - faltantes: produtos não encontrados ou sem estoque
+    - valor_total: produtos + adicionais
+    - acompanhamentos: {categoria: {nome: {quantidade, valor_unitario}}}
+    - baixas_produtos / baixas_adicionais: {id: quantidade total}
+    Lança ValueError para quantidade inválida (não inteira ou menor que 1).
     """
+    plano = {
+        'itens': [],
+        'faltantes': [],
+        'valor_total': 0.0,
+        'acompanhamentos': {},
+        'baixas_produtos': {},
+        'baixas_adicionais': {}
+    }
+    nao_encontrados = []
+    
     for item in itens:
+        # Aceita 'produto_id' ou 'produto' (nome)
         produto_id = item.get('produto_id')
         produto_nome = item.get('produto', '').strip()
-        quantidade = item.get('quantidade', 1)
+        quantidade = quantidade_pedido(item.get('quantidade', 1), produto_nome or f"ID {produto_id}")
         
-        if produto_id:
-            cursor_menu.execute(
-                "UPDATE produtos SET estoque = estoque - ? WHERE id = ?",
-                (quantidade, produto_id)
-            )
-        else:
-            cursor_menu.execute(
-                "UPDATE produtos SET estoque = estoque - ? WHERE LOWER(nome) = LOWER(?)",
-                (quantidade, produto_nome)
-            )
+        produto = catalogo.produto(produto_id, produto_nome)
+        if not produto:
+            nao_encontrados.append({
+                'item': produto_nome or f"ID {produto_id}",
+                'motivo': 'Produto não encontrado'
+            })
+            continue
+        
+        item_plano = {
+            'produto': produto,
+            'nome': produto_nome or produto['nome'],
+            'quantidade': quantidade,
+            'valor_unitario': produto['preco'],
+            'categoria': produto['categoria'],
+            'adicionais': []
+        }
+        plano['valor_total'] += produto['preco'] * quantidade
+        plano['baixas_produtos'][produto['id']] = plano['baixas_produtos'].get(produto['id'], 0) + quantidade
         
-        # Decrementar adicionais
         for adicional_item in item.get('adicionais', []):
-            adicional_nome = adicional_item.get('nome', '').strip()
-            adicional_qtd = adicional_item.get('quantidade', 1)
-            total_adicional = adicional_qtd * quantidade
+            nome_adic = adicional_item.get('nome', '').strip()
+            qtd_total = quantidade_pedido(adicional_item.get('quantidade', 1), nome_adic) * quantidade
             
-            cursor_menu.execute(
-                "UPDATE adicionais SET estoque = estoque - ? WHERE LOWER(nome) = LOWER(?)",
-                (total_adicional, adicional_nome)
-            )
+            adicional = catalogo.adicional(nome_adic)
+            valor_unit = adicional['preco'] if adicional else 0.0
+            
+            item_plano['adicionais'].append({
+                'id': adicional['id'] if adicional else None,
+                'nome': nome_adic,
+                'quantidade': qtd_total,
+                'valor_unitario': valor_unit
+            })
+            plano['valor_total'] += valor_unit * qtd_total
+            
+            if adicional:
+                baixas = plano['baixas_adicionais']
+                baixas[adicional['id']] = baixas.get(adicional['id'], 0) + qtd_total
+            
+            # ✅ AGREGA PARA TODOS OS ITENS
+            por_nome = plano['acompanhamentos'].setdefault(produto['categoria'], {})
+            if nome_adic not in por_nome:
+                por_nome[nome_adic] = {'quantidade': 0, 'valor_unitario': valor_unit}
+            por_nome[nome_adic]['quantidade'] += qtd_total
+        
+        plano['itens'].append(item_plano)
+    
+    # ✅ Estoque conferido pelo total do pedido (o mesmo produto pode vir em vários itens)
+    plano['faltantes'] = nao_encontrados
+    for produto_id, solicitado in plano['baixas_produtos'].items():
+        produto = catalogo.produtos_por_id[produto_id]
+        if produto['estoque'] < solicitado:
+            plano['faltantes'].append({
+                'item': produto['nome'],
+                'disponivel': produto['estoque'],
+                'solicitado': solicitado
+            })
+    for adicional_id, solicitado in plano['baixas_adicionais'].items():
+        adicional = catalogo.adicionais_por_id[adicional_id]
+        if adicional['estoque'] < solicitado:
+            plano['faltantes'].append({
+                'item': adicional['nome'],
+                'disponivel': adicional['estoque'],
+                'solicitado': solicitado
+            })
+    
+    return plano
+
+# Avaliada dentro do INSERT/UPDATE, já com o lock de escrita: não há duas iguais
+PROXIMA_SEQ_ALTERACAO = "(SELECT COALESCE(MAX(seq_alteracao), 0) + 1 FROM pedidos)"
 
-def obter_categoria_produto(cursor_menu, produto_nome):
+def gravar_pedido(cursor_pedidos, plano, cliente_nome, tipo_pedido):
     """
-    Busca a categoria de um produto pelo nome.
+    Grava pedido, itens, adicionais e agregação de acompanhamentos a partir do plano.
+    Retorna o id do pedido. Não faz commit.
     """
-    resultado = cursor_menu.execute("""
-        SELECT c.nome 
-        FROM produtos p
-        JOIN categorias c ON p.categoria_id = c.id
-        WHERE LOWER(p.nome) = LOWER(?)
-    """, (produto_nome,)).fetchone()
+    # Data/hora
+    agora = datetime.now()
+    data_str = agora.strftime('%Y-%m-%d')
+    hora_str = agora.strftime('%H:%M:%S')
+    data_hora_completa = agora.strftime('%Y-%m-%d %H:%M:%S')
+    
+    cursor_pedidos.execute(f'''
+        INSERT INTO pedidos (cliente_nome, tipo_pedido, valor_total, data_hora, status, seq_alteracao)
+        VALUES (?, ?, ?, ?, 'recebido', {PROXIMA_SEQ_ALTERACAO})
+    ''', (cliente_nome, tipo_pedido, plano['valor_total'], data_hora_completa))
+    
+    pedido_id = cursor_pedidos.lastrowid
+    
+    # Insere itens e adicionais
+    for item in plano['itens']:
+        cursor_pedidos.execute('''
+            INSERT INTO itens_pedido (pedido_id, produto_id, produto_nome, quantidade, valor_unitario)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (pedido_id, item['produto']['id'], item['nome'], item['quantidade'], item['valor_unitario']))
+        
+        item_pedido_id = cursor_pedidos.lastrowid
+        
+        if item['adicionais']:
+            cursor_pedidos.executemany('''
+                INSERT INTO adicionais_pedido 
+                (item_pedido_id, adicional_id, adicional_nome, quantidade, valor_unitario)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(item_pedido_id, ad['id'], ad['nome'], ad['quantidade'], ad['valor_unitario'])
+                  for ad in item['adicionais']])
+    
+    # Grava agregação
+    linhas = []
+    for categoria, acompanhamentos in plano['acompanhamentos'].items():
+        for nome_acomp, dados in acompanhamentos.items():
+            qtd = dados['quantidade']
+            valor_unit = dados['valor_unitario']
+            linhas.append((pedido_id, categoria, nome_acomp, qtd, valor_unit,
+                           qtd * valor_unit, data_str, hora_str))
     
-    return resultado['nome'] if resultado else 'Outros'
+    if linhas:
+        cursor_pedidos.executemany('''
+            INSERT INTO acompanhamentos_vendidos 
+            (pedido_id, categoria_produto, nome_acompanhamento, quantidade, 
+             valor_unitario, valor_total, data, hora)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', linhas)
+        atualizar_rollups(cursor_pedidos, linhas)
+    
+    return pedido_id
 
 # ==========================
-# HELPERS DE PREÇO
+# ROLLUPS DE VENDAS
 # ==========================
-def buscar_precos_batch(cursor_menu, nomes_adicionais):
+RELATORIO_AGRUPAMENTOS = ('dia', 'hora', 'categoria')
+
+def atualizar_rollups(cursor, linhas):
     """
-    Busca preços de múltiplos adicionais em uma única query.
-    Retorna dict {nome: preco}
+    Soma as linhas recém-gravadas em acompanhamentos_vendidos nos rollups
+    diário e por hora. Roda na mesma transação do pedido, sem commit.
+    linhas: (pedido_id, categoria, acompanhamento, qtd, valor_unit, valor_total, data, hora)
     """
-    if not nomes_adicionais:
-        return {}
+    cursor.executemany('''
+        INSERT INTO vendas_dia (data, categoria_produto, nome_acompanhamento, quantidade, valor_total)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (data, categoria_produto, nome_acompanhamento) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            valor_total = valor_total + excluded.valor_total
+    ''', [(l[6], l[1], l[2], l[3], l[5]) for l in linhas])
     
-    placeholders = ','.join('?' for _ in nomes_adicionais)
-    query = f"SELECT nome, preco FROM adicionais WHERE LOWER(nome) IN ({','.join(['LOWER(?)'] * len(nomes_adicionais))})"
+    cursor.executemany('''
+        INSERT INTO vendas_hora (data, hora, categoria_produto, nome_acompanhamento, quantidade, valor_total)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (data, hora, categoria_produto, nome_acompanhamento) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            valor_total = valor_total + excluded.valor_total
+    ''', [(l[6], l[7][:2], l[1], l[2], l[3], l[5]) for l in linhas])
+
+def reconstruir_rollups(cursor, desde=None):
+    """
+    Refaz os rollups a partir de acompanhamentos_vendidos (todo o histórico
+    ou só a partir da data 'desde'). Retorna quantas linhas diárias gerou.
+    """
+    filtro = " WHERE data >= ?" if desde else ""
+    params = (desde,) if desde else ()
     
-    resultados = cursor_menu.execute(query, nomes_adicionais).fetchall()
+    cursor.execute(f"DELETE FROM vendas_dia{filtro}", params)
+    cursor.execute(f"DELETE FROM vendas_hora{filtro}", params)
+    cursor.execute(f'''
+        INSERT INTO vendas_dia (data, categoria_produto, nome_acompanhamento, quantidade, valor_total)
+        SELECT data, categoria_produto, nome_acompanhamento, SUM(quantidade), SUM(valor_total)
+        FROM acompanhamentos_vendidos{filtro}
+        GROUP BY data, categoria_produto, nome_acompanhamento
+    ''', params)
+    linhas_dia = cursor.rowcount
+    cursor.execute(f'''
+        INSERT INTO vendas_hora (data, hora, categoria_produto, nome_acompanhamento, quantidade, valor_total)
+        SELECT data, substr(hora, 1, 2), categoria_produto, nome_acompanhamento, SUM(quantidade), SUM(valor_total)
+        FROM acompanhamentos_vendidos{filtro}
+        GROUP BY data, substr(hora, 1, 2), categoria_produto, nome_acompanhamento
+    ''', params)
+    return linhas_dia
+
+def relatorio_agrupado(conn, agrupar, data_inicio=None, data_fim=None, categoria=None):
+    """
+    Relatório de acompanhamentos lido só dos rollups:
+    - dia / hora: uma linha por (período, categoria, acompanhamento)
+    - categoria: totais do intervalo por categoria, com os acompanhamentos dentro
+    """
+    filtros, params = [], []
+    if data_inicio:
+        filtros.append("data >= ?")
+        params.append(data_inicio)
+    if data_fim:
+        filtros.append("data <= ?")
+        params.append(data_fim)
+    if categoria:
+        filtros.append("categoria_produto = ?")
+        params.append(categoria)
+    onde = (" WHERE " + " AND ".join(filtros)) if filtros else ""
     
-    # Case-insensitive dict
-    precos = {}
-    for row in resultados:
-        precos[row['nome'].lower()] = row['preco']
+    if agrupar == 'hora':
+        rows = conn.execute(f'''
+            SELECT data, hora, categoria_produto, nome_acompanhamento, quantidade, valor_total
+            FROM vendas_hora{onde}
+            ORDER BY data DESC, hora DESC, categoria_produto, nome_acompanhamento
+        ''', params).fetchall()
+    elif agrupar == 'dia':
+        rows = conn.execute(f'''
+            SELECT data, categoria_produto, nome_acompanhamento, quantidade, valor_total
+            FROM vendas_dia{onde}
+            ORDER BY data DESC, categoria_produto, nome_acompanhamento
+        ''', params).fetchall()
+    else:
+        rows = conn.execute(f'''
+            SELECT categoria_produto, nome_acompanhamento,
+                   SUM(quantidade) AS quantidade, SUM(valor_total) AS valor_total
+            FROM vendas_dia{onde}
+            GROUP BY categoria_produto, nome_acompanhamento
+            ORDER BY categoria_produto, valor_total DESC
+        ''', params).fetchall()
+        
+        categorias = {}
+        for row in rows:
+            cat = categorias.setdefault(row['categoria_produto'], {
+                'categoria_produto': row['categoria_produto'],
+                'quantidade': 0,
+                'valor_total': 0.0,
+                'acompanhamentos': []
+            })
+            cat['quantidade'] += row['quantidade']
+            cat['valor_total'] += row['valor_total']
+            cat['acompanhamentos'].append({
+                'nome_acompanhamento': row['nome_acompanhamento'],
+                'quantidade': row['quantidade'],
+                'valor_total': round(row['valor_total'], 2)
+            })
+        for cat in categorias.values():
+            cat['valor_total'] = round(cat['valor_total'], 2)
+        return list(categorias.values())
     
-    return precos
+    resultado = []
+    for row in rows:
+        linha = dict(row)
+        linha['valor_total'] = round(linha['valor_total'], 2)
+        resultado.append(linha)
+    return resultado
 
 # ==========================
-# ROTAS PÚBLICAS
+# HELPERS DE ESTOQUE
 # ==========================
-@app.route('/')
-def index():
-    return send_from_directory(app.static_folder, 'index.html')
-
-@app.route('/<path:path>')
-def serve_static(path):
-    return send_from_directory(app.static_folder, path)
+def mensagem_faltantes(faltantes):
+    mensagens = []
+    for f in faltantes:
+        if 'motivo' in f:
+            mensagens.append(f"{f['item']}: {f['motivo']}")
+        else:
+            mensagens.append(
+                f"{f['item']}: disponível {f['disponivel']}, solicitado {f['solicitado']}"
+            )
+    return "; ".join(mensagens)
 
-# ==========================
+def reservar_estoque(cursor_menu, plano, banco=None):
+    """
+    Reserva o estoque do plano sem lock na aplicação, um UPDATE condicional por id:
+        UPDATE ... SET estoque = estoque - ? WHERE id = ? AND estoque >= ?
+    rowcount 0 = outro pedido levou o estoque antes (ou o item saiu do cardápio).
+    Retorna a lista de faltantes (vazia = tudo reservado); com faltantes,
+    quem chama desfaz a transação/savepoint.
+    banco: alias do cardápio quando anexado (ex.: 'menu').
+    """
+    prefixo = f"{banco}." if banco else ''
+    faltantes = []
+    for tabela, baixas in (('produtos', plano['baixas_produtos']), ('adicionais', plano['baixas_adicionais'])):
+        for item_id, qtd in baixas.items():
+            cursor_menu.execute(
+                f"UPDATE {prefixo}{tabela} SET estoque = estoque - ? WHERE id = ? AND estoque >= ?",
+                (qtd, item_id, qtd)
+            )
+            if cursor_menu.rowcount == 1:
+                continue
+            
+            row = cursor_menu.execute(
+                f"SELECT nome, estoque FROM {prefixo}{tabela} WHERE id = ?", (item_id,)
+            ).fetchone()
+            if row is None:
+                faltantes.append({'item': f"{tabela} #{item_id}", 'motivo': 'removido do cardápio'})
+            else:
+                faltantes.append({'item': row['nome'], 'disponivel': row['estoque'], 'solicitado': qtd})
+    return faltantes
+
+def registrar_baixas_pedido(cursor_menu, plano, pedido_id, banco=None):
+    """
+    Diário das baixas de um pedido já reservado (reservar_estoque), na mesma
+    transação: um INSERT ... SELECT por item lê o estoque já baixado, sem
+    consulta extra. motivo 'pedido #id' e pedido_id preenchido.
+    """
+    prefixo = f"{banco}." if banco else ''
+    agora = datetime.now().isoformat(timespec='seconds')
+    motivo = f"pedido #{pedido_id}"
+    for tabela, baixas in (('produtos', plano['baixas_produtos']), ('adicionais', plano['baixas_adicionais'])):
+        cursor_menu.executemany(
+            f'''INSERT INTO {prefixo}movimentos_estoque
+                (tabela, item_id, delta, estoque_anterior, estoque_novo, motivo, pedido_id, criado_em)
+                SELECT ?, id, ?, estoque + ?, estoque, ?, ?, ? FROM {prefixo}{tabela} WHERE id = ?''',
+            [(tabela, -qtd, qtd, motivo, pedido_id, agora, item_id) for item_id, qtd in baixas.items()]
+        )
+
+ESTOQUE_TENTATIVAS = 3  # Tentativas quando o SQLite responde 'database is locked'
+
+def registrar_pedido(conn, plano, cliente_nome, tipo_pedido, banco_menu='menu'):
+    """
+    Reserva o estoque e grava o pedido numa única transação (conexão com o
+    cardápio anexado; ver get_db_pedido sobre o COMMIT em WAL).
+    Retorna (pedido_id, faltantes); com faltantes nada é gravado.
+    - conflito de estoque é definitivo (o UPDATE já viu o valor atual): não retenta
+    - 'database is locked' retenta com backoff até ESTOQUE_TENTATIVAS vezes
+    """
+    for tentativa in range(1, ESTOQUE_TENTATIVAS + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.cursor()
+            
+            # ✅ Reserva primeiro: pedido recusado não chega a gravar nada
+            faltantes = reservar_estoque(cursor, plano, banco_menu)
+            if faltantes:
+                conn.rollback()
+                return None, faltantes
+            
+            pedido_id = gravar_pedido(cursor, plano, cliente_nome, tipo_pedido)
+            registrar_baixas_pedido(cursor, plano, pedido_id, banco_menu)
+            conn.commit()
+            return pedido_id, []
+        except sqlite3.OperationalError as e:
+            conn.rollback()
+            if 'locked' not in str(e) or tentativa == ESTOQUE_TENTATIVAS:
+                raise
+            print(f"⚠️ Banco ocupado, tentativa {tentativa}/{ESTOQUE_TENTATIVAS}")
+            time.sleep(0.05 * tentativa)
+        except Exception:
+            conn.rollback()
+            raise
+
+AJUSTES_MAX = 1000  # Ajustes por requisição
+
+def validar_ajustes(ajustes):
+    """
+    Normaliza [{tabela, id, definir | delta}] para [(tabela, id, 'definir'|'delta', valor)].
+    Lança ValueError com a posição do primeiro ajuste inválido.
+    """
+    if not isinstance(ajustes, list) or not ajustes:
+        raise ValueError("'ajustes' deve ser uma lista não vazia")
+    if len(ajustes) > AJUSTES_MAX:
+        raise ValueError(f"no máximo {AJUSTES_MAX} ajustes por requisição")
+    
+    normalizados = []
+    for posicao, ajuste in enumerate(ajustes):
+        try:
+            tabela = ajuste.get('tabela', 'produtos')
+            if tabela not in ('produtos', 'adicionais'):
+                raise ValueError(f"tabela inválida: {tabela}")
+            modos = [modo for modo in ('definir', 'delta') if modo in ajuste]
+            if len(modos) != 1:
+                raise ValueError("informe 'definir' (absoluto) ou 'delta' (relativo)")
+            valor, item_id = ajuste[modos[0]], ajuste['id']
+            # int() aceitaria 1.9 (→ 1), True (→ 1) e "3"; só inteiros de verdade
+            if type(valor) is not int:
+                raise ValueError(f"'{modos[0]}' deve ser um número inteiro")
+            if type(item_id) is not int:
+                raise ValueError("'id' deve ser um número inteiro")
+            if modos[0] == 'definir' and valor < 0:
+                raise ValueError("estoque não pode ser negativo")
+            normalizados.append((tabela, item_id, modos[0], valor))
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"ajuste {posicao}: {e}")
+    return normalizados
+
+def ajustar_estoque(cursor_menu, ajustes, motivo=None):
+    """
+    Aplica ajustes já validados (validar_ajustes) numa transação aberta pelo
+    chamador (BEGIN IMMEDIATE: os níveis lidos não mudam até o commit).
+    - vários ajustes do mesmo item são aplicados em sequência
+    - um UPDATE por item alterado e uma linha de diário por ajuste, via executemany
+    Retorna (niveis, erros); com erros nada deve ser gravado.
+    """
+    ids = {}
+    for tabela, item_id, _, _ in ajustes:
+        ids.setdefault(tabela, set()).add(item_id)
+    
+    niveis = {}
+    for tabela, conjunto in ids.items():
+        marcadores = ', '.join('?' for _ in conjunto)
+        for row in cursor_menu.execute(
+            f"SELECT id, nome, estoque FROM {tabela} WHERE id IN ({marcadores})", list(conjunto)
+        ):
+            niveis[(tabela, row['id'])] = {'tabela': tabela, 'id': row['id'], 'nome': row['nome'],
+                                           'estoque': row['estoque']}
+    
+    erros, diario = [], []
+    for posicao, (tabela, item_id, modo, valor) in enumerate(ajustes):
+        nivel = niveis.get((tabela, item_id))
+        if nivel is None:
+            erros.append({'ajuste': posicao, 'motivo': f"{tabela} #{item_id} não existe"})
+            continue
+        anterior = nivel['estoque']
+        novo = valor if modo == 'definir' else anterior + valor
+        if novo < 0:
+            erros.append({'ajuste': posicao, 'motivo': f"{nivel['nome']}: estoque ficaria {novo}"})
+            continue
+        nivel['estoque'] = novo
+        diario.append((tabela, item_id, anterior, novo))
+    
+    if erros:
+        return list(niveis.values()), erros
+    
+    for tabela in ids:
+        cursor_menu.executemany(
+            f"UPDATE {tabela} SET estoque = ? WHERE id = ?",
+            [(n['estoque'], n['id']) for n in niveis.values() if n['tabela'] == tabela]
+        )
+    registrar_movimentos(cursor_menu, diario, motivo)
+    return list(niveis.values()), []
+
+def registrar_movimentos(cursor_menu, movimentos, motivo, pedido_id=None, banco=None):
+    """
+    Grava no diário os movimentos [(tabela, item_id, estoque_anterior, estoque_novo)]
+    na transação do chamador.
+    """
+    prefixo = f"{banco}." if banco else ''
+    agora = datetime.now().isoformat(timespec='seconds')
+    cursor_menu.executemany(
+        f'''INSERT INTO {prefixo}movimentos_estoque
+            (tabela, item_id, delta, estoque_anterior, estoque_novo, motivo, pedido_id, criado_em)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        [(tabela, item_id, novo - anterior, anterior, novo, motivo, pedido_id, agora)
+         for tabela, item_id, anterior, novo in movimentos]
+    )
+
+# ==========================
+# RECONCILIAÇÃO PEDIDOS × ESTOQUE
+# ==========================
+RECONCILIACAO_JANELA = 500  # Pedidos mais recentes conferidos a cada inicialização
+
+def _baixas_gravadas(cursor, pedido_id):
+    """
+    Baixas {(tabela, id): quantidade} de um pedido pelos ids do cardápio gravados
+    nos itens. Itens sem id (anteriores à migração) e ids que não existem mais no
+    cardápio ficam de fora.
+    """
+    consultas = (
+        ('produtos', '''SELECT i.produto_id, SUM(i.quantidade) FROM itens_pedido i
+                        JOIN menu.produtos p ON p.id = i.produto_id
+                        WHERE i.pedido_id = ? GROUP BY i.produto_id'''),
+        ('adicionais', '''SELECT a.adicional_id, SUM(a.quantidade) FROM adicionais_pedido a
+                          JOIN itens_pedido i ON i.id = a.item_pedido_id
+                          JOIN menu.adicionais m ON m.id = a.adicional_id
+                          WHERE i.pedido_id = ? GROUP BY a.adicional_id'''),
+    )
+    return {(tabela, item_id): quantidade
+            for tabela, sql in consultas
+            for item_id, quantidade in cursor.execute(sql, (pedido_id,)).fetchall()}
+
+def _corrigir_estoque(cursor, correcoes, motivo, pedido_id):
+    """
+    Aplica {(tabela, id): delta} no cardápio anexado (sem ficar negativo) e
+    registra no diário com o pedido_id.
+    """
+    movimentos = []
+    for (tabela, item_id), delta in correcoes.items():
+        row = cursor.execute(f"SELECT estoque FROM menu.{tabela} WHERE id = ?", (item_id,)).fetchone()
+        if row is None:
+            continue
+        novo = max(row['estoque'] + delta, 0)
+        cursor.execute(f"UPDATE menu.{tabela} SET estoque = ? WHERE id = ?", (novo, item_id))
+        movimentos.append((tabela, item_id, row['estoque'], novo))
+    registrar_movimentos(cursor, movimentos, motivo, pedido_id, 'menu')
+
+def reconciliar_estoque_pedidos(janela=RECONCILIACAO_JANELA):
+    """
+    Conserta pedidos gravados pela metade. Em WAL, o COMMIT de uma conexão com
+    ATTACH é atômico em cada arquivo, mas não entre os dois: se o processo
+    morre no meio do COMMIT, pedidos.db pode ficar gravado sem a baixa no
+    cardápio (o SQLite grava o banco principal primeiro) ou, em tese, o
+    contrário. Compara os pedidos mais recentes com o diário de estoque:
+    - pedido sem nenhuma baixa no diário: aplica a baixa pelos itens gravados
+    - baixa no diário de um pedido que não existe: estorna
+    As correções entram no diário com o pedido_id e todo pedido conferido vai
+    para pedidos_reconciliados (mesmo sem nada a baixar, quando os itens não
+    estão mais no cardápio), então rodar de novo não repete nada. Roda na
+    inicialização, sob BEGIN IMMEDIATE nos dois bancos.
+    Retorna {'baixas_aplicadas': [ids], 'nao_resolvidos': [ids], 'estornos': [ids]}.
+    """
+    resultado = {'baixas_aplicadas': [], 'nao_resolvidos': [], 'estornos': []}
+    conn = get_db_pedido()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        # Pedidos anteriores ao diário (migração 6) não têm baixas registradas
+        inicio_diario = cursor.execute("SELECT MIN(pedido_id) FROM menu.movimentos_estoque").fetchone()[0]
+        if inicio_diario is None:
+            conn.rollback()
+            return resultado
+        ultimo = cursor.execute("SELECT MAX(id) FROM pedidos").fetchone()[0] or 0
+        desde = max(inicio_diario, ultimo - janela)
+        
+        sem_baixa = [row[0] for row in cursor.execute('''
+            SELECT p.id FROM pedidos p
+            WHERE p.id > ? AND NOT EXISTS (
+                SELECT 1 FROM menu.movimentos_estoque m WHERE m.pedido_id = p.id
+            ) AND NOT EXISTS (
+                SELECT 1 FROM pedidos_reconciliados r WHERE r.pedido_id = p.id
+            ) ORDER BY p.id
+        ''', (desde,)).fetchall()]
+        agora = datetime.now().isoformat(timespec='seconds')
+        for pedido_id in sem_baixa:
+            baixas = _baixas_gravadas(cursor, pedido_id)
+            if baixas:
+                _corrigir_estoque(cursor, {chave: -qtd for chave, qtd in baixas.items()},
+                                  f"reconciliação: pedido #{pedido_id}", pedido_id)
+                motivo, lista = 'baixa aplicada', 'baixas_aplicadas'
+            else:
+                motivo, lista = 'itens fora do cardápio', 'nao_resolvidos'
+            cursor.execute("INSERT INTO pedidos_reconciliados (pedido_id, motivo, criado_em) VALUES (?, ?, ?)",
+                           (pedido_id, motivo, agora))
+            resultado[lista].append(pedido_id)
+        
+        orfas = {}
+        for row in cursor.execute('''
+            SELECT m.pedido_id, m.tabela, m.item_id, SUM(m.delta) AS soma
+            FROM menu.movimentos_estoque m
+            WHERE m.pedido_id > ? AND NOT EXISTS (SELECT 1 FROM pedidos p WHERE p.id = m.pedido_id)
+            GROUP BY m.pedido_id, m.tabela, m.item_id
+            HAVING SUM(m.delta) <> 0
+        ''', (desde,)).fetchall():
+            orfas.setdefault(row['pedido_id'], {})[(row['tabela'], row['item_id'])] = -row['soma']
+        for pedido_id, correcoes in sorted(orfas.items()):
+            _corrigir_estoque(cursor, correcoes, f"estorno: pedido #{pedido_id} não gravado", pedido_id)
+            resultado['estornos'].append(pedido_id)
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    if any(resultado.values()):
+        print(f"⚠️ Reconciliação de estoque: baixas aplicadas {resultado['baixas_aplicadas']}, "
+              f"itens fora do cardápio {resultado['nao_resolvidos']}, estornos {resultado['estornos']}")
+    return resultado
+
+# ==========================
+# FILA DE GRAVAÇÃO (WRITE-BEHIND)
+# ==========================
+GRAVADOR_ATIVO = os.environ.get('PEDIDOS_WRITE_BEHIND', '0') == '1'
+GRAVADOR_FILA_MAX = int(os.environ.get('GRAVADOR_FILA_MAX', '256'))  # Acima disso responde 503
+GRAVADOR_LOTE_MAX = 64  # Pedidos por group commit
+GRAVADOR_JANELA = 0.002  # Segundos esperando mais pedidos antes de gravar o lote
+GRAVADOR_TIMEOUT = 10.0  # Mesmo limite do timeout do get_db
+GRAVADOR_TIMEOUT_GRAVACAO = 60.0  # Último recurso para quem já está no lote em gravação
+GRAVADOR_PAUSA_FALHA = 1.0  # Segundos antes de reabrir a conexão depois de uma falha
+
+class SolicitacaoPedido:
+    """
+    Um pedido esperando a thread gravadora. O handler HTTP bloqueia em
+    `pronto` até o lote dele ser commitado (ou rejeitado).
+    """
+    def __init__(self, plano, cliente_nome, tipo_pedido):
+        self.plano = plano
+        self.cliente_nome = cliente_nome
+        self.tipo_pedido = tipo_pedido
+        self.enfileirado_em = time.perf_counter()
+        self.pronto = Event()
+        self.lock = Lock()
+        self.cancelada = False
+        self.em_gravacao = False
+        self.pedido_id = None
+        self.faltantes = None
+        self.erro = None
+        self.codigo = 200
+
+class GravadorPedidos:
+    """
+    Ingestão write-behind: uma única thread é dona das conexões de escrita.
+    - junta até GRAVADOR_LOTE_MAX pedidos e grava todos em UMA transação
+      (pedidos.db com o cardápio anexado, BEGIN IMMEDIATE + SAVEPOINT por pedido)
+    - o estoque é reservado com UPDATE condicional dentro da transação, então
+      pedidos do mesmo lote não vendem a mesma unidade duas vezes
+    - o handler recebe o id só depois do commit (synchronous=FULL)
+    - fila cheia ou espera longa viram 503, em vez de travar no lock do SQLite
+    - qualquer falha na thread responde o lote em andamento e reabre a
+      conexão; se a thread morrer mesmo assim, o próximo gravar() a recria
+    """
+    def __init__(self, ativo=False):
+        self.ativo = ativo
+        self._fila = queue.Queue(maxsize=GRAVADOR_FILA_MAX)
+        self._thread = None
+        self._lock = Lock()
+        self._latencias_commit = deque(maxlen=512)
+        self._ultima_falha = None
+        self._stats = {
+            'lotes': 0,
+            'pedidos': 0,
+            'rejeitados': 0,
+            'erros': 0,
+            'recusados_fila_cheia': 0,
+            'lote_max': 0,
+            'espera_fila_total_ms': 0.0,
+            'falhas': 0,
+            'reinicios': 0
+        }
+    
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._thread is not None:
+                self._stats['reinicios'] += 1
+                print("⚠️ Thread gravadora tinha parado: reiniciando")
+            self._thread = Thread(target=self._executar, daemon=True, name='gravador-pedidos')
+            self._thread.start()
+    
+    def gravar(self, plano, cliente_nome, tipo_pedido):
+        """
+        Enfileira e espera o commit. Devolve a SolicitacaoPedido preenchida.
+        """
+        self._iniciar()
+        s = SolicitacaoPedido(plano, cliente_nome, tipo_pedido)
+        try:
+            self._fila.put_nowait(s)
+        except queue.Full:
+            with self._lock:
+                self._stats['recusados_fila_cheia'] += 1
+            s.erro, s.codigo = 'Muitos pedidos ao mesmo tempo, tente novamente', 503
+            return s
+        
+        if not s.pronto.wait(GRAVADOR_TIMEOUT):
+            with s.lock:
+                if not s.em_gravacao:
+                    # Ainda na fila: desiste com segurança, o gravador vai pular
+                    s.cancelada = True
+                    s.erro, s.codigo = 'Fila de pedidos congestionada, tente novamente', 503
+                    return s
+            # Já está no lote em gravação: o resultado sai em instantes
+            if not s.pronto.wait(GRAVADOR_TIMEOUT_GRAVACAO):
+                # Não dá para saber se o commit aconteceu: não pedir para repetir às cegas
+                s.erro, s.codigo = 'Pedido sem confirmação; confira no painel antes de repetir', 504
+        return s
+    
+    def _proximo_lote(self):
+        lote = [self._fila.get()]
+        limite = time.perf_counter() + GRAVADOR_JANELA
+        while len(lote) < GRAVADOR_LOTE_MAX:
+            restante = limite - time.perf_counter()
+            try:
+                lote.append(self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+    
+    def _abrir(self):
+        conn = abrir_conexao(PEDIDOS_DB_PATH, timeout=30.0, anexos=ANEXOS_PEDIDO)
+        conn.execute("PRAGMA main.synchronous = FULL")
+        conn.execute("PRAGMA menu.synchronous = FULL")
+        return conn
+    
+    def _executar(self):
+        conn = None
+        while True:
+            lote = []
+            try:
+                for s in self._proximo_lote():
+                    with s.lock:
+                        if s.cancelada:
+                            continue
+                        s.em_gravacao = True
+                    lote.append(s)
+                
+                if lote:
+                    # Abre depois de pegar o lote: se falhar, quem espera recebe o erro
+                    if conn is None:
+                        conn = self._abrir()
+                    self._gravar_isolando(conn, lote)
+            except Exception as e:
+                # ✅ Catch-all: nenhuma solicitação fica esperando uma thread que falhou
+                with self._lock:
+                    self._stats['falhas'] += 1
+                    self._ultima_falha = f"{datetime.now().isoformat(timespec='seconds')} {e}"
+                print(f"❌ Falha na thread gravadora: {e}")
+                for s in lote:
+                    if s.pedido_id is None and s.codigo == 200:
+                        s.erro, s.codigo = f'Erro ao processar pedido: {e}', 500
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except sqlite3.Error:
+                        pass
+                    conn = None
+                time.sleep(GRAVADOR_PAUSA_FALHA)
+            finally:
+                for s in lote:
+                    s.pronto.set()
+            
+            for s in lote:
+                if s.pedido_id is not None:
+                    try:
+                        publicar_evento_pedido(s.pedido_id, 'criado')
+                        publicar_consumo_estoque(s.plano)
+                    except Exception as e:
+                        print(f"⚠️ Erro ao publicar pedido #{s.pedido_id}: {e}")
+    
+    def _gravar_isolando(self, conn, lote):
+        try:
+            self._gravar_lote(conn, lote)
+        except Exception as e:
+            print(f"❌ Erro no lote de {len(lote)} pedidos: {e}")
+            if len(lote) > 1:
+                # Isola o problema: regrava um por um
+                for s in lote:
+                    try:
+                        self._gravar_lote(conn, [s])
+                    except Exception as e_unico:
+                        s.erro, s.codigo = f'Erro ao processar pedido: {e_unico}', 500
+            else:
+                lote[0].erro, lote[0].codigo = f'Erro ao processar pedido: {e}', 500
+    
+    def _gravar_lote(self, conn, lote):
+        inicio = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.cursor()
+            gravados = []
+            for s in lote:
+                s.pedido_id, s.faltantes, s.erro, s.codigo = None, None, None, 200
+                cursor.execute("SAVEPOINT pedido")
+                try:
+                    faltantes = reservar_estoque(cursor, s.plano, 'menu')
+                    if faltantes:
+                        cursor.execute("ROLLBACK TO pedido")
+                        s.faltantes, s.codigo = faltantes, 409
+                        continue
+                    pedido_id = gravar_pedido(cursor, s.plano, s.cliente_nome, s.tipo_pedido)
+                    registrar_baixas_pedido(cursor, s.plano, pedido_id, 'menu')
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO pedido")
+                    s.erro, s.codigo = f'Erro ao processar pedido: {e}', 500
+                else:
+                    gravados.append((s, pedido_id))
+                finally:
+                    cursor.execute("RELEASE pedido")
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        agora = time.perf_counter()
+        for s, pedido_id in gravados:
+            s.pedido_id = pedido_id
+            print(f"✅ Pedido #{pedido_id} criado: {s.cliente_nome}, R$ {s.plano['valor_total']:.2f}")
+        
+        with self._lock:
+            self._latencias_commit.append((agora - inicio) * 1000)
+            self._stats['lotes'] += 1
+            self._stats['pedidos'] += len(gravados)
+            self._stats['rejeitados'] += sum(1 for s in lote if s.faltantes)
+            self._stats['erros'] += sum(1 for s in lote if s.erro)
+            self._stats['lote_max'] = max(self._stats['lote_max'], len(lote))
+            self._stats['espera_fila_total_ms'] += sum((inicio - s.enfileirado_em) * 1000 for s in lote)
+    
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            latencias = sorted(self._latencias_commit)
+        stats['ativo'] = self.ativo
+        stats['thread_viva'] = self._thread is not None and self._thread.is_alive()
+        stats['ultima_falha'] = self._ultima_falha
+        stats['fila'] = self._fila.qsize()
+        stats['fila_max'] = GRAVADOR_FILA_MAX
+        atendidos = stats['pedidos'] + stats['rejeitados'] + stats['erros']
+        stats['lote_medio'] = round(atendidos / stats['lotes'], 2) if stats['lotes'] else 0.0
+        stats['espera_fila_media_ms'] = round(stats.pop('espera_fila_total_ms') / atendidos, 3) if atendidos else 0.0
+        stats['commit_ms'] = {
+            'ultimo': round(self._latencias_commit[-1], 3) if latencias else None,
+            'medio': round(sum(latencias) / len(latencias), 3) if latencias else None,
+            'p95': round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))], 3) if latencias else None,
+            'max': round(latencias[-1], 3) if latencias else None
+        }
+        return stats
+
+gravador_pedidos = GravadorPedidos(ativo=GRAVADOR_ATIVO)
+
+# ==========================
+# HELPERS DE PEDIDOS
+# ==========================
+SQLITE_MAX_PARAMS = 500  # Lote de ids por cláusula IN (...)
+
+def _buscar_por_ids(conn, query, ids):
+    """
+    Executa `query` (com {placeholders}) em lotes de ids.
+    """
+    linhas = []
+    for i in range(0, len(ids), SQLITE_MAX_PARAMS):
+        lote = ids[i:i + SQLITE_MAX_PARAMS]
+        placeholders = ','.join('?' for _ in lote)
+        linhas.extend(conn.execute(query.format(placeholders=placeholders), lote).fetchall())
+    return linhas
+
+def hidratar_pedidos(conn, pedidos_rows, modo_publico=False, campos=None):
+    """
+    Monta a lista de pedidos com itens e adicionais aninhados.
+    Usa um número fixo de queries (em lotes de ids), não uma por pedido/item.
+    campos: projeção (set) ou None para todos; sem 'itens' nem consulta os itens.
+    """
+    pedido_ids = [p['id'] for p in pedidos_rows]
+    if not pedido_ids:
+        return []
+    
+    incluir_itens = campos is None or 'itens' in campos
+    itens_rows = adicionais_rows = []
+    if incluir_itens:
+        itens_rows = _buscar_por_ids(
+            conn,
+            "SELECT * FROM itens_pedido WHERE pedido_id IN ({placeholders}) ORDER BY id",
+            pedido_ids
+        )
+        adicionais_rows = _buscar_por_ids(
+            conn,
+            "SELECT * FROM adicionais_pedido WHERE item_pedido_id IN ({placeholders}) ORDER BY id",
+            [item['id'] for item in itens_rows]
+        )
+    
+    adicionais_por_item = {}
+    for ad in adicionais_rows:
+        adicionais_por_item.setdefault(ad['item_pedido_id'], []).append(dict(ad))
+    
+    itens_por_pedido = {}
+    for item in itens_rows:
+        item_dict = dict(item)
+        item_dict['adicionais'] = adicionais_por_item.get(item['id'], [])
+        itens_por_pedido.setdefault(item['pedido_id'], []).append(item_dict)
+    
+    lista_pedidos = []
+    for pedido in pedidos_rows:
+        pedido_dict = {
+            'id': pedido['id'],
+            'tipo_pedido': pedido['tipo_pedido'],
+            'status': pedido['status'],
+            'valor_total': pedido['valor_total'],
+            'data_hora': pedido['data_hora'],
+            'seq_alteracao': pedido['seq_alteracao'],
+            'itens': itens_por_pedido.get(pedido['id'], [])
+        }
+        
+        # ✅ Omite cliente_nome em modo público
+        if not modo_publico:
+            pedido_dict['cliente_nome'] = pedido['cliente_nome']
+        
+        if campos is not None:
+            pedido_dict = {k: v for k, v in pedido_dict.items() if k in campos or k == 'id'}
+        
+        lista_pedidos.append(pedido_dict)
+    
+    return lista_pedidos
+
+STATUS_VALIDOS = ['recebido', 'pronto', 'retirado']
+
+def filtro_status(args, padrao='recebido'):
+    """
+    Lê ?status=a,b da query string, ignorando valores inválidos.
+    """
+    status_filter = args.get('status', padrao).split(',')
+    status_filter = [s.strip() for s in status_filter if s.strip() in STATUS_VALIDOS]
+    return status_filter or [padrao]
+
+CAMPOS_PEDIDO = ['id', 'tipo_pedido', 'status', 'valor_total', 'data_hora', 'seq_alteracao', 'cliente_nome', 'itens']
+PEDIDOS_LIMITE_MAX = 500
+
+def filtro_campos(args):
+    """
+    Lê ?fields=a,b (projeção), ignorando campos inválidos.
+    None = todos os campos. 'id' sempre vem (é o cursor da paginação).
+    """
+    if not args.get('fields'):
+        return None
+    campos = {c.strip() for c in args['fields'].split(',') if c.strip() in CAMPOS_PEDIDO}
+    return campos or None
+
+def listar_pedidos(conn, status_filter, modo_publico=False, limite=None, after_id=None, campos=None):
+    """
+    Lista por id crescente. Com after_id/limite vira paginação keyset:
+    a próxima página começa depois do último id recebido.
+    """
+    placeholders = ','.join('?' for _ in status_filter)
+    query = f"SELECT * FROM pedidos WHERE status IN ({placeholders})"
+    params = list(status_filter)
+    if after_id is not None:
+        query += " AND id > ?"
+        params.append(after_id)
+    query += " ORDER BY id ASC"
+    if limite is not None:
+        query += " LIMIT ?"
+        params.append(limite)
+    pedidos_rows = conn.execute(query, params).fetchall()
+    
+    # ✅ Itens e adicionais em lote (sem N+1)
+    return hidratar_pedidos(conn, pedidos_rows, modo_publico, campos)
+
+def listar_alteracoes(conn, status_filter, modo_publico=False, since_id=None, updated_since=None, campos=None):
+    """
+    Modo delta do GET /api/pedidos.
+    - since_id: pedidos com id maior (novos)
+    - updated_since: pedidos com seq_alteracao maior (novos ou alterados);
+      os que saíram dos status pedidos vão em 'removidos'
+    O cursor é lido antes das linhas: no pior caso o cliente recebe uma
+    alteração duas vezes, nunca perde uma.
+    """
+    cursor = conn.execute(
+        "SELECT COALESCE(MAX(seq_alteracao), 0) AS seq, COALESCE(MAX(id), 0) AS id FROM pedidos"
+    ).fetchone()
+    
+    if updated_since is not None:
+        # Percorre o índice de seq_alteracao; a ordem por id é feita aqui (lista pequena)
+        alterados = sorted(conn.execute(
+            "SELECT * FROM pedidos WHERE seq_alteracao > ? ORDER BY seq_alteracao", (updated_since,)
+        ).fetchall(), key=lambda p: p['id'])
+    else:
+        alterados = conn.execute(
+            "SELECT * FROM pedidos WHERE id > ? ORDER BY id ASC", (since_id,)
+        ).fetchall()
+    
+    pedidos_rows = [p for p in alterados if p['status'] in status_filter]
+    return {
+        'pedidos': hidratar_pedidos(conn, pedidos_rows, modo_publico, campos),
+        'removidos': [p['id'] for p in alterados if p['status'] not in status_filter],
+        'cursor': {'seq': cursor['seq'], 'id': cursor['id']}
+    }
+
+def carregar_pedido(conn, pedido_id):
+    pedidos_rows = conn.execute("SELECT * FROM pedidos WHERE id = ?", (pedido_id,)).fetchall()
+    pedidos = hidratar_pedidos(conn, pedidos_rows)
+    return pedidos[0] if pedidos else None
+
+# ==========================
+# BARRAMENTO DE EVENTOS (PUB/SUB)
+# ==========================
+# Classes e transporte em barramento.py; aqui a instância do processo
+barramento = BarramentoEventos(origem=f"{BOOT_ID}-{os.getpid()}")
+
+def iniciar_transporte_barramento():
+    """
+    Liga o transporte entre processos se BARRAMENTO_ENDERECO estiver definido.
+    Sem BARRAMENTO_TOKEN a inicialização falha: o socket não fica aberto sem senha.
+    """
+    if not BARRAMENTO_ENDERECO or barramento.transporte is not None:
+        return
+    if not BARRAMENTO_TOKEN:
+        raise RuntimeError("BARRAMENTO_ENDERECO definido sem BARRAMENTO_TOKEN: defina um token secreto "
+                           "(ex.: python -c \"import secrets; print(secrets.token_hex(16))\")")
+    TransporteBarramento(barramento, BARRAMENTO_ENDERECO, BARRAMENTO_TOKEN).iniciar()
+
+# ==========================
+# HUB DE EVENTOS DE PEDIDOS (SSE / LONG-POLLING)
+# ==========================
+# Classes em hub.py; aqui a instância do processo, ligada ao barramento
+hub_pedidos = HubPedidos(f"{BOOT_ID}{os.getpid():x}")
+
+_hub_descartes = {'vistos': 0}
+
+def _repassar_para_hub(evento):
+    # Fila do hub no barramento transbordou: sem ressincronizar, as telas ficariam com buracos
+    descartados = assinatura_hub.estatisticas()['descartados']
+    if descartados > _hub_descartes['vistos']:
+        _hub_descartes['vistos'] = descartados
+        print(f"⚠️ Hub perdeu eventos do barramento ({descartados} descartados) - telas voltam por snapshot")
+        hub_pedidos.ressincronizar()
+    
+    tipo = 'criado' if evento['topico'] == 'pedido.criado' else 'status'
+    hub_pedidos.publicar(tipo, evento['pedido'], evento.get('status_anterior'))
+
+# ✅ As telas SSE/long-poll são só mais um assinante do barramento
+assinatura_hub = barramento.assinar('hub-sse', ['pedido.*'], politica='descartar_antigo',
+                                    tamanho=HUB_HISTORICO, callback=_repassar_para_hub)
+
+def _carregar_evento_pedido(dados):
+    conn = get_db(PEDIDOS_DB_PATH)
+    try:
+        pedido = carregar_pedido(conn, dados['pedido_id'])
+    finally:
+        conn.close()
+    if pedido is None:
+        return None
+    return dict(dados, pedido=pedido)
+
+def publicar_evento_pedido(pedido_id, tipo, status_anterior=None, status=None):
+    """
+    Publica no barramento sem bloquear: o pedido é carregado na thread de
+    despacho, fora da requisição. Falha aqui nunca afeta o pedido.
+    Tópicos: pedido.criado ou pedido.<novo status>.
+    """
+    topico = 'pedido.criado' if tipo == 'criado' else f'pedido.{status}'
+    dados = {'pedido_id': pedido_id, 'chave': pedido_id, 'status_anterior': status_anterior}
+    if not barramento.publicar(topico, dados, preparar=_carregar_evento_pedido):
+        print(f"⚠️ Barramento cheio: evento {topico} do pedido #{pedido_id} descartado")
+
+# ==========================
+# PROJEÇÃO DE ESTOQUE (ALERTAS)
+# ==========================
+PROJECAO_JANELA_MIN = int(os.environ.get('ESTOQUE_JANELA_MIN', '60'))  # Janela deslizante de consumo
+PROJECAO_BALDE_S = 60  # Granularidade da janela
+PROJECAO_ALERTA_MIN = int(os.environ.get('ESTOQUE_ALERTA_MIN', '60'))  # Alerta se acabar antes disso
+PROJECAO_ESTOQUE_MINIMO = int(os.environ.get('ESTOQUE_MINIMO', '5'))  # Alerta abaixo disso, mesmo sem consumo
+PROJECAO_INTERVALO = 15  # Segundos entre verificações do monitor
+PROJECAO_OBSERVACAO_MIN = int(os.environ.get('ESTOQUE_OBSERVACAO_MIN', '10'))  # Minutos observando antes de prever pelo consumo
+PROJECAO_AMOSTRAS_MIN = 3  # Pedidos com o item na janela antes de prever pelo consumo
+PROJECAO_WORKERS = int(os.environ.get('WEB_WORKERS', '1'))  # Processos do gunicorn (gunicorn.conf.py)
+
+class JanelaConsumo:
+    """
+    Soma deslizante do consumo de um item: baldes de PROJECAO_BALDE_S
+    segundos; o total e o número de pedidos (amostras) são mantidos a cada
+    entrada/expiração, sem recontar.
+    """
+    __slots__ = ('baldes', 'total', 'amostras')
+    
+    def __init__(self):
+        self.baldes = deque()
+        self.total = 0
+        self.amostras = 0
+    
+    def adicionar(self, agora, quantidade):
+        balde = int(agora // PROJECAO_BALDE_S)
+        if self.baldes and self.baldes[-1][0] == balde:
+            self.baldes[-1][1] += quantidade
+            self.baldes[-1][2] += 1
+        else:
+            self.baldes.append([balde, quantidade, 1])
+        self.total += quantidade
+        self.amostras += 1
+    
+    def expirar(self, agora):
+        limite = int(agora // PROJECAO_BALDE_S) - PROJECAO_JANELA_MIN * 60 // PROJECAO_BALDE_S
+        while self.baldes and self.baldes[0][0] <= limite:
+            _, quantidade, amostras = self.baldes.popleft()
+            self.total -= quantidade
+            self.amostras -= amostras
+        return self.total, self.amostras
+
+class ProjecaoEstoque:
+    """
+    Velocidade de consumo de cada produto/adicional e previsão de quando acaba.
+    - alimentada pelo evento estoque.consumo que o caminho do pedido publica
+      (com o transporte do barramento, recebe o consumo de todos os workers)
+    - estado só em memória: nunca relê itens_pedido/adicionais_pedido; após
+      reiniciar, a janela volta a encher com os pedidos novos
+    - previsão pelo consumo só depois de PROJECAO_OBSERVACAO_MIN minutos
+      observados e PROJECAO_AMOSTRAS_MIN pedidos do item: logo após reiniciar,
+      dois pedidos seguidos não viram "acaba em 5 minutos"
+    - o monitor (um processo só, ver create_app) publica estoque.alerta e
+      estoque.normalizado no barramento; todo processo guarda os alertas
+      recebidos para o painel admin (/api/estoque/alertas/stream)
+    """
+    def __init__(self):
+        self._janelas = {}
+        self._alertas = {}
+        self._recebidos = {}
+        self._lock = Lock()
+        self._inicio = time.time()
+        self._monitor = None
+        self.monitor_recusado = None
+    
+    def registrar(self, consumo, agora=None):
+        """
+        consumo: {'produtos': [[id, qtd], ...], 'adicionais': [[id, qtd], ...]}
+        """
+        agora = agora or time.time()
+        with self._lock:
+            for tabela in ('produtos', 'adicionais'):
+                for item_id, quantidade in consumo.get(tabela, ()):
+                    janela = self._janelas.get((tabela, item_id))
+                    if janela is None:
+                        janela = self._janelas[(tabela, item_id)] = JanelaConsumo()
+                    janela.adicionar(agora, quantidade)
+    
+    def projetar(self, agora=None):
+        """
+        Itens com consumo na janela ou estoque abaixo do mínimo, com taxa,
+        minutos até acabar e nível de alerta ('esgotado', 'baixo' ou None).
+        """
+        agora = agora or time.time()
+        # Logo após iniciar, a janela ainda não está cheia: divide pelo tempo
+        # decorrido, mas nunca menos que o mínimo de observação
+        observado = min(PROJECAO_JANELA_MIN, (agora - self._inicio) / 60)
+        minutos = max(observado, PROJECAO_OBSERVACAO_MIN, 1)
+        with self._lock:
+            consumo = {chave: janela.expirar(agora) for chave, janela in self._janelas.items()}
+            for chave in [c for c, (total, _) in consumo.items() if total == 0]:
+                del self._janelas[chave]
+        
+        snapshot = catalogo_menu.obter()
+        itens = []
+        for tabela, por_id in (('produtos', snapshot.produtos_por_id), ('adicionais', snapshot.adicionais_por_id)):
+            for item_id, item in por_id.items():
+                estoque = item['estoque']
+                total, amostras = consumo.get((tabela, item_id), (0, 0))
+                if estoque is None or (not total and estoque > PROJECAO_ESTOQUE_MINIMO):
+                    continue
+                
+                taxa = total / minutos  # unidades por minuto
+                confiavel = observado >= PROJECAO_OBSERVACAO_MIN and amostras >= PROJECAO_AMOSTRAS_MIN
+                restantes = round(estoque / taxa, 1) if taxa and confiavel else None
+                if estoque <= 0:
+                    alerta = 'esgotado'
+                elif estoque <= PROJECAO_ESTOQUE_MINIMO or (restantes is not None and restantes <= PROJECAO_ALERTA_MIN):
+                    alerta = 'baixo'
+                else:
+                    alerta = None
+                
+                itens.append({
+                    'tabela': tabela,
+                    'id': item_id,
+                    'nome': item['nome'],
+                    'estoque': estoque,
+                    'consumo_janela': total,
+                    'amostras': amostras,
+                    'por_hora': round(taxa * 60, 1),
+                    'minutos_restantes': restantes,
+                    'previsao_esgotar': (datetime.fromtimestamp(agora) + timedelta(minutes=restantes)).isoformat(timespec='minutes')
+                                        if restantes is not None else None,
+                    'alerta': alerta,
+                })
+        itens.sort(key=lambda i: (i['minutos_restantes'] is None, i['minutos_restantes'] or 0, i['estoque']))
+        return itens
+    
+    def verificar(self):
+        """
+        Publica estoque.alerta quando um item entra em alerta (ou piora) e
+        estoque.normalizado quando sai (reposição).
+        """
+        ativos = {}
+        for item in self.projetar():
+            if item['alerta']:
+                ativos[(item['tabela'], item['id'])] = item
+        
+        for chave, item in ativos.items():
+            anterior = self._alertas.get(chave)
+            if anterior is None or anterior['alerta'] != item['alerta']:
+                restante = f", acaba em ~{item['minutos_restantes']:.0f} min" if item['minutos_restantes'] is not None else ''
+                print(f"⚠️ Estoque {item['alerta']}: {item['nome']} ({item['estoque']} un.{restante})")
+                barramento.publicar('estoque.alerta', dict(item, chave=f"{chave[0]}:{chave[1]}"))
+        for chave, item in self._alertas.items():
+            if chave not in ativos:
+                barramento.publicar('estoque.normalizado', {'tabela': chave[0], 'id': chave[1],
+                                                            'nome': item['nome'], 'chave': f"{chave[0]}:{chave[1]}"})
+        self._alertas = ativos
+    
+    def receber_alerta(self, evento):
+        """
+        Assinante de estoque.alerta / estoque.normalizado: mantém os alertas
+        ativos mesmo no worker que não roda o monitor.
+        """
+        with self._lock:
+            if evento['topico'] == 'estoque.alerta':
+                self._recebidos[evento['chave']] = evento
+            else:
+                self._recebidos.pop(evento['chave'], None)
+    
+    def alertas(self):
+        with self._lock:
+            return list(self._recebidos.values())
+    
+    def iniciar_monitor(self):
+        """
+        Liga a verificação periódica. Com vários workers e sem transporte do
+        barramento, cada processo só veria o próprio consumo: o monitor se
+        recusa a subir em vez de prever com uma fração dos pedidos.
+        """
+        if self._monitor is not None:
+            return True
+        if PROJECAO_WORKERS > 1 and not BARRAMENTO_ENDERECO:
+            self.monitor_recusado = (f"WEB_WORKERS={PROJECAO_WORKERS} sem BARRAMENTO_ENDERECO: "
+                                     "o consumo dos outros workers não chega a este processo")
+            print('=' * 50)
+            print(f"❌ ALERTAS DE ESTOQUE DESLIGADOS: {self.monitor_recusado}")
+            print("❌ Defina BARRAMENTO_ENDERECO e BARRAMENTO_TOKEN (ver gunicorn.conf.py)")
+            print('=' * 50)
+            return False
+        
+        def monitorar():
+            while True:
+                time.sleep(PROJECAO_INTERVALO)
+                try:
+                    self.verificar()
+                except Exception as e:
+                    print(f"⚠️ Erro na projeção de estoque: {e}")
+        
+        self._monitor = Thread(target=monitorar, daemon=True, name='projecao-estoque')
+        self._monitor.start()
+        return True
+
+projecao_estoque = ProjecaoEstoque()
+
+barramento.assinar('projecao-estoque', ['estoque.consumo'], politica='descartar_antigo',
+                   tamanho=BARRAMENTO_ENTRADA_MAX, callback=projecao_estoque.registrar)
+barramento.assinar('alertas-estoque', ['estoque.alerta', 'estoque.normalizado'], politica='coalescer',
+                   callback=projecao_estoque.receber_alerta)
+
+def publicar_consumo_estoque(plano):
+    """
+    Baixas do pedido gravado, para a projeção de estoque. Não bloqueia.
+    (Listas [id, qtd]: o evento atravessa processos como JSON.)
+    """
+    barramento.publicar('estoque.consumo', {
+        'produtos': [[item_id, qtd] for item_id, qtd in plano['baixas_produtos'].items()],
+        'adicionais': [[item_id, qtd] for item_id, qtd in plano['baixas_adicionais'].items()],
+    })
+
+# ==========================
+# OTIMIZAÇÃO DE IMAGENS
+# ==========================
+IMAGENS_OTIMIZADAS_FOLDER = os.path.join(UPLOAD_FOLDER, 'otimizadas')
+IMAGENS_VARIANTES = {'thumb': 160, 'card': 480, 'full': 1280}  # Lado maior em px
+IMAGENS_FORMATOS = {'webp': {'quality': 80, 'method': 4}, 'jpeg': {'quality': 82, 'optimize': True, 'progressive': True}}
+IMAGENS_EXTENSOES = ('.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp')
+
+def gerar_variantes(caminho):
+    """
+    Decodifica a imagem, descarta metadados (EXIF/ICC) e grava as variantes
+    com nome pelo hash do conteúdo. Retorna (hash, {variante: {formato: url}}).
+    """
+    with open(caminho, 'rb') as f:
+        conteudo = f.read()
+    digest = hashlib.sha256(conteudo).hexdigest()[:16]
+    os.makedirs(IMAGENS_OTIMIZADAS_FOLDER, exist_ok=True)
+    
+    with Image.open(io.BytesIO(conteudo)) as original:
+        # Aplica a rotação do EXIF antes de descartá-lo
+        imagem = ImageOps.exif_transpose(original)
+        imagem.load()
+    
+    tem_alfa = imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info)
+    imagem = imagem.convert('RGBA' if tem_alfa else 'RGB')
+    
+    variantes = {}
+    for variante, lado in IMAGENS_VARIANTES.items():
+        copia = imagem.copy()
+        copia.thumbnail((lado, lado), Image.LANCZOS)
+        variantes[variante] = {}
+        for formato, opcoes in IMAGENS_FORMATOS.items():
+            saida = copia
+            if formato == 'jpeg' and tem_alfa:
+                # JPEG não tem transparência: compõe sobre fundo branco
+                saida = Image.new('RGB', copia.size, (255, 255, 255))
+                saida.paste(copia, mask=copia.getchannel('A'))
+            extensao = 'jpg' if formato == 'jpeg' else formato
+            nome = f"{digest}_{variante}.{extensao}"
+            destino = os.path.join(IMAGENS_OTIMIZADAS_FOLDER, nome)
+            if not os.path.exists(destino):
+                temporario = destino + '.tmp'
+                saida.save(temporario, format=formato.upper(), **opcoes)
+                os.replace(temporario, destino)
+            variantes[variante][formato] = f"/uploads/otimizadas/{nome}"
+    return digest, variantes
+
+def registrar_variantes(url, digest, variantes):
+    conn = get_db(MENU_DB_PATH)
+    try:
+        conn.execute('''
+            INSERT OR REPLACE INTO imagens_otimizadas (original, hash, variantes, criado_em)
+            VALUES (?, ?, ?, ?)
+        ''', (url, digest, json.dumps(variantes), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        conn.commit()
+    finally:
+        conn.close()
+
+def otimizar_imagem(caminho, url):
+    inicio = time.perf_counter()
+    digest, variantes = gerar_variantes(caminho)
+    registrar_variantes(url, digest, variantes)
+    print(f"🖼️ Imagem otimizada: {url} → {len(variantes)} variantes ({time.perf_counter() - inicio:.2f}s)")
+    return variantes
+
+def carregar_variantes(conn):
+    """
+    {url original: variantes} de todas as imagens já otimizadas.
+    """
+    return {
+        row['original']: json.loads(row['variantes'])
+        for row in conn.execute("SELECT original, variantes FROM imagens_otimizadas").fetchall()
+    }
+
+class FilaImagens:
+    """
+    Worker em segundo plano: o upload só enfileira e responde na hora.
+    """
+    def __init__(self):
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = Lock()
+    
+    def _executar(self):
+        while True:
+            caminho, url = self._fila.get()
+            try:
+                otimizar_imagem(caminho, url)
+            except Exception as e:
+                print(f"⚠️ Erro ao otimizar {url}: {e}")
+            finally:
+                self._fila.task_done()
+    
+    def enfileirar(self, caminho, url):
+        if Image is None:
+            return False
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._executar, daemon=True, name='otimizador-imagens')
+                self._thread.start()
+        self._fila.put((caminho, url))
+        return True
+    
+    def pendentes(self):
+        return self._fila.unfinished_tasks
+
+fila_imagens = FilaImagens()
+
+# ==========================
+# ARQUIVOS ESTÁTICOS (FINGERPRINT)
+# ==========================
+# Manifesto e arquivos com fingerprint em estaticos.py; aqui só as rotas que os servem
+manifesto_estatico = ManifestoEstatico(app.static_folder)
+
+def servir_estatico(path):
+    estado = manifesto_estatico.obter()
+    
+    arquivo = estado['fingerprint'].get(path)
+    if arquivo is not None:
+        return arquivo.resposta(imutavel=True)
+    
+    arquivo = estado['originais'].get(path)
+    if arquivo is not None:
+        return arquivo.resposta(imutavel=False)
+    
+    resp = send_from_directory(app.static_folder, path)
+    if path.startswith('uploads/otimizadas/'):
+        # Variantes já têm o hash do conteúdo no nome
+        resp.cache_control.no_cache = None
+        resp.cache_control.public = True
+        resp.cache_control.max_age = ESTATICOS_MAX_AGE
+        resp.cache_control.immutable = True
+    return resp
+
+# ==========================
+# ROTAS PÚBLICAS
+# ==========================
+@app.route('/')
+def index():
+    return servir_estatico('index.html')
+
+@app.route('/<path:path>')
+def serve_static(path):
+    return servir_estatico(path)
+
+# ✅ Com static_url_path='' a regra 'static' do Flask casa antes de serve_static
+@app.endpoint('static')
+def static_publico(filename):
+    return servir_estatico(filename)
+
+# ==========================
 # API DE AUTENTICAÇÃO
 # ==========================
 @app.route('/login', methods=['GET', 'POST'])
@@ -516,12 +2405,15 @@ def logout():
 # ==========================
 @app.route('/api/config', methods=['GET'])
 def get_config():
-    conn = get_db(CONFIG_DB_PATH)
-    try:
-        configs = conn.execute("SELECT * FROM config").fetchall()
-        return jsonify({row['chave']: dict(row) for row in configs})
-    finally:
-        conn.close()
+    def gerar():
+        conn = get_db(CONFIG_DB_PATH)
+        try:
+            configs = conn.execute("SELECT * FROM config").fetchall()
+            return jsonify({row['chave']: dict(row) for row in configs})
+        finally:
+            conn.close()
+    
+    return resposta_condicional(versao_config, gerar)
 
 @app.route('/api/config', methods=['POST'])
 @require_auth
@@ -538,28 +2430,197 @@ def save_config():
                 (chave, str(valor))
             )
         conn.commit()
+        versao_config.invalidar()
         return jsonify({'message': 'Configurações salvas'})
     finally:
         conn.close()
 
+# ==========================
+# SALVAMENTO DO CARDÁPIO (DIFF)
+# ==========================
+# Colunas gravadas de cada tabela (além do id), na ordem dos UPDATE/INSERT
+CAMPOS_MENU = {
+    'categorias': ('nome',),
+    'produtos': ('nome', 'preco', 'imagem', 'categoria_id', 'estoque'),
+    'adicionais': ('nome', 'preco', 'categoria_id', 'estoque'),
+}
+PADROES_MENU = {'imagem': '', 'estoque': 999}
+
+def _normalizar_campo(campo, valor):
+    """
+    Converte o valor do payload para o tipo da coluna (ValueError se inválido).
+    """
+    if campo == 'nome':
+        valor = str(valor or '').strip()
+        if not valor:
+            raise ValueError("nome vazio")
+        return valor
+    if campo == 'preco':
+        valor = float(valor)
+        if valor < 0:
+            raise ValueError("preço negativo")
+        return valor
+    if campo == 'estoque':
+        # bool é int em Python: True não pode virar 1 unidade
+        if type(valor) is not int or valor < 0:
+            raise ValueError("estoque deve ser um inteiro maior ou igual a zero")
+        return valor
+    if campo == 'categoria_id':
+        return int(valor)
+    return valor if valor is not None else ''
+
+def _id_payload(item):
+    """
+    Id inteiro do item do payload, ou None para itens novos (sem id ou 'temp_...').
+    """
+    try:
+        return int(item.get('id'))
+    except (TypeError, ValueError):
+        return None
+
+def _linha_payload(tabela, item, atual, mapa_categorias):
+    """
+    Valores das colunas de `tabela` para o item. Campo ausente mantém o valor
+    atual (linha existente) ou o padrão (linha nova). O estoque de linha
+    existente é sempre o atual: só muda pelo diário (ajustes, PATCH, pedidos).
+    """
+    valores = []
+    for campo in CAMPOS_MENU[tabela]:
+        if campo == 'estoque' and atual is not None:
+            valor = atual[campo]
+        elif campo == 'categoria_id' and campo in item:
+            # Ids de categoria do payload (inclusive 'temp_...') → id real
+            chave = str(item[campo])
+            if chave not in mapa_categorias:
+                raise ValueError(f"{tabela}: categoria {item[campo]} não existe")
+            valor = mapa_categorias[chave]
+        elif campo in item:
+            valor = _normalizar_campo(campo, item[campo])
+        elif atual is not None:
+            valor = atual[campo]
+        elif campo in PADROES_MENU:
+            valor = PADROES_MENU[campo]
+        else:
+            raise ValueError(f"{tabela}: campo '{campo}' obrigatório")
+        valores.append(valor)
+    return tuple(valores)
+
+def aplicar_diff_menu(cursor, data):
+    """
+    Compara o payload com as linhas atuais e aplica só a diferença:
+    - itens com id existente: UPDATE apenas se algum campo mudou
+    - itens sem id (ou 'temp_...'): INSERT; categorias SEM id casam pelo nome
+      com uma categoria existente que o payload não reivindica por id
+    - linhas ausentes do payload: DELETE (itens antes das categorias)
+    - estoque: só o inicial dos itens novos (com linha no diário); o de itens
+      existentes é ignorado, senão um cardápio aberto antes de uma venda
+      devolveria o que o pedido baixou
+    Ids ficam estáveis. Retorna o resumo
+    {tabela: {inseridos, atualizados, removidos[, estoque_ignorado]}}.
+    """
+    resumo = {}
+    atuais = {}
+    for tabela, campos in CAMPOS_MENU.items():
+        linhas = cursor.execute(f"SELECT id, {', '.join(campos)} FROM {tabela}").fetchall()
+        atuais[tabela] = {linha['id']: linha for linha in linhas}
+    
+    # Categorias primeiro: produtos e adicionais precisam dos ids reais
+    mapa_categorias = {str(cid): cid for cid in atuais['categorias']}
+    payload_categorias = [
+        (cat, _normalizar_campo('nome', cat.get('nome')), _id_payload(cat))
+        for cat in data.get('categorias', [])
+    ]
+    # Reivindicadas por id (inclusive as renomeadas) nunca casam pelo nome
+    reivindicadas = {cid for _, _, cid in payload_categorias if cid in atuais['categorias']}
+    por_nome = {
+        linha['nome']: cid for cid, linha in atuais['categorias'].items() if cid not in reivindicadas
+    }
+    mantidas, novas, atualizadas = set(), [], []
+    for cat, nome, cid in payload_categorias:
+        if cid not in reivindicadas:
+            cid = por_nome.pop(nome, None) if cat.get('id') is None else None
+        if cid is None:
+            novas.append((cat, nome))
+            continue
+        mantidas.add(cid)
+        if cat.get('id') is not None:
+            mapa_categorias[str(cat['id'])] = cid
+        if atuais['categorias'][cid]['nome'] != nome:
+            atualizadas.append((nome, cid))
+    
+    cursor.executemany("UPDATE categorias SET nome = ? WHERE id = ?", atualizadas)
+    for cat, nome in novas:
+        cid = cursor.execute("INSERT INTO categorias (nome) VALUES (?)", (nome,)).lastrowid
+        mantidas.add(cid)
+        mapa_categorias[str(nome if cat.get('id') is None else cat['id'])] = cid
+    removidas = [cid for cid in atuais['categorias'] if cid not in mantidas]
+    resumo['categorias'] = {'inseridos': len(novas), 'atualizados': len(atualizadas), 'removidos': len(removidas)}
+    
+    movimentos = []
+    for tabela in ('produtos', 'adicionais'):
+        campos = CAMPOS_MENU[tabela]
+        existentes = atuais[tabela]
+        mantidos, inserir, atualizar = set(), [], []
+        estoque_ignorado = 0
+        for item in data.get(tabela, []):
+            item_id = _id_payload(item)
+            atual = existentes.get(item_id)
+            valores = _linha_payload(tabela, item, atual, mapa_categorias)
+            if atual is None:
+                inserir.append(valores)
+                continue
+            mantidos.add(item_id)
+            if 'estoque' in item and item['estoque'] != atual['estoque']:
+                estoque_ignorado += 1
+            if tuple(atual[campo] for campo in campos) != valores:
+                atualizar.append(valores + (item_id,))
+        
+        remover = [(item_id,) for item_id in existentes if item_id not in mantidos]
+        cursor.executemany(f"DELETE FROM {tabela} WHERE id = ?", remover)
+        cursor.executemany(
+            f"UPDATE {tabela} SET {', '.join(f'{c} = ?' for c in campos)} WHERE id = ?", atualizar
+        )
+        sql_inserir = f"INSERT INTO {tabela} ({', '.join(campos)}) VALUES ({', '.join('?' for _ in campos)})"
+        for valores in inserir:
+            novo_id = cursor.execute(sql_inserir, valores).lastrowid
+            movimentos.append((tabela, novo_id, 0, valores[campos.index('estoque')]))
+        resumo[tabela] = {'inseridos': len(inserir), 'atualizados': len(atualizar), 'removidos': len(remover)}
+        if estoque_ignorado:
+            resumo[tabela]['estoque_ignorado'] = estoque_ignorado
+    
+    cursor.executemany("DELETE FROM categorias WHERE id = ?", [(cid,) for cid in removidas])
+    registrar_movimentos(cursor, movimentos, 'cardápio: item novo')
+    return resumo
+
 # ==========================
 # API DE MENU (ADMIN)
 # ==========================
 @app.route('/api/menu', methods=['GET'])
 def get_menu():
-    conn = get_db(MENU_DB_PATH)
-    try:
-        categorias = conn.execute("SELECT * FROM categorias ORDER BY id").fetchall()
-        produtos = conn.execute("SELECT * FROM produtos ORDER BY categoria_id, id").fetchall()
-        adicionais = conn.execute("SELECT * FROM adicionais ORDER BY categoria_id, id").fetchall()
-        
-        return jsonify({
-            'categorias': [dict(c) for c in categorias],
-            'produtos': [dict(p) for p in produtos],
-            'adicionais': [dict(a) for a in adicionais]
-        })
-    finally:
-        conn.close()
+    def gerar():
+        conn = get_db(MENU_DB_PATH)
+        try:
+            categorias = conn.execute("SELECT * FROM categorias ORDER BY id").fetchall()
+            produtos = conn.execute("SELECT * FROM produtos ORDER BY categoria_id, id").fetchall()
+            adicionais = conn.execute("SELECT * FROM adicionais ORDER BY categoria_id, id").fetchall()
+            
+            variantes = carregar_variantes(conn)
+            
+            produtos_json = []
+            for p in produtos:
+                produto = dict(p)
+                produto['imagem_variantes'] = variantes.get(produto.get('imagem'))
+                produtos_json.append(produto)
+            
+            return jsonify({
+                'categorias': [dict(c) for c in categorias],
+                'produtos': produtos_json,
+                'adicionais': [dict(a) for a in adicionais]
+            })
+        finally:
+            conn.close()
+    
+    return resposta_condicional(catalogo_menu.versao, gerar)
 
 @app.route('/api/menu', methods=['POST'])
 @require_auth
@@ -571,38 +2632,23 @@ def save_menu():
     conn_menu = get_db(MENU_DB_PATH)
     
     try:
-        cursor = conn_menu.cursor()
-        
-        # Limpa tabelas, mas NÃO reseta sqlite_sequence
-        cursor.execute("DELETE FROM adicionais")
-        cursor.execute("DELETE FROM produtos")
-        cursor.execute("DELETE FROM categorias")
-        
-        # Insere categorias
-        for cat in data.get('categorias', []):
-            cursor.execute(
-                "INSERT INTO categorias (nome) VALUES (?)",
-                (cat['nome'],)
-            )
-        
-        # Insere produtos
-        for prod in data.get('produtos', []):
-            cursor.execute(
-                "INSERT INTO produtos (nome, preco, imagem, categoria_id, estoque) VALUES (?, ?, ?, ?, ?)",
-                (prod['nome'], prod['preco'], prod.get('imagem', ''), 
-                 prod['categoria_id'], prod.get('estoque', 999))
-            )
-        
-        # Insere adicionais
-        for adic in data.get('adicionais', []):
-            cursor.execute(
-                "INSERT INTO adicionais (nome, preco, categoria_id, estoque) VALUES (?, ?, ?, ?)",
-                (adic['nome'], adic['preco'], adic['categoria_id'], adic.get('estoque', 999))
-            )
-        
+        # ✅ DIFF: só as linhas que mudaram; o lock de escrita dura o mínimo
+        conn_menu.execute("BEGIN IMMEDIATE")
+        resumo = aplicar_diff_menu(conn_menu.cursor(), data)
         conn_menu.commit()
-        print("✅ Cardápio salvo com sucesso!")
-        return jsonify({'message': 'Cardápio salvo'})
+        
+        alteracoes = sum(r['inseridos'] + r['atualizados'] + r['removidos'] for r in resumo.values())
+        if alteracoes:
+            catalogo_menu.invalidar()
+        print(f"✅ Cardápio salvo ({alteracoes} linha(s) alteradas)")
+        resposta = {'message': 'Cardápio salvo', 'alteracoes': resumo}
+        if any('estoque_ignorado' in r for r in resumo.values()):
+            resposta['aviso'] = 'Estoque de itens existentes não muda pelo cardápio: use /api/estoque/ajustes'
+        return jsonify(resposta)
+    
+    except (ValueError, TypeError, KeyError, sqlite3.IntegrityError) as e:
+        conn_menu.rollback()
+        return jsonify({'message': f'Cardápio inválido: {e}'}), 400
     
     except Exception as e:
         conn_menu.rollback()
@@ -610,7 +2656,64 @@ def save_menu():
         return jsonify({'message': f'Erro: {str(e)}'}), 500
     
     finally:
-        conn_menu.close()
+        conn_menu.close()
+
+@app.route('/api/menu/<tabela>/<int:item_id>', methods=['PATCH'])
+@require_auth
+def patch_item_menu(tabela, item_id):
+    """
+    Edição parcial de uma linha (ex.: {"preco": 14.5} ou {"estoque": 30}).
+    Um único UPDATE com os campos enviados; o estoque passa por
+    ajustar_estoque, na mesma transação, e fica registrado no diário.
+    """
+    if tabela not in CAMPOS_MENU:
+        return jsonify({'message': f'Tabela inválida: {tabela}'}), 404
+    if not validar_json_request():
+        return jsonify({'message': 'Content-Type deve ser application/json'}), 400
+    
+    data = request.json or {}
+    invalidos = [campo for campo in data if campo not in CAMPOS_MENU[tabela]]
+    if invalidos or not data:
+        return jsonify({
+            'message': f"Campos editáveis: {', '.join(CAMPOS_MENU[tabela])}",
+            'invalidos': invalidos
+        }), 400
+    
+    try:
+        valores = {campo: _normalizar_campo(campo, valor) for campo, valor in data.items()}
+    except (TypeError, ValueError) as e:
+        return jsonify({'message': f'Valor inválido: {e}'}), 400
+    
+    estoque = valores.pop('estoque', None)
+    conn = get_db(MENU_DB_PATH)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        if valores:
+            cursor.execute(
+                f"UPDATE {tabela} SET {', '.join(f'{c} = ?' for c in valores)} WHERE id = ?",
+                (*valores.values(), item_id)
+            )
+            encontrado = cursor.rowcount > 0
+        else:
+            encontrado = cursor.execute(f"SELECT 1 FROM {tabela} WHERE id = ?", (item_id,)).fetchone() is not None
+        if not encontrado:
+            conn.rollback()
+            return jsonify({'message': 'Item não encontrado'}), 404
+        if estoque is not None:
+            ajustar_estoque(cursor, [(tabela, item_id, 'definir', estoque)], 'edição do item')
+        conn.commit()
+        catalogo_menu.invalidar()
+        
+        linha = conn.execute(
+            f"SELECT id, {', '.join(CAMPOS_MENU[tabela])} FROM {tabela} WHERE id = ?", (item_id,)
+        ).fetchone()
+        return jsonify(dict(linha))
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        return jsonify({'message': f'Alteração inválida: {e}'}), 400
+    finally:
+        conn.close()
 
 @app.route('/api/upload', methods=['POST'])
 @require_auth
@@ -642,7 +2745,241 @@ def upload_imagem():
         file.save(filepath)
         
         url = f"/uploads/{filename}"
-        return jsonify({'url': url})
+        
+        # ✅ Variantes (thumb/card/full, WebP/JPEG) geradas em segundo plano
+        pendente = fila_imagens.enfileirar(filepath, url)
+        return jsonify({'url': url, 'otimizacao': 'pendente' if pendente else 'indisponivel'})
+
+# ==========================
+# PAYLOAD DO TOTEM (/api/dados)
+# ==========================
+TOTEM_VARIANTE = ('card', 'webp')  # Imagem mostrada no card do produto
+
+class PayloadTotem:
+    """
+    Cardápio pronto para o totem, já serializado em JSON (bytes + ETag).
+    - montado a partir do snapshot do catálogo, uma vez por versão do cardápio
+      (qualquer commit em sorveteria.db: menu, estoque, imagens otimizadas)
+    - totem=True: só itens com estoque e categorias com algo a vender
+    - cada requisição só compara a versão e devolve os mesmos bytes
+    """
+    def __init__(self, catalogo):
+        self.catalogo = catalogo
+        self._cache = {}
+        self._lock = Lock()
+    
+    def obter(self, totem=True):
+        """
+        Retorna (etag, bytes) da versão atual.
+        """
+        snapshot = self.catalogo.obter()
+        em_cache = self._cache.get(totem)
+        if em_cache is not None and em_cache[0] == snapshot.versao:
+            return em_cache[1], em_cache[2]
+        
+        with self._lock:
+            em_cache = self._cache.get(totem)
+            if em_cache is None or em_cache[0] != snapshot.versao:
+                corpo = json.dumps(self._montar(snapshot, totem), ensure_ascii=False,
+                                   separators=(',', ':')).encode('utf-8')
+                local, banco = snapshot.versao
+                etag = f"totem-{BOOT_ID}-{local}-{banco}-{int(totem)}"
+                em_cache = self._cache[totem] = (snapshot.versao, etag, corpo)
+            return em_cache[1], em_cache[2]
+    
+    def _montar(self, snapshot, totem):
+        conn = get_db(MENU_DB_PATH)
+        try:
+            variantes = carregar_variantes(conn)
+        finally:
+            conn.close()
+        
+        def disponivel(item):
+            return not totem or item['estoque'] is None or item['estoque'] > 0
+        
+        categorias = {cid: {'id': cid, 'nome': nome, 'produtos': [], 'adicionais': []}
+                      for cid, nome in sorted(snapshot.categorias.items())}
+        
+        for produto in snapshot.produtos_por_id.values():
+            if not disponivel(produto) or produto['categoria_id'] not in categorias:
+                continue
+            imagem = produto['imagem'] or ''
+            otimizada = variantes.get(imagem, {}).get(TOTEM_VARIANTE[0], {}).get(TOTEM_VARIANTE[1])
+            categorias[produto['categoria_id']]['produtos'].append({
+                'id': produto['id'],
+                'nome': produto['nome'],
+                'preco': produto['preco'],
+                'estoque': produto['estoque'],
+                # Sem barra inicial: totem.html monta `/${imagem_path}`
+                'imagem_path': (otimizada or imagem).lstrip('/'),
+            })
+        
+        for adicional in snapshot.adicionais_por_id.values():
+            if disponivel(adicional) and adicional['categoria_id'] in categorias:
+                categorias[adicional['categoria_id']]['adicionais'].append({
+                    'id': adicional['id'],
+                    'nome': adicional['nome'],
+                    'preco': adicional['preco'],
+                    'estoque': adicional['estoque'],
+                })
+        
+        lista = [c for c in categorias.values() if not totem or c['produtos'] or c['adicionais']]
+        for categoria in lista:
+            categoria['produtos'].sort(key=lambda p: p['id'])
+            categoria['adicionais'].sort(key=lambda a: a['id'])
+        
+        return {
+            'categorias': lista,
+            # Formatos lidos por totem.html e acompanhamentos.html
+            'menu': {c['nome']: c['produtos'] for c in lista},
+            'adicional_categorias': {c['nome']: {'inclusos': [], 'adicionais': c['adicionais']}
+                                     for c in lista if c['adicionais']},
+        }
+
+payload_totem = PayloadTotem(catalogo_menu)
+
+@app.route('/api/dados', methods=['GET'])
+def get_dados():
+    """
+    Cardápio do totem: categorias com produtos e adicionais aninhados.
+    ?totem=true filtra itens sem estoque. Servido da memória (bytes prontos);
+    If-None-Match com o ETag atual responde 304.
+    """
+    totem = request.args.get('totem', '').lower() == 'true'
+    etag, corpo = payload_totem.obter(totem)
+    if request.if_none_match.contains_weak(etag):
+        resposta = Response(status=304)
+    else:
+        resposta = Response(corpo, mimetype='application/json')
+    resposta.set_etag(etag, weak=True)
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+# ==========================
+# API DE ESTOQUE (ADMIN)
+# ==========================
+@app.route('/api/estoque/ajustes', methods=['POST'])
+@require_auth
+def ajustes_estoque():
+    """
+    Ajuste de estoque em lote (ex.: reposição após entrega):
+        {"motivo": "entrega", "ajustes": [
+            {"tabela": "produtos", "id": 3, "delta": 24},
+            {"tabela": "adicionais", "id": 7, "definir": 50}]}
+    Tudo ou nada, numa transação; cada ajuste vai para movimentos_estoque.
+    """
+    if not validar_json_request():
+        return jsonify({'message': 'Content-Type deve ser application/json'}), 400
+    
+    data = request.json or {}
+    try:
+        ajustes = validar_ajustes(data.get('ajustes'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    motivo = str(data.get('motivo') or 'ajuste manual')[:200]
+    
+    conn = get_db(MENU_DB_PATH)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        niveis, erros = ajustar_estoque(conn.cursor(), ajustes, motivo)
+        if erros:
+            conn.rollback()
+            return jsonify({'message': 'Nenhum ajuste aplicado', 'erros': erros}), 409
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    catalogo_menu.invalidar()
+    print(f"📦 Estoque ajustado: {len(ajustes)} ajuste(s) em {len(niveis)} item(ns) ({motivo})")
+    return jsonify({'message': 'Estoque ajustado', 'niveis': niveis})
+
+@app.route('/api/estoque/projecao', methods=['GET'])
+@require_auth
+def projecao_estoque_api():
+    """
+    Consumo na janela, taxa por hora e previsão de fim de estoque por item.
+    ?alertas=true: só os itens em alerta ('baixo' ou 'esgotado').
+    """
+    itens = projecao_estoque.projetar()
+    if request.args.get('alertas', '').lower() == 'true':
+        itens = [item for item in itens if item['alerta']]
+    return jsonify({
+        'janela_minutos': PROJECAO_JANELA_MIN,
+        'alerta_minutos': PROJECAO_ALERTA_MIN,
+        'estoque_minimo': PROJECAO_ESTOQUE_MINIMO,
+        'observacao_minutos': PROJECAO_OBSERVACAO_MIN,
+        'amostras_minimas': PROJECAO_AMOSTRAS_MIN,
+        'monitor_recusado': projecao_estoque.monitor_recusado,
+        'itens': itens,
+    })
+
+@app.route('/api/estoque/alertas/stream', methods=['GET'])
+@require_auth
+def stream_alertas_estoque():
+    """
+    Server-Sent Events do painel admin: snapshot dos alertas ativos e depois
+    estoque.alerta e estoque.normalizado conforme o monitor publica (de
+    qualquer worker, com o transporte do barramento).
+    """
+    # Assina ANTES do snapshot: nada se perde entre os dois (o cliente aplica por chave)
+    assinatura = barramento.assinar(f"admin-alertas-{os.urandom(4).hex()}",
+                                    ['estoque.alerta', 'estoque.normalizado'], politica='coalescer')
+    inicial = json.dumps({'alertas': projecao_estoque.alertas()}, ensure_ascii=False)
+    
+    def gerar():
+        try:
+            yield b"retry: 3000\n\n"
+            yield f"event: snapshot\ndata: {inicial}\n\n".encode('utf-8')
+            while assinatura.ativa:
+                evento = assinatura.proximo(timeout=HUB_KEEPALIVE)
+                if evento is None:
+                    yield b": keep-alive\n\n"
+                    continue
+                dados = json.dumps(evento, ensure_ascii=False)
+                yield f"event: {evento['topico']}\ndata: {dados}\n\n".encode('utf-8')
+        finally:
+            barramento.cancelar(assinatura)
+    
+    return Response(gerar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/estoque/movimentos', methods=['GET'])
+@require_auth
+def listar_movimentos_estoque():
+    """
+    Diário de estoque (pedidos, ajustes, edições) para conciliação, paginado por keyset.
+    Parâmetros: tabela, item_id, pedido_id, after_id, limit (máx. PEDIDOS_LIMITE_MAX).
+    """
+    filtros, params = ['id > ?'], [request.args.get('after_id', 0, type=int)]
+    if request.args.get('tabela'):
+        filtros.append('tabela = ?')
+        params.append(request.args['tabela'])
+    if request.args.get('item_id', type=int) is not None:
+        filtros.append('item_id = ?')
+        params.append(request.args.get('item_id', type=int))
+    if request.args.get('pedido_id', type=int) is not None:
+        filtros.append('pedido_id = ?')
+        params.append(request.args.get('pedido_id', type=int))
+    limite = min(max(request.args.get('limit', 100, type=int), 1), PEDIDOS_LIMITE_MAX)
+    
+    conn = get_db(MENU_DB_PATH)
+    try:
+        movimentos = [dict(row) for row in conn.execute(
+            f"SELECT * FROM movimentos_estoque WHERE {' AND '.join(filtros)} ORDER BY id LIMIT ?",
+            params + [limite]
+        )]
+    finally:
+        conn.close()
+    
+    resposta = jsonify(movimentos)
+    if len(movimentos) == limite:
+        resposta.headers['X-Proximo-After-Id'] = str(movimentos[-1]['id'])
+    return resposta
 
 # ==========================
 # API DE PEDIDOS
@@ -664,148 +3001,57 @@ def handle_pedidos():
         if not cliente_nome or len(cliente_nome) < 2:
             return jsonify({'message': 'Nome do cliente inválido'}), 400
         
+        # ✅ PLANO ÚNICO: cada produto/adicional resolvido uma vez no catálogo
+        try:
+            plano = planejar_pedido(itens, catalogo_menu.obter())
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
         # ✅ VERIFICA ESTOQUE ANTES DE PROCESSAR
-        estoque_ok, mensagem, faltantes = verificar_estoque_disponivel(itens)
-        if not estoque_ok:
+        if plano['faltantes']:
             return jsonify({
-                'message': f'Estoque insuficiente: {mensagem}',
-                'faltantes': faltantes
+                'message': f"Estoque insuficiente: {mensagem_faltantes(plano['faltantes'])}",
+                'faltantes': plano['faltantes']
             }), 409
         
-        # ✅ TRANSAÇÃO ATÔMICA COMPLETA
-        conn_pedidos = get_db(PEDIDOS_DB_PATH)
-        conn_menu = get_db(MENU_DB_PATH)
+        # ✅ WRITE-BEHIND: a thread gravadora faz group commit e devolve o id
+        if gravador_pedidos.ativo:
+            s = gravador_pedidos.gravar(plano, cliente_nome, tipo_pedido)
+            if s.faltantes:
+                return jsonify({
+                    'message': f"Estoque insuficiente: {mensagem_faltantes(s.faltantes)}",
+                    'faltantes': s.faltantes,
+                    'conflito': True
+                }), 409
+            if s.erro:
+                resposta = jsonify({'message': s.erro})
+                if s.codigo == 503:
+                    resposta.headers['Retry-After'] = '1'
+                return resposta, s.codigo
+            return jsonify({
+                'message': 'Pedido recebido!',
+                'pedidoId': s.pedido_id,
+                'valorTotal': s.plano['valor_total']
+            })
+        
+        # ✅ UMA TRANSAÇÃO: sorveteria.db anexado como 'menu'
+        conn = get_db_pedido()
         
         try:
-            cursor_pedidos = conn_pedidos.cursor()
-            cursor_menu = conn_menu.cursor()
-            
-            # Data/hora
-            agora = datetime.now()
-            data_str = agora.strftime('%Y-%m-%d')
-            hora_str = agora.strftime('%H:%M:%S')
-            data_hora_completa = agora.strftime('%Y-%m-%d %H:%M:%S')
-            
-            # ✅ CALCULA TOTAL CORRETO (produtos + adicionais)
-            valor_total_pedido = 0.0
-            
-            # Coleta nomes de todos os adicionais para busca em batch
-            todos_adicionais = []
-            for item in itens:
-                for adicional in item.get('adicionais', []):
-                    nome_adic = adicional.get('nome', '').strip()
-                    if nome_adic:
-                        todos_adicionais.append(nome_adic)
-            
-            # Busca preços em batch
-            precos_adicionais = buscar_precos_batch(cursor_menu, todos_adicionais)
-            
-            # Calcula total
-            for item in itens:
-                produto_nome = item.get('produto', '').strip()
-                quantidade = item.get('quantidade', 1)
-                
-                # Preço do produto
-                produto = cursor_menu.execute(
-                    "SELECT preco FROM produtos WHERE LOWER(nome) = LOWER(?)",
-                    (produto_nome,)
-                ).fetchone()
-                
-                if produto:
-                    valor_total_pedido += produto['preco'] * quantidade
-                
-                # Preço dos adicionais
-                for adicional in item.get('adicionais', []):
-                    nome_adic = adicional.get('nome', '').strip().lower()
-                    qtd_adic = adicional.get('quantidade', 1)
-                    
-                    if nome_adic in precos_adicionais:
-                        valor_total_pedido += precos_adicionais[nome_adic] * qtd_adic * quantidade
-            
-            # Insere pedido com valor correto
-            cursor_pedidos.execute('''
-                INSERT INTO pedidos (cliente_nome, tipo_pedido, valor_total, data_hora, status)
-                VALUES (?, ?, ?, ?, 'recebido')
-            ''', (cliente_nome, tipo_pedido, valor_total_pedido, data_hora_completa))
-            
-            pedido_id = cursor_pedidos.lastrowid
-            
-            # ✅ AGREGAÇÃO CORRETA: coleta TODOS os acompanhamentos
-            acompanhamentos_por_categoria = {}
-            
-            # Insere itens e adicionais
-            for item in itens:
-                produto_nome = item.get('produto', '').strip()
-                quantidade = item.get('quantidade', 1)
-                
-                produto = cursor_menu.execute(
-                    "SELECT id, preco FROM produtos WHERE LOWER(nome) = LOWER(?)",
-                    (produto_nome,)
-                ).fetchone()
-                
-                if not produto:
-                    raise ValueError(f"Produto não encontrado: {produto_nome}")
-                
-                cursor_pedidos.execute('''
-                    INSERT INTO itens_pedido (pedido_id, produto_nome, quantidade, valor_unitario)
-                    VALUES (?, ?, ?, ?)
-                ''', (pedido_id, produto_nome, quantidade, produto['preco']))
-                
-                item_pedido_id = cursor_pedidos.lastrowid
-                
-                # Categoria do produto
-                categoria_produto = obter_categoria_produto(cursor_menu, produto_nome)
-                
-                # Insere adicionais e agrega
-                for adicional in item.get('adicionais', []):
-                    nome_adic = adicional.get('nome', '').strip()
-                    qtd_adic = adicional.get('quantidade', 1)
-                    qtd_total = qtd_adic * quantidade
-                    
-                    nome_adic_lower = nome_adic.lower()
-                    valor_unit = precos_adicionais.get(nome_adic_lower, 0.0)
-                    
-                    cursor_pedidos.execute('''
-                        INSERT INTO adicionais_pedido 
-                        (item_pedido_id, adicional_nome, quantidade, valor_unitario)
-                        VALUES (?, ?, ?, ?)
-                    ''', (item_pedido_id, nome_adic, qtd_total, valor_unit))
-                    
-                    # ✅ AGREGA PARA TODOS OS ITENS
-                    if categoria_produto not in acompanhamentos_por_categoria:
-                        acompanhamentos_por_categoria[categoria_produto] = {}
-                    
-                    if nome_adic not in acompanhamentos_por_categoria[categoria_produto]:
-                        acompanhamentos_por_categoria[categoria_produto][nome_adic] = {
-                            'quantidade': 0,
-                            'valor_unitario': valor_unit
-                        }
-                    
-                    acompanhamentos_por_categoria[categoria_produto][nome_adic]['quantidade'] += qtd_total
-            
-            # Grava agregação
-            for categoria, acompanhamentos in acompanhamentos_por_categoria.items():
-                for nome_acomp, dados in acompanhamentos.items():
-                    qtd = dados['quantidade']
-                    valor_unit = dados['valor_unitario']
-                    valor_total_acomp = qtd * valor_unit
-                    
-                    cursor_pedidos.execute('''
-                        INSERT INTO acompanhamentos_vendidos 
-                        (pedido_id, categoria_produto, nome_acompanhamento, quantidade, 
-                         valor_unitario, valor_total, data, hora)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (pedido_id, categoria, nome_acomp, qtd, valor_unit, 
-                          valor_total_acomp, data_str, hora_str))
-            
-            # ✅ DECREMENTA ESTOQUE NA MESMA TRANSAÇÃO
-            decrementar_estoque_transacao(cursor_menu, itens)
-            
-            # Commit em ambos os bancos
-            conn_pedidos.commit()
-            conn_menu.commit()
+            # ✅ RESERVA CONDICIONAL + PEDIDO; erro desfaz os dois bancos
+            pedido_id, faltantes = registrar_pedido(conn, plano, cliente_nome, tipo_pedido)
+            if faltantes:
+                # Outro totem levou o estoque entre o plano e a reserva
+                return jsonify({
+                    'message': f"Estoque insuficiente: {mensagem_faltantes(faltantes)}",
+                    'faltantes': faltantes,
+                    'conflito': True
+                }), 409
             
+            valor_total_pedido = plano['valor_total']
             print(f"✅ Pedido #{pedido_id} criado: {cliente_nome}, R$ {valor_total_pedido:.2f}")
+            publicar_evento_pedido(pedido_id, 'criado')
+            publicar_consumo_estoque(plano)
             
             return jsonify({
                 'message': 'Pedido recebido!',
@@ -814,66 +3060,139 @@ def handle_pedidos():
             })
         
         except Exception as e:
-            conn_pedidos.rollback()
-            conn_menu.rollback()
+            conn.rollback()
             print(f"❌ Erro ao processar pedido: {e}")
             return jsonify({'message': f'Erro ao processar pedido: {str(e)}'}), 500
         
         finally:
-            conn_pedidos.close()
-            conn_menu.close()
+            conn.close()
     
     if request.method == 'GET':
         # ✅ MODO PÚBLICO: omite dados sensíveis
         modo_publico = request.args.get('public', '').lower() == 'true'
         
-        status_filter = request.args.get('status', 'recebido').split(',')
-        status_validos = ['recebido', 'pronto', 'retirado']
-        status_filter = [s.strip() for s in status_filter if s.strip() in status_validos]
-        if not status_filter:
-            status_filter = ['recebido']
+        status_filter = filtro_status(request.args)
+        
+        # ✅ MODO DELTA: ?since_id= ou ?updated_since= (cursor devolvido na resposta)
+        since_id = request.args.get('since_id', type=int)
+        updated_since = request.args.get('updated_since', type=int)
+        
+        # ✅ PAGINAÇÃO KEYSET + PROJEÇÃO: ?limit=&after_id=&fields=id,status
+        limite = request.args.get('limit', type=int)
+        if limite is not None:
+            limite = max(1, min(limite, PEDIDOS_LIMITE_MAX))
+        after_id = request.args.get('after_id', type=int)
+        campos = filtro_campos(request.args)
+        
+        def gerar():
+            conn = get_db(PEDIDOS_DB_PATH)
+            try:
+                if since_id is not None or updated_since is not None:
+                    return jsonify(listar_alteracoes(conn, status_filter, modo_publico, since_id, updated_since, campos))
+                
+                pedidos = listar_pedidos(conn, status_filter, modo_publico, limite, after_id, campos)
+                resp = jsonify(pedidos)
+                if limite is not None and len(pedidos) == limite:
+                    # Página cheia: pode haver mais, continua com ?after_id=<este valor>
+                    resp.headers['X-Proximo-After-Id'] = str(pedidos[-1]['id'])
+                return resp
+            finally:
+                conn.close()
         
+        # ✅ ETag por versão do banco + filtros da query string
+        return resposta_condicional(versao_pedidos, gerar, request.query_string.decode('utf-8'))
+
+@app.route('/api/pedidos/stream', methods=['GET'])
+def stream_pedidos():
+    """
+    Server-Sent Events: snapshot inicial e depois pedido_criado,
+    pedido_atualizado e pedido_removido. Aceita ?status= e ?public=true como o GET.
+    Com Last-Event-ID recente, reenvia só os eventos perdidos.
+    """
+    modo_publico = request.args.get('public', '').lower() == 'true'
+    status_filter = filtro_status(request.args)
+    
+    # Assina ANTES do snapshot: nada se perde entre os dois (o cliente aplica por id)
+    assinante = hub_pedidos.assinar(status_filter, modo_publico)
+    ultimo_id = hub_pedidos.ler_cursor(request.headers.get('Last-Event-ID'))
+    perdidos = hub_pedidos.eventos_desde(ultimo_id) if ultimo_id is not None else None
+    
+    inicial = []
+    if perdidos is None:
+        seq = hub_pedidos.seq
         conn = get_db(PEDIDOS_DB_PATH)
         try:
-            placeholders = ','.join('?' for _ in status_filter)
-            query = f"SELECT * FROM pedidos WHERE status IN ({placeholders}) ORDER BY id ASC"
-            pedidos_rows = conn.execute(query, status_filter).fetchall()
-            
-            lista_pedidos = []
-            for pedido in pedidos_rows:
-                itens_rows = conn.execute(
-                    "SELECT * FROM itens_pedido WHERE pedido_id = ?",
-                    (pedido['id'],)
-                ).fetchall()
-                
-                itens_completos = []
-                for item in itens_rows:
-                    item_dict = dict(item)
-                    adicionais_rows = conn.execute(
-                        "SELECT * FROM adicionais_pedido WHERE item_pedido_id = ?",
-                        (item['id'],)
-                    ).fetchall()
-                    item_dict['adicionais'] = [dict(ad) for ad in adicionais_rows]
-                    itens_completos.append(item_dict)
-                
-                pedido_dict = {
-                    'id': pedido['id'],
-                    'tipo_pedido': pedido['tipo_pedido'],
-                    'status': pedido['status'],
-                    'valor_total': pedido['valor_total'],
-                    'data_hora': pedido['data_hora'],
-                    'itens': itens_completos
-                }
-                
-                # ✅ Omite cliente_nome em modo público
-                if not modo_publico:
-                    pedido_dict['cliente_nome'] = pedido['cliente_nome']
-                
-                lista_pedidos.append(pedido_dict)
-            
-            return jsonify(lista_pedidos)
+            pedidos = listar_pedidos(conn, status_filter, modo_publico)
+        except Exception:
+            hub_pedidos.cancelar(assinante)
+            raise
         finally:
             conn.close()
+        cursor = hub_pedidos.cursor(seq)
+        dados = json.dumps({'cursor': cursor, 'pedidos': pedidos}, ensure_ascii=False)
+        inicial.append(f"id: {cursor}\nevent: snapshot\ndata: {dados}\n\n".encode('utf-8'))
+    else:
+        for evento in perdidos:
+            tipo = evento.para(status_filter)
+            if tipo:
+                inicial.append(evento.sse(tipo, modo_publico))
+    
+    def gerar():
+        try:
+            yield b"retry: 3000\n\n"
+            yield from inicial
+            while not assinante.atrasado:
+                try:
+                    evento = assinante.fila.get(timeout=HUB_KEEPALIVE)
+                except queue.Empty:
+                    yield b": keep-alive\n\n"
+                    continue
+                if evento is None:
+                    break  # Hub ressincronizou: reconecta e recebe snapshot
+                yield evento.sse(evento.para(status_filter), modo_publico)
+        finally:
+            hub_pedidos.cancelar(assinante)
+    
+    return Response(gerar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/pedidos/eventos', methods=['GET'])
+def long_poll_pedidos():
+    """
+    Long-polling para quem não tem SSE.
+    - Sem ?since: snapshot + cursor
+    - Com ?since=<cursor>: eventos posteriores (espera até ?timeout= segundos)
+    - Cursor fora do histórico ou de outra época (reinício, outro worker):
+      reset=true com snapshot novo
+    """
+    modo_publico = request.args.get('public', '').lower() == 'true'
+    status_filter = filtro_status(request.args)
+    since_param = request.args.get('since')
+    since = hub_pedidos.ler_cursor(since_param)
+    timeout = min(max(request.args.get('timeout', 25, type=int), 0), 60)
+    
+    if since is not None:
+        if hub_pedidos.eventos_desde(since) == []:
+            hub_pedidos.aguardar(since, timeout)
+        eventos = hub_pedidos.eventos_desde(since)
+        if eventos is not None:
+            resposta = []
+            for evento in eventos:
+                tipo = evento.para(status_filter)
+                if tipo:
+                    resposta.append({'seq': evento.seq, 'tipo': tipo, 'dados': evento.dados(tipo, modo_publico)})
+            cursor = eventos[-1].seq if eventos else since
+            return jsonify({'cursor': hub_pedidos.cursor(cursor), 'eventos': resposta})
+    
+    seq = hub_pedidos.seq
+    conn = get_db(PEDIDOS_DB_PATH)
+    try:
+        pedidos = listar_pedidos(conn, status_filter, modo_publico)
+    finally:
+        conn.close()
+    return jsonify({'cursor': hub_pedidos.cursor(seq), 'reset': since_param is not None, 'pedidos': pedidos})
 
 @app.route('/api/pedidos/<int:pedido_id>/status', methods=['POST'])
 @require_auth
@@ -885,7 +3204,7 @@ def update_pedido_status(pedido_id):
         return jsonify({'message': 'Content-Type deve ser application/json'}), 400
     
     novo_status = request.json.get('status')
-    if not novo_status or novo_status not in ['recebido', 'pronto', 'retirado']:
+    if not novo_status or novo_status not in STATUS_VALIDOS:
         return jsonify({'message': 'Status inválido'}), 400
     
     conn = get_db(PEDIDOS_DB_PATH)
@@ -894,10 +3213,15 @@ def update_pedido_status(pedido_id):
         if not pedido:
             return jsonify({'message': 'Pedido não encontrado'}), 404
         
-        conn.execute("UPDATE pedidos SET status = ? WHERE id = ?", (novo_status, pedido_id))
+        conn.execute(
+            f"UPDATE pedidos SET status = ?, seq_alteracao = {PROXIMA_SEQ_ALTERACAO} WHERE id = ?",
+            (novo_status, pedido_id)
+        )
         conn.commit()
         
         print(f"✅ Pedido #{pedido_id}: {pedido['status']} → {novo_status}")
+        if novo_status != pedido['status']:
+            publicar_evento_pedido(pedido_id, 'status', pedido['status'], novo_status)
         return jsonify({'message': 'Status atualizado'})
     finally:
         conn.close()
@@ -910,13 +3234,22 @@ def update_pedido_status(pedido_id):
 def get_acompanhamentos_vendidos():
     """
     Retorna relatório de acompanhamentos vendidos.
+    - sem 'agrupar': linhas brutas de acompanhamentos_vendidos
+    - agrupar=dia|hora|categoria: totais lidos dos rollups
     """
     data_inicio = request.args.get('data_inicio')
     data_fim = request.args.get('data_fim')
     categoria = request.args.get('categoria')
+    agrupar = request.args.get('agrupar')
+    
+    if agrupar and agrupar not in RELATORIO_AGRUPAMENTOS:
+        return jsonify({'message': f"agrupar deve ser um de: {', '.join(RELATORIO_AGRUPAMENTOS)}"}), 400
     
     conn = get_db(PEDIDOS_DB_PATH)
     try:
+        if agrupar:
+            return jsonify(relatorio_agrupado(conn, agrupar, data_inicio, data_fim, categoria))
+        
         query = "SELECT * FROM acompanhamentos_vendidos WHERE 1=1"
         params = []
         
@@ -945,7 +3278,7 @@ def get_acompanhamentos_vendidos():
 @app.route('/api/backup/manual', methods=['POST'])
 @require_auth
 def backup_manual():
-    sucesso = fazer_backup()
+    sucesso = fazer_backup(BANCOS_BACKUP)
     if sucesso:
         return jsonify({'message': '✅ Backup criado!'})
     else:
@@ -958,15 +3291,32 @@ def listar_backups_api():
         criar_pasta_backup()
         arquivos = []
         for arquivo in os.listdir(BACKUP_FOLDER):
-            if arquivo.endswith('.db'):
+            if arquivo.endswith(BACKUP_EXTENSOES):
                 caminho = os.path.join(BACKUP_FOLDER, arquivo)
                 tamanho_mb = os.path.getsize(caminho) / (1024 * 1024)
                 data = datetime.fromtimestamp(os.path.getmtime(caminho))
                 arquivos.append({
                     'arquivo': arquivo,
+                    'tipo': 'completo',
                     'tamanho_mb': round(tamanho_mb, 2),
                     'data': data.strftime('%Y-%m-%d %H:%M:%S')
                 })
+        
+        # Cadeias incrementais: um item por cadeia, com os pontos restauráveis
+        for pasta, manifesto in listar_cadeias():
+            caminho = os.path.join(BACKUP_INCREMENTAL_FOLDER, pasta)
+            tamanho_mb = sum(
+                os.path.getsize(os.path.join(caminho, p['arquivo'])) for p in manifesto['pontos']
+            ) / (1024 * 1024)
+            ultimo = datetime.strptime(manifesto['pontos'][-1]['timestamp'], '%Y%m%d_%H%M%S')
+            arquivos.append({
+                'arquivo': pasta,
+                'tipo': 'incremental',
+                'banco': manifesto['banco'],
+                'pontos': [p['timestamp'] for p in manifesto['pontos']],
+                'tamanho_mb': round(tamanho_mb, 2),
+                'data': ultimo.strftime('%Y-%m-%d %H:%M:%S')
+            })
         arquivos.sort(key=lambda x: x['data'], reverse=True)
         return jsonify(arquivos)
     except Exception as e:
@@ -980,6 +3330,192 @@ def download_backup(filename):
     except Exception as e:
         return jsonify({'message': f'Erro: {str(e)}'}), 404
 
+@app.route('/api/backup/download/incremental/<cadeia>')
+@require_auth
+def download_backup_incremental(cadeia):
+    """
+    Reconstrói a cadeia até ?ate=AAAAMMDD_HHMMSS (padrão: último ponto) e envia o .db.
+    """
+    fd, temporario = tempfile.mkstemp(suffix='.db', prefix='restauracao_')
+    os.close(fd)
+    try:
+        timestamp = restaurar_cadeia(cadeia, temporario, request.args.get('ate'))
+    except (OSError, ValueError) as e:
+        os.remove(temporario)
+        return jsonify({'message': f'Erro: {str(e)}'}), 404
+    
+    nome = cadeia.rsplit('_', 2)[0]
+    resposta = send_file(temporario, as_attachment=True, download_name=f"{nome}_{timestamp}.db")
+    resposta.call_on_close(lambda: os.remove(temporario))
+    return resposta
+
+# ==========================
+# EXPORTAÇÃO (STREAMING)
+# ==========================
+EXPORTAR_PAGINA = 2000  # Linhas por consulta keyset (cada página é uma leitura curta)
+EXPORTAR_LOTE = 500  # Linhas por fetchmany/chunk enviado
+EXPORTAR_FORMATOS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# tabela -> (SELECT sem WHERE, coluna do keyset, coluna de data/hora para filtro)
+EXPORTACOES = {
+    'pedidos': (
+        "SELECT p.id, p.cliente_nome, p.tipo_pedido, p.status, p.valor_total, p.data_hora "
+        "FROM pedidos p",
+        'p.id', 'p.data_hora'
+    ),
+    'itens_pedido': (
+        "SELECT i.id, i.pedido_id, i.produto_nome, i.quantidade, i.valor_unitario, p.data_hora "
+        "FROM itens_pedido i JOIN pedidos p ON p.id = i.pedido_id",
+        'i.id', 'p.data_hora'
+    ),
+    'adicionais_pedido': (
+        "SELECT a.id, a.item_pedido_id, i.pedido_id, a.adicional_nome, a.quantidade, a.valor_unitario, p.data_hora "
+        "FROM adicionais_pedido a JOIN itens_pedido i ON i.id = a.item_pedido_id "
+        "JOIN pedidos p ON p.id = i.pedido_id",
+        'a.id', 'p.data_hora'
+    ),
+    'acompanhamentos_vendidos': (
+        "SELECT v.id, v.pedido_id, v.categoria_produto, v.nome_acompanhamento, v.quantidade, "
+        "v.valor_unitario, v.valor_total, v.data, v.hora "
+        "FROM acompanhamentos_vendidos v",
+        'v.id', 'v.data'
+    ),
+}
+
+def _paginas_exportacao(tabela, after_id, data_inicio, data_fim, limite):
+    """
+    Gera (colunas, linhas) página a página por keyset (id > último id).
+    Cada página usa uma conexão do pool só enquanto lê, então uma exportação
+    longa não segura snapshot do WAL nem conexão entre um chunk e outro.
+    """
+    select, coluna_id, coluna_data = EXPORTACOES[tabela]
+    filtros, params_base = [], []
+    if data_inicio:
+        filtros.append(f"{coluna_data} >= ?")
+        params_base.append(data_inicio)
+    if data_fim:
+        # Fim inclusivo: tudo antes do dia seguinte (serve para 'data' e 'data_hora')
+        filtros.append(f"{coluna_data} < ?")
+        params_base.append((datetime.strptime(data_fim, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d'))
+    
+    enviados = 0
+    while limite is None or enviados < limite:
+        pagina = EXPORTAR_PAGINA if limite is None else min(EXPORTAR_PAGINA, limite - enviados)
+        where = ' AND '.join([f"{coluna_id} > ?"] + filtros)
+        conn = get_db(PEDIDOS_DB_PATH)
+        try:
+            cursor = conn.execute(f"{select} WHERE {where} ORDER BY {coluna_id} LIMIT ?",
+                                  [after_id] + params_base + [pagina])
+            colunas = [d[0] for d in cursor.description]
+            lidas = 0
+            while True:
+                linhas = cursor.fetchmany(EXPORTAR_LOTE)
+                if not linhas:
+                    break
+                lidas += len(linhas)
+                after_id = linhas[-1]['id']
+                yield colunas, linhas
+        finally:
+            conn.close()
+        
+        enviados += lidas
+        if lidas < pagina:
+            if enviados == 0:
+                yield colunas, []  # Só o cabeçalho do CSV
+            break
+
+def exportar_csv(paginas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    cabecalho = False
+    for colunas, linhas in paginas:
+        if not cabecalho:
+            writer.writerow(colunas)
+            cabecalho = True
+        writer.writerows(tuple(linha) for linha in linhas)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+def exportar_ndjson(paginas):
+    for colunas, linhas in paginas:
+        if linhas:
+            yield ''.join(json.dumps(dict(zip(colunas, linha)), ensure_ascii=False) + '\n'
+                          for linha in linhas).encode('utf-8')
+
+@app.route('/api/exportar/<tabela>', methods=['GET'])
+@require_auth
+def exportar_tabela(tabela):
+    """
+    Exporta uma tabela de pedidos em streaming (chunked, memória constante).
+    Query: formato=csv|ndjson, data_inicio, data_fim (AAAA-MM-DD),
+    after_id (keyset: continua depois deste id), limite.
+    Para a próxima página, use o id da última linha recebida como after_id.
+    """
+    if tabela not in EXPORTACOES:
+        return jsonify({'message': f"Tabela inválida. Use: {', '.join(EXPORTACOES)}"}), 404
+    
+    formato = request.args.get('formato', 'csv')
+    if formato not in EXPORTAR_FORMATOS:
+        return jsonify({'message': f"formato deve ser um de: {', '.join(EXPORTAR_FORMATOS)}"}), 400
+    
+    try:
+        after_id = int(request.args.get('after_id', 0))
+        limite = request.args.get('limite')
+        limite = int(limite) if limite else None
+        if limite is not None and limite < 1:
+            raise ValueError
+        for campo in ('data_inicio', 'data_fim'):
+            if request.args.get(campo):
+                datetime.strptime(request.args[campo], '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'message': 'after_id/limite devem ser inteiros positivos e datas no formato AAAA-MM-DD'}), 400
+    
+    paginas = _paginas_exportacao(tabela, after_id, request.args.get('data_inicio'),
+                                  request.args.get('data_fim'), limite)
+    gerador = exportar_csv(paginas) if formato == 'csv' else exportar_ndjson(paginas)
+    
+    nome_arquivo = f"{tabela}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+    resp = Response(gerador, mimetype=EXPORTAR_FORMATOS[formato])
+    resp.headers['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+# ==========================
+# API DE DIAGNÓSTICO (ADMIN)
+# ==========================
+@app.route('/api/pool/stats', methods=['GET'])
+@require_auth
+def pool_stats():
+    """
+    Estatísticas do pool de conexões de cada banco.
+    """
+    return jsonify({path: pool.estatisticas() for path, pool in list(_pools.items())})
+
+@app.route('/api/compressao/stats', methods=['GET'])
+@require_auth
+def compressao_stats():
+    """
+    Bytes economizados pelo middleware de compressão.
+    """
+    return jsonify(compressao_respostas.estatisticas())
+
+@app.route('/api/gravador/stats', methods=['GET'])
+@require_auth
+def gravador_stats():
+    """
+    Profundidade da fila e latência de commit da ingestão write-behind.
+    """
+    return jsonify(gravador_pedidos.estatisticas())
+
+@app.route('/api/barramento/stats', methods=['GET'])
+@require_auth
+def barramento_stats():
+    """
+    Fila de despacho, transporte e filas/descartes de cada assinante do barramento.
+    """
+    return jsonify(barramento.estatisticas())
+
 # ==========================
 # TRATAMENTO DE ERROS
 # ==========================
@@ -995,6 +3531,221 @@ def internal_error(e):
 def request_entity_too_large(e):
     return jsonify({'message': 'Arquivo muito grande. Máximo 5MB.'}), 413
 
+# ==========================
+# IMAGENS (flask --app app otimizar-imagens)
+# ==========================
+@app.cli.command('otimizar-imagens')
+@click.option('--refazer', is_flag=True, help='Reprocessa imagens já otimizadas')
+def otimizar_imagens(refazer):
+    """
+    Gera as variantes das imagens existentes em public/uploads e public/assets.
+    """
+    if Image is None:
+        raise click.ClickException('Pillow não instalado (pip install Pillow)')
+    executar_migracoes()
+    
+    conn = get_db(MENU_DB_PATH)
+    try:
+        ja_otimizadas = {row['original']: row['hash'] for row in
+                         conn.execute("SELECT original, hash FROM imagens_otimizadas").fetchall()}
+    finally:
+        conn.close()
+    
+    pastas = {'/uploads': UPLOAD_FOLDER, '/assets': os.path.join(app.static_folder, 'assets')}
+    total = 0
+    for prefixo, pasta in pastas.items():
+        if not os.path.isdir(pasta):
+            continue
+        for arquivo in sorted(os.listdir(pasta)):
+            caminho = os.path.join(pasta, arquivo)
+            if not os.path.isfile(caminho) or not arquivo.lower().endswith(IMAGENS_EXTENSOES):
+                continue
+            url = f"{prefixo}/{arquivo}"
+            if url in ja_otimizadas and not refazer:
+                continue
+            try:
+                otimizar_imagem(caminho, url)
+                total += 1
+            except Exception as e:
+                click.echo(f"⚠️ {url}: {e}")
+    click.echo(f"✅ {total} imagens otimizadas")
+
+@app.cli.command('manifesto-estatico')
+@click.option('--json', 'como_json', is_flag=True, help='Imprime só o mapa original → fingerprint')
+def manifesto_estatico_cli(como_json):
+    """
+    Mostra o manifesto de public/ com os tamanhos pré-comprimidos.
+    """
+    estado = manifesto_estatico.obter()
+    if como_json:
+        click.echo(json.dumps(estado['manifesto'], indent=2, ensure_ascii=False))
+        return
+    
+    for rel, arquivo in sorted(estado['originais'].items()):
+        destino = estado['manifesto'].get(rel, '(página, no-cache)')
+        tamanho = len(arquivo.corpo) if arquivo.corpo is not None else os.path.getsize(arquivo.caminho)
+        comprimidos = ' '.join(f"{cod}={len(dados)}" for cod, dados in sorted(arquivo.codificados.items()))
+        click.echo(f"{rel:28} → {destino:40} {tamanho:>9} B {comprimidos}")
+
+# ==========================
+# RESTAURAÇÃO (flask --app app restaurar-backup)
+# ==========================
+@app.cli.command('restaurar-backup')
+@click.argument('cadeia', required=False)
+@click.option('--ate', default=None, help='Ponto no tempo AAAAMMDD_HHMMSS (padrão: o último)')
+@click.option('--destino', default=None, help='Arquivo .db a gerar')
+def restaurar_backup(cadeia, ate, destino):
+    """
+    Reconstrói um banco a partir de uma cadeia incremental. Sem CADEIA, lista as cadeias.
+    """
+    if not cadeia:
+        for pasta, manifesto in listar_cadeias():
+            pontos = manifesto['pontos']
+            click.echo(f"{pasta}: {len(pontos)} pontos ({pontos[0]['timestamp']} → {pontos[-1]['timestamp']})")
+        return
+    
+    destino = destino or f"{cadeia}_restaurado.db"
+    if os.path.exists(destino):
+        raise click.ClickException(f"{destino} já existe")
+    timestamp = restaurar_cadeia(cadeia, destino, ate)
+    click.echo(f"✅ {destino} restaurado no ponto {timestamp}")
+
+# ==========================
+# ROLLUPS (flask --app app reconstruir-rollups)
+# ==========================
+@app.cli.command('reconstruir-rollups')
+@click.option('--desde', default=None, help='Refaz só a partir desta data (AAAA-MM-DD)')
+def reconstruir_rollups_cli(desde):
+    """
+    Backfill dos rollups de vendas a partir de acompanhamentos_vendidos.
+    """
+    executar_migracoes()
+    conn = get_db(PEDIDOS_DB_PATH)
+    try:
+        inicio = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        linhas = reconstruir_rollups(conn.cursor(), desde)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    click.echo(f"✅ Rollups reconstruídos: {linhas} linhas diárias ({time.perf_counter() - inicio:.2f}s)")
+
+# ==========================
+# SERVIDOR DE PRODUÇÃO (wsgi.py)
+# ==========================
+# Locks junto dos dados de runtime (pasta de backups), nunca na raiz do repositório
+LOCK_INIT_PATH = os.path.join(BACKUP_FOLDER, '.tudbom-init.lock')
+LOCK_LIDER_PATH = os.path.join(BACKUP_FOLDER, '.tudbom-lider.lock')
+
+class TravaArquivo:
+    """
+    Lock exclusivo entre processos sobre um arquivo (flock no Linux/macOS,
+    msvcrt no Windows). O sistema libera sozinho se o processo morrer.
+    """
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._arquivo = None
+    
+    def adquirir(self, bloquear=True):
+        os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+        arquivo = open(self.caminho, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | (0 if bloquear else fcntl.LOCK_NB))
+            else:
+                arquivo.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(arquivo.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not bloquear:
+                            raise
+                        time.sleep(0.5)
+        except OSError:
+            arquivo.close()
+            return False
+        self._arquivo = arquivo
+        return True
+    
+    def liberar(self):
+        if self._arquivo is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._arquivo.fileno(), fcntl.LOCK_UN)
+            else:
+                self._arquivo.seek(0)
+                msvcrt.locking(self._arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._arquivo.close()
+            self._arquivo = None
+    
+    def __enter__(self):
+        self.adquirir()
+        return self
+    
+    def __exit__(self, *exc):
+        self.liberar()
+
+_trava_lider = TravaArquivo(LOCK_LIDER_PATH)
+
+def candidatar_lider(tarefa):
+    """
+    Cada worker deixa uma thread esperando o lock de líder. Só uma segura por
+    vez; se o líder morrer, o lock é liberado e o próximo worker assume.
+    """
+    def esperar():
+        _trava_lider.adquirir(bloquear=True)
+        print(f"👑 Processo {os.getpid()} é o líder (backups e alertas de estoque aqui)")
+        try:
+            tarefa()
+        finally:
+            _trava_lider.liberar()
+    
+    Thread(target=esperar, daemon=True, name='candidato-lider').start()
+
+def inicializar_bancos():
+    """
+    Esquema base, tabelas, migrações, configurações padrão e reconciliação
+    de pedidos gravados pela metade.
+    """
+    garantir_schema_base()
+    init_pedidos_adicionais_db()
+    executar_migracoes()
+    init_config_db()
+    reconciliar_estoque_pedidos()
+
+_app_preparado = False
+_lock_create_app = Lock()
+
+def create_app(agendador=True):
+    """
+    Fábrica do servidor de produção (gunicorn/waitress, ver wsgi.py):
+    - inicialização dos bancos serializada por LOCK_INIT_PATH: o primeiro
+      worker aplica, os demais encontram tudo pronto (migrações idempotentes)
+    - backups e alertas de estoque só no worker que ganhar o lock de líder
+    As rotas ficam registradas no `app` do módulo; a fábrica prepara o
+    ambiente e devolve essa instância. Idempotente por processo: chamadas
+    seguintes só devolvem o mesmo `app`, sem reinicializar os bancos nem
+    candidatar outra thread a líder.
+    """
+    global _app_preparado
+    with _lock_create_app:
+        if _app_preparado:
+            return app
+        with TravaArquivo(LOCK_INIT_PATH):
+            inicializar_bancos()
+        if agendador:
+            candidatar_lider(tarefas_do_lider)
+        # Com BARRAMENTO_ENDERECO, eventos de um worker chegam às telas dos outros
+        iniciar_transporte_barramento()
+        _app_preparado = True
+    return app
+
 # ==========================
 # INICIALIZAÇÃO
 # ==========================
@@ -1010,16 +3761,17 @@ if __name__ == '__main__':
     print('=' * 50)
     
     # Garante esquema base antes de tudo
-    garantir_schema_base()
-    init_estoque_db()
-    init_pedidos_adicionais_db()
-    init_config_db()
+    inicializar_bancos()
     
     # Inicia backup automático
     iniciar_backup_automatico()
+    # ✅ Mesmo guard do backup: o monitor roda só no processo servido pelo reloader
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        projecao_estoque.iniciar_monitor()
     
     print('=' * 50)
     print('🚀 http://localhost:4000')
+    print('⚠️ Servidor de desenvolvimento. Produção: gunicorn -c gunicorn.conf.py wsgi:app')
     print('=' * 50)
     
     app.run(port=4000, debug=True)
\ No newline at end of file
@@ -0,0 +1,326 @@
+"""
+Backups dos bancos SQLite: cópia online pela API de backup do SQLite,
+compressão (zstd se instalado, senão gzip), cadeias incrementais por página
+e restauração. O agendamento (qual processo faz o backup e quando) fica em app.py.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import time
+from datetime import datetime
+from threading import Lock
+
+from werkzeug.utils import secure_filename
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ==========================
+# SISTEMA DE BACKUP
+# ==========================
+BACKUP_FOLDER = 'backups'
+BACKUP_INTERVAL = 3600  # 1 hora
+MAX_BACKUPS = 48  # Últimos 2 dias
+BACKUP_PAGINAS_POR_PASSO = 256  # Páginas copiadas por passo da API de backup
+BACKUP_PAUSA_PASSO = 0.005  # Segundos entre passos (libera o banco para os pedidos)
+BACKUP_COMPRESSAO = 'zstd' if zstandard else 'gzip'
+BACKUP_EXTENSOES = ('.db', '.db.gz', '.db.zst')
+_backup_lock = Lock()  # Manual e automático nunca escrevem a mesma cadeia juntos
+
+def criar_pasta_backup():
+    if not os.path.exists(BACKUP_FOLDER):
+        os.makedirs(BACKUP_FOLDER)
+        print(f"📁 Pasta de backups criada: {BACKUP_FOLDER}")
+
+def copiar_banco_online(origem, destino):
+    """
+    Cópia consistente de um banco em uso (inclui o que ainda está no -wal),
+    feita pela API de backup do SQLite em passos curtos com pausas,
+    para não segurar os escritores. Retorna o total de páginas copiadas.
+    """
+    progresso = {'paginas': 0}
+    
+    def pausar(status, restantes, total):
+        progresso['paginas'] = total
+        if restantes:
+            time.sleep(BACKUP_PAUSA_PASSO)
+    
+    conn_origem = sqlite3.connect(origem, timeout=10.0)
+    conn_destino = sqlite3.connect(destino)
+    try:
+        conn_origem.backup(conn_destino, pages=BACKUP_PAGINAS_POR_PASSO, progress=pausar)
+    finally:
+        conn_destino.close()
+        conn_origem.close()
+    return progresso['paginas']
+
+def comprimir_arquivo(origem, destino_base):
+    """
+    Comprime `origem` em streaming (zstd se instalado, senão gzip).
+    Grava num nome temporário e só renomeia no fim: um .gz/.zst truncado
+    (disco cheio, processo morto) nunca aparece como backup válido.
+    Retorna o caminho gerado.
+    """
+    destino = destino_base + ('.zst' if BACKUP_COMPRESSAO == 'zstd' else '.gz')
+    parcial = destino + '.parcial'
+    try:
+        if BACKUP_COMPRESSAO == 'zstd':
+            with open(origem, 'rb') as entrada, open(parcial, 'wb') as saida:
+                with zstandard.ZstdCompressor(level=10).stream_writer(saida) as compressor:
+                    shutil.copyfileobj(entrada, compressor, 1024 * 1024)
+        else:
+            with open(origem, 'rb') as entrada, gzip.open(parcial, 'wb', compresslevel=6) as saida:
+                shutil.copyfileobj(entrada, saida, 1024 * 1024)
+        os.replace(parcial, destino)
+    finally:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+    return destino
+
+def backup_banco(nome, arquivo, timestamp):
+    inicio = time.perf_counter()
+    backup_base = os.path.join(BACKUP_FOLDER, f"{nome}_backup_{timestamp}.db")
+    temporario = backup_base + '.tmp'
+    try:
+        paginas = copiar_banco_online(arquivo, temporario)
+        tamanho_original = os.path.getsize(temporario)
+        backup_path = comprimir_arquivo(temporario, backup_base)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    
+    tamanho = os.path.getsize(backup_path)
+    duracao = time.perf_counter() - inicio
+    taxa = tamanho_original / tamanho if tamanho else 0
+    print(f"✅ Backup: {os.path.basename(backup_path)} ({tamanho / (1024 * 1024):.2f} MB, "
+          f"{paginas} páginas, {duracao:.2f}s, compressão {taxa:.1f}x)")
+    return backup_path
+
+def fazer_backup(bancos):
+    """
+    Backup de cada banco {nome: caminho}; os de BACKUP_INCREMENTAL vão para a
+    cadeia incremental. Retorna False se algo falhou (o erro é só registrado).
+    """
+    try:
+        criar_pasta_backup()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        with _backup_lock:
+            for nome, arquivo in bancos.items():
+                if os.path.exists(arquivo):
+                    if nome in BACKUP_INCREMENTAL:
+                        backup_incremental(nome, arquivo, timestamp)
+                    else:
+                        backup_banco(nome, arquivo, timestamp)
+            
+            limpar_backups_antigos()
+        return True
+    except Exception as e:
+        print(f"❌ Erro ao fazer backup: {e}")
+        return False
+
+# ==========================
+# BACKUP INCREMENTAL (PÁGINAS ALTERADAS)
+# ==========================
+# Cadeia = pasta com um ponto base (todas as páginas) + deltas (só as páginas
+# que mudaram desde o ponto anterior). Todos os pontos usam o mesmo formato:
+#   cabeçalho DELTA_MAGICO + (page_size, total_paginas)
+#   repetido: (numero_pagina, bytes da página) ... terminado por pagina 0
+BACKUP_INCREMENTAL = {'pedidos'}  # Bancos com backup incremental
+BACKUP_INCREMENTAL_FOLDER = os.path.join(BACKUP_FOLDER, 'incremental')
+BACKUP_INCREMENTAL_MAX_DELTAS = 24  # Deltas por cadeia antes de um novo base
+BACKUP_INCREMENTAL_CADEIAS = 7  # Cadeias mantidas por banco
+DELTA_MAGICO = b'SQLDELTA1'
+
+def _hash_pagina(pagina):
+    return hashlib.blake2b(pagina, digest_size=8).digest()
+
+def _ler_manifesto(pasta):
+    with open(os.path.join(pasta, 'manifesto.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+def _gravar_atomico(caminho, dados):
+    temporario = caminho + '.tmp'
+    with open(temporario, 'wb') as f:
+        f.write(dados)
+    os.replace(temporario, caminho)
+
+def listar_cadeias(nome=None):
+    """
+    Cadeias incrementais (mais nova primeiro), opcionalmente de um banco.
+    """
+    if not os.path.isdir(BACKUP_INCREMENTAL_FOLDER):
+        return []
+    cadeias = []
+    for pasta in os.listdir(BACKUP_INCREMENTAL_FOLDER):
+        caminho = os.path.join(BACKUP_INCREMENTAL_FOLDER, pasta)
+        if not os.path.isfile(os.path.join(caminho, 'manifesto.json')):
+            continue
+        manifesto = _ler_manifesto(caminho)
+        if nome is None or manifesto['banco'] == nome:
+            cadeias.append((pasta, manifesto))
+    cadeias.sort(key=lambda c: c[1]['base'], reverse=True)
+    return cadeias
+
+def _gravar_ponto(arquivo_banco, destino, hashes_anteriores):
+    """
+    Grava as páginas de `arquivo_banco` cujo hash mudou. Uma passada só, em streaming.
+    Retorna (page_size, total_paginas, alteradas, hashes_novos).
+    """
+    conn = sqlite3.connect(arquivo_banco)
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    conn.close()
+    total = os.path.getsize(arquivo_banco) // page_size
+    
+    hashes = bytearray()
+    alteradas = 0
+    with open(arquivo_banco, 'rb') as entrada, gzip.open(destino, 'wb', compresslevel=6) as saida:
+        saida.write(DELTA_MAGICO + struct.pack('>II', page_size, total))
+        for numero in range(1, total + 1):
+            pagina = entrada.read(page_size)
+            digest = _hash_pagina(pagina)
+            hashes += digest
+            if hashes_anteriores[(numero - 1) * 8:numero * 8] != digest:
+                saida.write(struct.pack('>I', numero))
+                saida.write(pagina)
+                alteradas += 1
+        saida.write(struct.pack('>I', 0))
+    return page_size, total, alteradas, bytes(hashes)
+
+def backup_incremental(nome, arquivo, timestamp):
+    """
+    Adiciona um ponto à cadeia atual do banco (ou abre uma cadeia nova).
+    """
+    inicio = time.perf_counter()
+    os.makedirs(BACKUP_INCREMENTAL_FOLDER, exist_ok=True)
+    
+    cadeias = listar_cadeias(nome)
+    pasta = None
+    if cadeias and len(cadeias[0][1]['pontos']) <= BACKUP_INCREMENTAL_MAX_DELTAS:
+        pasta = os.path.join(BACKUP_INCREMENTAL_FOLDER, cadeias[0][0])
+        manifesto = cadeias[0][1]
+        # A base do próximo delta é sempre a que o manifesto registrou
+        with open(os.path.join(pasta, manifesto.get('hashes', 'hashes.bin')), 'rb') as f:
+            hashes_anteriores = f.read()
+    
+    temporario = os.path.join(BACKUP_INCREMENTAL_FOLDER, f"{nome}_{timestamp}.tmp")
+    try:
+        paginas_origem = copiar_banco_online(arquivo, temporario)
+        
+        if pasta is None:
+            pasta = os.path.join(BACKUP_INCREMENTAL_FOLDER, f"{nome}_{timestamp}")
+            os.makedirs(pasta)
+            manifesto = {'banco': nome, 'base': timestamp, 'page_size': None, 'pontos': []}
+            hashes_anteriores = b''
+        
+        arquivo_ponto = f"{'base' if not manifesto['pontos'] else 'delta'}_{timestamp}.bin.gz"
+        page_size, total, alteradas, hashes = _gravar_ponto(
+            temporario, os.path.join(pasta, arquivo_ponto), hashes_anteriores
+        )
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    
+    if manifesto['page_size'] not in (None, page_size):
+        # Mudou o page_size (VACUUM): o ponto vira base de uma cadeia nova
+        novo = os.path.join(BACKUP_INCREMENTAL_FOLDER, f"{nome}_{timestamp}")
+        os.makedirs(novo)
+        os.replace(os.path.join(pasta, arquivo_ponto), os.path.join(novo, f"base_{timestamp}.bin.gz"))
+        pasta, arquivo_ponto = novo, f"base_{timestamp}.bin.gz"
+        manifesto = {'banco': nome, 'base': timestamp, 'page_size': None, 'pontos': []}
+    
+    manifesto['page_size'] = page_size
+    manifesto['pontos'].append({
+        'timestamp': timestamp,
+        'arquivo': arquivo_ponto,
+        'paginas_total': total,
+        'paginas_alteradas': alteradas
+    })
+    # Hashes num arquivo novo por ponto e o manifesto por último: se o processo
+    # cair entre os dois, o manifesto ainda aponta para os hashes do ponto
+    # anterior, coerentes com os pontos que ele lista
+    manifesto['hashes'] = f"hashes_{timestamp}.bin"
+    _gravar_atomico(os.path.join(pasta, manifesto['hashes']), hashes)
+    _gravar_atomico(os.path.join(pasta, 'manifesto.json'),
+                    json.dumps(manifesto, indent=2).encode('utf-8'))
+    for arquivo in os.listdir(pasta):
+        # Hashes que nenhum manifesto referencia (o anterior, ou restos de queda)
+        if arquivo.startswith('hashes') and arquivo != manifesto['hashes']:
+            os.remove(os.path.join(pasta, arquivo))
+    
+    tamanho = os.path.getsize(os.path.join(pasta, arquivo_ponto))
+    print(f"✅ Backup incremental: {os.path.basename(pasta)}/{arquivo_ponto} "
+          f"({alteradas}/{paginas_origem} páginas, {tamanho / (1024 * 1024):.2f} MB, "
+          f"{time.perf_counter() - inicio:.2f}s)")
+    
+    # Retenção: cadeias inteiras, nunca pontos soltos
+    for pasta_antiga, _ in listar_cadeias(nome)[BACKUP_INCREMENTAL_CADEIAS:]:
+        shutil.rmtree(os.path.join(BACKUP_INCREMENTAL_FOLDER, pasta_antiga))
+        print(f"🗑️ Cadeia incremental removida: {pasta_antiga}")
+    
+    return pasta
+
+def restaurar_cadeia(cadeia, destino, ate=None):
+    """
+    Reconstrói o banco no ponto mais recente com timestamp <= `ate`
+    (ou no último ponto). Retorna o timestamp restaurado.
+    """
+    pasta = os.path.join(BACKUP_INCREMENTAL_FOLDER, secure_filename(cadeia))
+    manifesto = _ler_manifesto(pasta)
+    pontos = [p for p in manifesto['pontos'] if ate is None or p['timestamp'] <= ate]
+    if not pontos:
+        raise ValueError(f"Nenhum ponto em {cadeia} até {ate}")
+    
+    page_size = manifesto['page_size']
+    with open(destino, 'wb') as saida:
+        for ponto in pontos:
+            with gzip.open(os.path.join(pasta, ponto['arquivo']), 'rb') as entrada:
+                if entrada.read(len(DELTA_MAGICO)) != DELTA_MAGICO:
+                    raise ValueError(f"Arquivo inválido: {ponto['arquivo']}")
+                _, total = struct.unpack('>II', entrada.read(8))
+                while True:
+                    (numero,) = struct.unpack('>I', entrada.read(4))
+                    if numero == 0:
+                        break
+                    saida.seek((numero - 1) * page_size)
+                    saida.write(entrada.read(page_size))
+        saida.truncate(total * page_size)
+    
+    conn = sqlite3.connect(destino)
+    try:
+        resultado = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    if resultado != 'ok':
+        raise ValueError(f"Banco restaurado inconsistente: {resultado}")
+    return pontos[-1]['timestamp']
+
+def limpar_backups_antigos():
+    try:
+        arquivos = []
+        for arquivo in os.listdir(BACKUP_FOLDER):
+            if arquivo.endswith(BACKUP_EXTENSOES):
+                caminho = os.path.join(BACKUP_FOLDER, arquivo)
+                arquivos.append((caminho, os.path.getmtime(caminho)))
+        
+        arquivos.sort(key=lambda x: x[1], reverse=True)
+        
+        if len(arquivos) > MAX_BACKUPS:
+            for arquivo, _ in arquivos[MAX_BACKUPS:]:
+                os.remove(arquivo)
+                print(f"🗑️ Backup antigo removido: {os.path.basename(arquivo)}")
+    except Exception as e:
+        print(f"⚠️ Erro ao limpar backups: {e}")
+
+def backup_automatico(bancos):
+    print(f"🔄 Backup automático iniciado (a cada {BACKUP_INTERVAL/60:.0f} min)")
+    while True:
+        time.sleep(BACKUP_INTERVAL)
+        print(f"\n🕒 {datetime.now().strftime('%H:%M:%S')} - Backup automático...")
+        fazer_backup(bancos)
@@ -0,0 +1,385 @@
+"""
+Barramento de eventos pub/sub: filas limitadas por assinante, com política
+para quando enchem, e o transporte que liga os barramentos de vários
+processos por um socket local. A instância do processo fica em app.py.
+"""
+import hmac
+import json
+import os
+import queue
+import socket
+import time
+from collections import OrderedDict
+from datetime import datetime
+from fnmatch import fnmatchcase
+from threading import Condition, Lock, Thread
+
+# ==========================
+# BARRAMENTO DE EVENTOS (PUB/SUB)
+# ==========================
+BARRAMENTO_ENTRADA_MAX = 1000  # Eventos aguardando despacho; cheio = descarta (nunca bloqueia o pedido)
+BARRAMENTO_FILA_PADRAO = 100  # Eventos pendentes por assinante
+BARRAMENTO_POLITICAS = ('descartar_novo', 'descartar_antigo', 'coalescer')
+BARRAMENTO_ENDERECO = os.environ.get('BARRAMENTO_ENDERECO', '')  # '127.0.0.1:4010' ou 'unix:/tmp/tudbom-eventos.sock'
+BARRAMENTO_TOKEN = os.environ.get('BARRAMENTO_TOKEN', '')  # Obrigatório junto com BARRAMENTO_ENDERECO
+BARRAMENTO_PING = 15  # Segundos sem eventos antes de mandar um ping aos assinantes remotos
+
+class AssinaturaBarramento:
+    """
+    Fila limitada de um assinante, com a política para quando ela enche:
+    - descartar_novo: mantém o que já está na fila e perde o evento novo
+    - descartar_antigo: abre espaço jogando fora o mais velho
+    - coalescer: só o evento mais recente de cada chave (pedido) fica pendente
+    Com callback, o assinante ganha uma thread própria: consumidor lento
+    só atrasa a si mesmo.
+    """
+    def __init__(self, nome, topicos, politica='descartar_antigo', tamanho=BARRAMENTO_FILA_PADRAO, callback=None):
+        if politica not in BARRAMENTO_POLITICAS:
+            raise ValueError(f"Política inválida: {politica}")
+        self.nome = nome
+        self.topicos = list(topicos)
+        self.politica = politica
+        self.tamanho = max(1, int(tamanho))
+        self.ativa = True
+        self._pendentes = OrderedDict()
+        self._contador = 0
+        self._cond = Condition()
+        self._stats = {'entregues': 0, 'descartados': 0, 'coalescidos': 0}
+        if callback is not None:
+            Thread(target=self._consumir, args=(callback,), daemon=True, name=f'assinante-{nome}').start()
+    
+    def aceita(self, topico):
+        return any(fnmatchcase(topico, padrao) for padrao in self.topicos)
+    
+    def oferecer(self, evento):
+        with self._cond:
+            if not self.ativa:
+                return False
+            self._contador += 1
+            # Espaços de chave separados: a sequência interna nunca colide com o id do pedido
+            chave = ('seq', self._contador)
+            if self.politica == 'coalescer' and evento.get('chave') is not None:
+                chave = ('chave', evento['chave'])
+                if chave in self._pendentes:
+                    del self._pendentes[chave]
+                    self._stats['coalescidos'] += 1
+            
+            if len(self._pendentes) >= self.tamanho:
+                if self.politica == 'descartar_novo':
+                    self._stats['descartados'] += 1
+                    return False
+                self._pendentes.popitem(last=False)
+                self._stats['descartados'] += 1
+            
+            self._pendentes[chave] = evento
+            self._cond.notify()
+            return True
+    
+    def proximo(self, timeout=None):
+        """
+        Próximo evento, ou None no timeout / assinatura fechada.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._pendentes or not self.ativa, timeout=timeout)
+            if not self._pendentes:
+                return None
+            _, evento = self._pendentes.popitem(last=False)
+            self._stats['entregues'] += 1
+            return evento
+    
+    def fechar(self):
+        with self._cond:
+            self.ativa = False
+            self._cond.notify_all()
+    
+    def _consumir(self, callback):
+        while self.ativa:
+            evento = self.proximo()
+            if evento is None:
+                continue
+            try:
+                callback(evento)
+            except Exception as e:
+                print(f"⚠️ Assinante {self.nome}: {e}")
+    
+    def estatisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pendentes'] = len(self._pendentes)
+        stats.update({'topicos': self.topicos, 'politica': self.politica, 'tamanho': self.tamanho})
+        return stats
+
+class BarramentoEventos:
+    """
+    Pub/sub em processo do ciclo de vida dos pedidos (pedido.criado,
+    pedido.pronto, pedido.retirado, ...):
+    - publicar() só enfileira: a thread do pedido nunca espera consumidor
+      nem lê banco por causa de evento
+    - a thread de despacho prepara o evento (ex.: carrega o pedido uma vez)
+      e o oferece a cada assinante conforme a política dele
+    - com um TransporteBarramento, eventos atravessam processos
+    `origem` identifica o processo nos eventos (padrão: aleatório + pid).
+    """
+    def __init__(self, origem=None):
+        self.origem = origem or f"{os.urandom(4).hex()}-{os.getpid()}"
+        self._entrada = queue.Queue(maxsize=BARRAMENTO_ENTRADA_MAX)
+        self._assinaturas = []
+        self._lock = Lock()
+        self._thread = None
+        self._seq = 0
+        self.transporte = None
+        self._stats = {'publicados': 0, 'descartados_entrada': 0, 'despachados': 0, 'remotos': 0, 'erros': 0}
+    
+    def _iniciar(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = Thread(target=self._despachar, daemon=True, name='barramento-despacho')
+                    self._thread.start()
+    
+    def assinar(self, nome, topicos, politica='descartar_antigo', tamanho=BARRAMENTO_FILA_PADRAO, callback=None):
+        assinatura = AssinaturaBarramento(nome, topicos, politica, tamanho, callback)
+        with self._lock:
+            self._assinaturas.append(assinatura)
+        return assinatura
+    
+    def cancelar(self, assinatura):
+        assinatura.fechar()
+        with self._lock:
+            if assinatura in self._assinaturas:
+                self._assinaturas.remove(assinatura)
+    
+    def publicar(self, topico, dados, preparar=None):
+        """
+        Enfileira sem bloquear. `preparar(dados)` roda na thread de despacho e
+        devolve os dados finais (ou None para descartar). Retorna False se a
+        entrada estiver cheia.
+        """
+        self._iniciar()
+        try:
+            self._entrada.put_nowait((topico, dados, preparar, None))
+        except queue.Full:
+            with self._lock:
+                self._stats['descartados_entrada'] += 1
+            return False
+        with self._lock:
+            self._stats['publicados'] += 1
+        return True
+    
+    def receber_remoto(self, evento, exceto=None):
+        """
+        Evento vindo de outro processo: entregue aqui, sem reencaminhar.
+        """
+        self._iniciar()
+        try:
+            self._entrada.put_nowait((evento['topico'], evento, None, exceto or False))
+        except queue.Full:
+            with self._lock:
+                self._stats['descartados_entrada'] += 1
+    
+    def _despachar(self):
+        while True:
+            topico, dados, preparar, remoto = self._entrada.get()
+            try:
+                if remoto is None:
+                    if preparar is not None:
+                        dados = preparar(dados)
+                        if dados is None:
+                            continue
+                    with self._lock:
+                        self._seq += 1
+                        seq = self._seq
+                    evento = dict(dados, topico=topico, seq=seq, origem=self.origem,
+                                  ts=datetime.now().isoformat(timespec='seconds'))
+                else:
+                    evento = dados
+                
+                self.entregar(evento, exceto=remoto or None)
+                with self._lock:
+                    self._stats['despachados' if remoto is None else 'remotos'] += 1
+                if remoto is None and self.transporte is not None:
+                    self.transporte.encaminhar(evento)
+            except Exception as e:
+                with self._lock:
+                    self._stats['erros'] += 1
+                print(f"⚠️ Erro ao despachar {topico}: {e}")
+    
+    def entregar(self, evento, exceto=None):
+        with self._lock:
+            assinaturas = list(self._assinaturas)
+        for assinatura in assinaturas:
+            if assinatura is not exceto and assinatura.aceita(evento['topico']):
+                assinatura.oferecer(evento)
+    
+    def estatisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            assinaturas = list(self._assinaturas)
+        stats['entrada'] = self._entrada.qsize()
+        stats['transporte'] = self.transporte.estado() if self.transporte else None
+        stats['assinantes'] = {a.nome: a.estatisticas() for a in assinaturas}
+        return stats
+
+class TransporteBarramento:
+    """
+    Liga os barramentos de vários processos (workers, impressora, pager) por
+    NDJSON num socket local: TCP em loopback ou Unix socket.
+    - o primeiro processo que conseguir o endereço vira o servidor; os
+      outros conectam como clientes e reencaminham seus eventos por ele
+    - se o servidor cair, os clientes reconectam ou assumem o endereço
+    Protocolo (uma linha JSON por mensagem):
+      cliente → {"assinar": ["pedido.*"], "politica": "coalescer", "token": "..."}
+      cliente → {"publicar": {...evento...}}
+      servidor → {"evento": {...}} ou {"ping": "<hora>"}
+    Toda conexão precisa do token: qualquer processo da máquina alcança o
+    loopback, e sem ele poderia ler ou injetar eventos de pedidos.
+    """
+    def __init__(self, barramento, endereco, token):
+        if not token:
+            raise ValueError("TransporteBarramento exige um token não vazio")
+        self.barramento = barramento
+        self.endereco = endereco
+        self.token = token
+        self.modo = 'desconectado'
+        self._saida = None
+        self._lock_saida = Lock()
+    
+    def _familia(self):
+        if self.endereco.startswith('unix:'):
+            return socket.AF_UNIX, self.endereco[len('unix:'):]
+        host, _, porta = self.endereco.rpartition(':')
+        return socket.AF_INET, (host or '127.0.0.1', int(porta))
+    
+    def iniciar(self):
+        self.barramento.transporte = self
+        Thread(target=self._manter, daemon=True, name='barramento-transporte').start()
+    
+    def estado(self):
+        return {'endereco': self.endereco, 'modo': self.modo}
+    
+    def _manter(self):
+        while True:
+            servidor = self._abrir_servidor()
+            if servidor is not None:
+                self.modo = 'servidor'
+                print(f"📡 Barramento de eventos servindo em {self.endereco} (processo {os.getpid()})")
+                self._servir(servidor)
+            else:
+                try:
+                    self._cliente()
+                except OSError:
+                    pass
+            self.modo = 'desconectado'
+            time.sleep(1)
+    
+    def _abrir_servidor(self):
+        familia, endereco = self._familia()
+        servidor = socket.socket(familia, socket.SOCK_STREAM)
+        try:
+            if familia == socket.AF_UNIX and os.path.exists(endereco):
+                # Arquivo de socket órfão (servidor morreu): só remove se ninguém atender
+                teste = socket.socket(familia, socket.SOCK_STREAM)
+                try:
+                    teste.connect(endereco)
+                    teste.close()
+                    servidor.close()
+                    return None
+                except OSError:
+                    teste.close()
+                    os.remove(endereco)
+            servidor.bind(endereco)
+            servidor.listen(32)
+            return servidor
+        except OSError:
+            servidor.close()
+            return None
+    
+    def _servir(self, servidor):
+        while True:
+            conn, _ = servidor.accept()
+            Thread(target=self._atender, args=(conn,), daemon=True, name='barramento-conexao').start()
+    
+    def _atender(self, conn):
+        assinatura = None
+        try:
+            conn.settimeout(5)
+            arquivo = conn.makefile('rwb')
+            primeira = arquivo.readline()
+            if not primeira:
+                return  # Sonda de outro processo conferindo se o servidor está vivo
+            pedido = json.loads(primeira)
+            token = str(pedido.get('token') or '')
+            if not hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8')):
+                arquivo.write(b'{"erro": "token invalido"}\n')
+                arquivo.flush()
+                return
+            conn.settimeout(None)
+            
+            assinatura = self.barramento.assinar(
+                f"remoto-{id(conn):x}", pedido.get('assinar') or ['pedido.*'],
+                pedido.get('politica', 'descartar_antigo'),
+                pedido.get('tamanho', BARRAMENTO_FILA_PADRAO)
+            )
+            Thread(target=self._enviar_para, args=(arquivo, assinatura), daemon=True).start()
+            
+            for linha in arquivo:
+                mensagem = json.loads(linha)
+                if 'publicar' in mensagem:
+                    # Vai para todos os assinantes daqui, menos quem mandou
+                    self.barramento.receber_remoto(mensagem['publicar'], exceto=assinatura)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Conexão do barramento encerrada: {e}")
+        finally:
+            if assinatura is not None:
+                self.barramento.cancelar(assinatura)
+            conn.close()
+    
+    def _enviar_para(self, arquivo, assinatura):
+        try:
+            while assinatura.ativa:
+                evento = assinatura.proximo(timeout=BARRAMENTO_PING)
+                if evento is not None:
+                    mensagem = {'evento': evento}
+                elif assinatura.ativa:
+                    mensagem = {'ping': datetime.now().isoformat(timespec='seconds')}
+                else:
+                    break
+                arquivo.write(json.dumps(mensagem, ensure_ascii=False).encode('utf-8') + b'\n')
+                arquivo.flush()
+        except (OSError, ValueError):
+            self.barramento.cancelar(assinatura)
+    
+    def _cliente(self):
+        familia, endereco = self._familia()
+        conn = socket.socket(familia, socket.SOCK_STREAM)
+        conn.connect(endereco)
+        arquivo = conn.makefile('rwb')
+        arquivo.write(json.dumps({'assinar': ['*'], 'token': self.token}).encode('utf-8') + b'\n')
+        arquivo.flush()
+        with self._lock_saida:
+            self._saida = arquivo
+        self.modo = 'cliente'
+        print(f"📡 Barramento de eventos conectado a {self.endereco} (processo {os.getpid()})")
+        try:
+            for linha in arquivo:
+                mensagem = json.loads(linha)
+                if 'evento' in mensagem:
+                    self.barramento.receber_remoto(mensagem['evento'])
+        finally:
+            with self._lock_saida:
+                self._saida = None
+            conn.close()
+    
+    def encaminhar(self, evento):
+        """
+        Evento local de um processo cliente: manda para o servidor repassar.
+        (No servidor, os assinantes remotos já recebem pelo barramento local.)
+        """
+        with self._lock_saida:
+            if self._saida is None:
+                return
+            try:
+                self._saida.write(json.dumps({'publicar': evento}, ensure_ascii=False).encode('utf-8') + b'\n')
+                self._saida.flush()
+            except OSError:
+                self._saida = None
@@ -0,0 +1,268 @@
+"""
+Benchmarks e testes de carga, fora do app de produção (usam bancos temporários
+com o esquema dos bancos locais; nada é gravado nos bancos reais):
+
+    flask --app benchmarks bench-pedidos
+    flask --app benchmarks bench-commit-pedido [--pedidos N] [--synchronous FULL|NORMAL]
+    flask --app benchmarks carga-http --url http://127.0.0.1:4000
+
+A disputa de estoque entre totens é conferida em tests/test_estoque_concorrencia.py.
+"""
+import http.client
+import os
+import sqlite3
+import tempfile
+import time
+from threading import Lock, Thread
+from urllib.parse import urlsplit
+
+import click
+
+from app import (
+    app, abrir_conexao, garantir_schema_base, init_pedidos_adicionais_db, executar_migracoes,
+    hidratar_pedidos, gravar_pedido, planejar_pedido, reservar_estoque, registrar_baixas_pedido, SnapshotCatalogo,
+    MENU_DB_PATH, PEDIDOS_DB_PATH
+)
+
+def _criar_banco_benchmark(origem):
+    """
+    Cria um banco temporário com o mesmo esquema de `origem`.
+    """
+    fd, caminho = tempfile.mkstemp(suffix='.db', prefix='bench_')
+    os.close(fd)
+    conn_origem = sqlite3.connect(origem)
+    ddl = conn_origem.execute(
+        "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+        "ORDER BY type = 'index'"
+    ).fetchall()
+    conn_origem.close()
+    
+    conn = abrir_conexao(caminho)
+    for (sql,) in ddl:
+        conn.execute(sql)
+    conn.commit()
+    return conn, caminho
+
+def _hidratar_pedidos_n_mais_1(conn, pedidos_rows):
+    """
+    Implementação antiga (uma query por pedido e por item), mantida como referência.
+    """
+    lista = []
+    for pedido in pedidos_rows:
+        itens = []
+        for item in conn.execute("SELECT * FROM itens_pedido WHERE pedido_id = ?", (pedido['id'],)).fetchall():
+            item_dict = dict(item)
+            item_dict['adicionais'] = [dict(ad) for ad in conn.execute(
+                "SELECT * FROM adicionais_pedido WHERE item_pedido_id = ?", (item['id'],)
+            ).fetchall()]
+            itens.append(item_dict)
+        lista.append({**dict(pedido), 'itens': itens})
+    return lista
+
+def _medir(conn, funcao, repeticoes):
+    """
+    Retorna (queries por execução, ms por execução).
+    """
+    queries = [0]
+    conn.set_trace_callback(lambda _sql: queries.__setitem__(0, queries[0] + 1))
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    ms = (time.perf_counter() - inicio) * 1000 / repeticoes
+    conn.set_trace_callback(None)
+    return queries[0] // repeticoes, ms
+
+@app.cli.command('bench-pedidos')
+@click.option('--tamanhos', default='10,30,60,120,240', help='Quantidades de pedidos abertos')
+@click.option('--itens', default=3, help='Itens por pedido')
+@click.option('--adicionais', default=2, help='Adicionais por item')
+@click.option('--repeticoes', default=20)
+def bench_pedidos(tamanhos, itens, adicionais, repeticoes):
+    """
+    Compara a hidratação N+1 com a hidratação em lote do GET /api/pedidos.
+    """
+    garantir_schema_base()
+    init_pedidos_adicionais_db()
+    executar_migracoes()
+    conn, caminho = _criar_banco_benchmark(PEDIDOS_DB_PATH)
+    try:
+        click.echo(f"{'pedidos':>8} {'q N+1':>7} {'ms N+1':>9} {'q lote':>7} {'ms lote':>9} {'ganho':>7}")
+        total = 0
+        for alvo in sorted(int(t) for t in tamanhos.split(',')):
+            while total < alvo:
+                cur = conn.execute(
+                    "INSERT INTO pedidos (cliente_nome, tipo_pedido, valor_total, data_hora, status) "
+                    "VALUES ('Bench', 'agora', 10, '2025-01-01 12:00:00', 'recebido')"
+                )
+                pedido_id = cur.lastrowid
+                for i in range(itens):
+                    item_id = conn.execute(
+                        "INSERT INTO itens_pedido (pedido_id, produto_nome, quantidade, valor_unitario) "
+                        "VALUES (?, ?, 1, 10)", (pedido_id, f'Produto {i}')
+                    ).lastrowid
+                    conn.executemany(
+                        "INSERT INTO adicionais_pedido (item_pedido_id, adicional_nome, quantidade, valor_unitario) "
+                        "VALUES (?, ?, 1, 2)", [(item_id, f'Adicional {a}') for a in range(adicionais)]
+                    )
+                total += 1
+            conn.commit()
+            
+            def carregar():
+                return conn.execute("SELECT * FROM pedidos WHERE status IN ('recebido', 'pronto') ORDER BY id").fetchall()
+            
+            q_antigo, ms_antigo = _medir(conn, lambda: _hidratar_pedidos_n_mais_1(conn, carregar()), repeticoes)
+            q_novo, ms_novo = _medir(conn, lambda: hidratar_pedidos(conn, carregar()), repeticoes)
+            click.echo(f"{alvo:>8} {q_antigo:>7} {ms_antigo:>9.2f} {q_novo:>7} {ms_novo:>9.2f} {ms_antigo / ms_novo:>6.1f}x")
+    finally:
+        conn.close()
+        os.remove(caminho)
+
+def _remover_banco_benchmark(caminho):
+    for sufixo in ('', '-wal', '-shm'):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+
+@app.cli.command('bench-commit-pedido')
+@click.option('--pedidos', default=500, help='Pedidos gravados em cada modo')
+@click.option('--synchronous', type=click.Choice(['FULL', 'NORMAL']), default='FULL')
+def bench_commit_pedido(pedidos, synchronous):
+    """
+    Pedidos/s gravando em dois commits (um por banco) vs. um commit com ATTACH.
+    Em WAL cada arquivo ainda sincroniza o próprio -wal: a diferença medida é
+    de ida e volta de lock/commit, não de fsync.
+    """
+    garantir_schema_base()
+    init_pedidos_adicionais_db()
+    executar_migracoes()
+    conn_menu, caminho_menu = _criar_banco_benchmark(MENU_DB_PATH)
+    conn_pedidos, caminho_pedidos = _criar_banco_benchmark(PEDIDOS_DB_PATH)
+    conn_anexado = None
+    try:
+        conn_menu.execute("INSERT INTO categorias (id, nome) VALUES (1, 'Bench')")
+        conn_menu.execute("INSERT INTO produtos (id, nome, preco, categoria_id, estoque) VALUES (1, 'Açaí', 10, 1, ?)",
+                          (pedidos * 4,))
+        conn_menu.execute("INSERT INTO adicionais (id, nome, preco, categoria_id, estoque) VALUES (1, 'Granola', 2, 1, ?)",
+                          (pedidos * 4,))
+        conn_menu.commit()
+        catalogo = SnapshotCatalogo(
+            0,
+            conn_menu.execute("SELECT id, nome FROM categorias").fetchall(),
+            conn_menu.execute("SELECT id, nome, preco, imagem, categoria_id, estoque FROM produtos").fetchall(),
+            conn_menu.execute("SELECT id, nome, preco, categoria_id, estoque FROM adicionais").fetchall()
+        )
+        plano = planejar_pedido([{'produto_id': 1, 'quantidade': 1, 'adicionais': [{'nome': 'Granola'}]}], catalogo)
+        
+        conn_anexado = abrir_conexao(caminho_pedidos, anexos=(('menu', caminho_menu),))
+        for conn, bancos in ((conn_menu, ['main']), (conn_pedidos, ['main']), (conn_anexado, ['main', 'menu'])):
+            for banco in bancos:
+                conn.execute(f"PRAGMA {banco}.synchronous = {synchronous}")
+        
+        def dois_commits():
+            reservar_estoque(conn_menu.cursor(), plano)
+            pedido_id = gravar_pedido(conn_pedidos.cursor(), plano, 'Bench', 'agora')
+            registrar_baixas_pedido(conn_menu.cursor(), plano, pedido_id)
+            conn_pedidos.commit()
+            conn_menu.commit()
+            return pedido_id
+        
+        def um_commit():
+            conn_anexado.execute("BEGIN IMMEDIATE")
+            cursor = conn_anexado.cursor()
+            reservar_estoque(cursor, plano, 'menu')
+            pedido_id = gravar_pedido(cursor, plano, 'Bench', 'agora')
+            registrar_baixas_pedido(cursor, plano, pedido_id, 'menu')
+            conn_anexado.commit()
+            return pedido_id
+        
+        click.echo(f"synchronous={synchronous}, {pedidos} pedidos por modo")
+        click.echo(f"{'modo':<22} {'commits':>8} {'pedidos/s':>10} {'ms/pedido':>10}")
+        resultados = {}
+        for nome, funcao, commits in (('dois commits', dois_commits, 2), ('ATTACH + um commit', um_commit, 1)):
+            inicio = time.perf_counter()
+            for _ in range(pedidos):
+                funcao()
+            segundos = time.perf_counter() - inicio
+            resultados[nome] = pedidos / segundos
+            click.echo(f"{nome:<22} {commits * pedidos:>8} {pedidos / segundos:>10.0f} {segundos * 1000 / pedidos:>10.3f}")
+        
+        estoque = conn_anexado.execute("SELECT estoque FROM menu.produtos WHERE id = 1").fetchone()[0]
+        total = conn_anexado.execute("SELECT COUNT(*) FROM pedidos").fetchone()[0]
+        click.echo(f"ganho: {resultados['ATTACH + um commit'] / resultados['dois commits']:.2f}x "
+                   f"(pedidos={total}, estoque final={estoque}, esperado={pedidos * 2})")
+    finally:
+        for conn in (conn_menu, conn_pedidos, conn_anexado):
+            if conn is not None:
+                conn.close()
+        _remover_banco_benchmark(caminho_menu)
+        _remover_banco_benchmark(caminho_pedidos)
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+@app.cli.command('carga-http')
+@click.option('--url', 'urls', multiple=True, required=True,
+              help='Servidor alvo, ex. http://127.0.0.1:4000 (repita para comparar)')
+@click.option('--rota', 'rotas', multiple=True,
+              default=['/api/pedidos?status=recebido,pronto&public=true', '/api/menu', '/api/config'],
+              help='Rotas GET usadas em rodízio (repita para várias)')
+@click.option('--concorrencia', default=16, help='Clientes simultâneos (keep-alive)')
+@click.option('--duracao', default=10.0, help='Segundos por servidor')
+def carga_http(urls, rotas, concorrencia, duracao):
+    """
+    Teste de carga simples contra servidores já rodando, ex.:
+    dev server (python app.py) vs. gunicorn -c gunicorn.conf.py wsgi:app
+    """
+    click.echo(f"{concorrencia} clientes, {duracao:.0f}s por servidor, rotas: {', '.join(rotas)}")
+    click.echo(f"{'servidor':<28} {'reqs':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>6}")
+    
+    for url in urls:
+        alvo = urlsplit(url)
+        latencias, erros = [], [0]
+        lock = Lock()
+        fim = time.perf_counter() + duracao
+        
+        def cliente(indice):
+            conn = None
+            locais, falhas, n = [], 0, indice
+            while time.perf_counter() < fim:
+                rota = rotas[n % len(rotas)]
+                n += 1
+                try:
+                    if conn is None:
+                        conn = http.client.HTTPConnection(alvo.hostname, alvo.port or 80, timeout=30)
+                    inicio = time.perf_counter()
+                    conn.request('GET', rota, headers={'Accept-Encoding': 'gzip'})
+                    resp = conn.getresponse()
+                    resp.read()
+                    if resp.status >= 500:
+                        falhas += 1
+                    else:
+                        locais.append((time.perf_counter() - inicio) * 1000)
+                    if resp.getheader('Connection', '').lower() == 'close':
+                        conn.close()
+                        conn = None
+                except (OSError, http.client.HTTPException):
+                    falhas += 1
+                    if conn is not None:
+                        conn.close()
+                    conn = None
+            if conn is not None:
+                conn.close()
+            with lock:
+                latencias.extend(locais)
+                erros[0] += falhas
+        
+        inicio = time.perf_counter()
+        clientes = [Thread(target=cliente, args=(i,)) for i in range(concorrencia)]
+        for t in clientes:
+            t.start()
+        for t in clientes:
+            t.join()
+        segundos = time.perf_counter() - inicio
+        
+        latencias.sort()
+        click.echo(f"{url:<28} {len(latencias):>7} {len(latencias) / segundos:>8.0f} "
+                   f"{_percentil(latencias, 0.50):>8.1f} {_percentil(latencias, 0.95):>8.1f} "
+                   f"{_percentil(latencias, 0.99):>8.1f} {erros[0]:>6}")
@@ -0,0 +1,179 @@
+"""
+Arquivos estáticos de public/ com fingerprint: nomes com hash do conteúdo
+(Cache-Control: immutable), referências reescritas nas páginas e versões
+gzip/br calculadas uma vez. As rotas que servem os arquivos ficam em app.py.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import time
+from threading import Lock
+
+from flask import Response, current_app, request, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ==========================
+# ARQUIVOS ESTÁTICOS (FINGERPRINT)
+# ==========================
+ESTATICOS_TEXTO = {'.html', '.js', '.css', '.svg', '.json', '.txt'}
+ESTATICOS_IGNORADOS = {'uploads'}  # Conteúdo enviado pelo admin, servido à parte
+ESTATICOS_MAX_AGE = 365 * 24 * 3600
+ESTATICOS_RECARGA = 2  # Segundos entre verificações de mtime (só em debug)
+
+def _hash_arquivo(caminho):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+def _nome_fingerprint(rel, digest):
+    base, ext = os.path.splitext(rel)
+    return f"{base}.{digest[:10]}{ext}"
+
+def _reescritor(manifesto):
+    """
+    Troca referências entre aspas/parênteses ('assets/loop1.jpg', "/script.js",
+    url(style.css)) pelo nome com fingerprint. Caminhos relativos à raiz de public/.
+    """
+    if not manifesto:
+        return lambda texto: texto
+    alternativas = '|'.join(re.escape(rel) for rel in sorted(manifesto, key=len, reverse=True))
+    padrao = re.compile(r'(?<=["\'(])(/?)(' + alternativas + r')(?=["\')?#])')
+    return lambda texto: padrao.sub(lambda m: m.group(1) + manifesto[m.group(2)], texto)
+
+class ArquivoEstatico:
+    """
+    Um arquivo do manifesto. Texto fica em memória já reescrito, com as versões
+    gzip/br calculadas uma única vez; binários são servidos direto do disco.
+    """
+    def __init__(self, caminho, corpo=None):
+        self.caminho = caminho
+        self.mimetype = mimetypes.guess_type(caminho)[0] or 'application/octet-stream'
+        self.corpo = corpo
+        self.hash = hashlib.sha256(corpo).hexdigest() if corpo is not None else _hash_arquivo(caminho)
+        self.codificados = {}
+        if corpo is not None:
+            self.codificados['gzip'] = gzip.compress(corpo, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.codificados['br'] = brotli.compress(corpo, quality=11)
+            # Arquivos minúsculos podem crescer comprimidos
+            self.codificados = {cod: dados for cod, dados in self.codificados.items() if len(dados) < len(corpo)}
+    
+    def _codificacao(self):
+        for cod in ('br', 'gzip'):
+            if cod in self.codificados and request.accept_encodings[cod]:
+                return cod
+        return None
+    
+    def resposta(self, imutavel):
+        if self.corpo is None:
+            resp = send_file(self.caminho, mimetype=self.mimetype, etag=self.hash[:20], conditional=True)
+        else:
+            cod = self._codificacao()
+            resp = Response(self.codificados.get(cod, self.corpo), mimetype=self.mimetype)
+            if cod:
+                resp.headers['Content-Encoding'] = cod
+            resp.vary.add('Accept-Encoding')
+            resp.set_etag(self.hash[:20] + (f'-{cod}' if cod else ''))
+            resp = resp.make_conditional(request)
+        
+        if imutavel:
+            resp.cache_control.no_cache = None
+            resp.cache_control.public = True
+            resp.cache_control.max_age = ESTATICOS_MAX_AGE
+            resp.cache_control.immutable = True
+        else:
+            # Páginas e nomes sem fingerprint: sempre revalida (barato com ETag)
+            resp.cache_control.no_cache = True
+            resp.cache_control.max_age = None
+        return resp
+
+class ManifestoEstatico:
+    """
+    Mapeia cada arquivo de public/ para um nome com hash do conteúdo:
+    - binários (imagens) primeiro, depois JS/CSS reescritos, depois as páginas HTML
+    - nomes com fingerprint → Cache-Control: immutable
+    - páginas e nomes originais → no-cache + ETag (referências já reescritas)
+    """
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self._lock = Lock()
+        self._estado = None
+        self._verificado = 0
+    
+    def _listar(self):
+        arquivos = []
+        for raiz, dirs, nomes in os.walk(self.pasta):
+            if os.path.samefile(raiz, self.pasta):
+                dirs[:] = [d for d in dirs if d not in ESTATICOS_IGNORADOS]
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for nome in nomes:
+                if nome.startswith('.'):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                st = os.stat(caminho)
+                rel = os.path.relpath(caminho, self.pasta).replace(os.sep, '/')
+                arquivos.append((rel, caminho, st.st_mtime_ns, st.st_size))
+        return sorted(arquivos)
+    
+    def _construir(self, arquivos):
+        inicio = time.perf_counter()
+        manifesto = {}      # 'assets/loop1.jpg' -> 'assets/loop1.<hash>.jpg'
+        fingerprint = {}    # nome com hash -> ArquivoEstatico
+        originais = {}      # nome original -> ArquivoEstatico
+        
+        def extensao(rel):
+            return os.path.splitext(rel)[1].lower()
+        
+        def registrar(rel, arquivo, com_hash=True):
+            originais[rel] = arquivo
+            if com_hash:
+                manifesto[rel] = _nome_fingerprint(rel, arquivo.hash)
+                fingerprint[manifesto[rel]] = arquivo
+        
+        binarios = [a for a in arquivos if extensao(a[0]) not in ESTATICOS_TEXTO]
+        textos = [a for a in arquivos if extensao(a[0]) in ESTATICOS_TEXTO and extensao(a[0]) != '.html']
+        paginas = [a for a in arquivos if extensao(a[0]) == '.html']
+        
+        for rel, caminho, _, _ in binarios:
+            registrar(rel, ArquivoEstatico(caminho))
+        
+        for grupo, com_hash in ((textos, True), (paginas, False)):
+            reescrever = _reescritor(dict(manifesto))
+            for rel, caminho, _, _ in grupo:
+                with open(caminho, 'rb') as f:
+                    bruto = f.read()
+                try:
+                    corpo = reescrever(bruto.decode('utf-8')).encode('utf-8')
+                except UnicodeDecodeError:
+                    corpo = bruto
+                registrar(rel, ArquivoEstatico(caminho, corpo), com_hash)
+        
+        print(f"🗂️ Manifesto estático: {len(manifesto)} arquivos com fingerprint, "
+              f"{len(paginas)} páginas ({time.perf_counter() - inicio:.2f}s)")
+        return {
+            'assinatura': [(a[0], a[2], a[3]) for a in arquivos],
+            'manifesto': manifesto,
+            'fingerprint': fingerprint,
+            'originais': originais
+        }
+    
+    def obter(self):
+        with self._lock:
+            agora = time.monotonic()
+            if self._estado is not None and (not current_app.debug or agora - self._verificado < ESTATICOS_RECARGA):
+                return self._estado
+            
+            self._verificado = agora
+            arquivos = self._listar()
+            assinatura = [(a[0], a[2], a[3]) for a in arquivos]
+            if self._estado is None or self._estado['assinatura'] != assinatura:
+                self._estado = self._construir(arquivos)
+            return self._estado
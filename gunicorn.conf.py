@@ -0,0 +1,36 @@
+"""
+Configuração do gunicorn (Linux/macOS).
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Modos (variáveis de ambiente):
+- threaded (padrão): WEB_WORKERS=1 com WEB_THREADS threads (gthread). Um
+  único processo com o hub de SSE, o cache do cardápio e o gravador de
+  pedidos compartilhados por todas as conexões.
+- multi-worker: WEB_WORKERS=N. Inicialização dos bancos e backups continuam
+  rodando uma vez só (locks em app.create_app). Defina BARRAMENTO_ENDERECO
+  (ex.: 127.0.0.1:4010 ou unix:/tmp/tudbom-eventos.sock) e BARRAMENTO_TOKEN
+  para os workers trocarem eventos; sem o endereço, telas SSE só recebem os
+  pedidos do mesmo worker e os alertas de estoque ficam desligados; o
+  endereço sem token impede a inicialização.
+
+Cada SSE/long-poll aberto ocupa uma thread: dimensione WEB_THREADS para
+telas conectadas + totens.
+"""
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '4000')}")
+workers = int(os.environ.get('WEB_WORKERS', '1'))
+threads = int(os.environ.get('WEB_THREADS', '16'))
+worker_class = 'gthread'
+
+# /api/pedidos/stream e /api/pedidos/eventos seguram a conexão
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# Cada worker chama create_app() depois do fork (conexões SQLite não atravessam fork)
+preload_app = False
+
+accesslog = os.environ.get('ACCESS_LOG')  # '-' para stdout
+errorlog = '-'
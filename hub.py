@@ -0,0 +1,174 @@
+"""
+Hub de eventos de pedidos para as telas (cozinha, status): fan-out para SSE
+e long-polling, com histórico curto para reconexão. A instância do processo,
+ligada ao barramento, fica em app.py.
+"""
+import json
+import queue
+from collections import deque
+from threading import Condition, Lock
+
+# ==========================
+# HUB DE EVENTOS DE PEDIDOS (SSE / LONG-POLLING)
+# ==========================
+HUB_HISTORICO = 500  # Eventos mantidos para long-polling e reconexão
+HUB_FILA_MAX = 100  # Eventos pendentes por tela antes de desconectá-la
+HUB_KEEPALIVE = 15  # Segundos entre comentários de keep-alive no SSE
+
+class EventoPedido:
+    """
+    Mudança em um pedido. A serialização é feita uma vez por variante
+    (tipo efetivo x modo público) e compartilhada por todas as telas.
+    """
+    def __init__(self, seq, tipo, pedido, status_anterior=None, cursor=None):
+        self.seq = seq
+        self.cursor = cursor if cursor is not None else str(seq)
+        self.tipo = tipo  # 'criado' | 'status'
+        self.pedido = pedido
+        self.status_anterior = status_anterior
+        self._cache = {}
+        self._lock = Lock()
+    
+    def para(self, status_filter):
+        """
+        Tipo do evento visto por quem acompanha `status_filter` (ou None).
+        """
+        if self.pedido['status'] in status_filter:
+            return 'pedido_criado' if self.tipo == 'criado' else 'pedido_atualizado'
+        if self.tipo == 'status' and self.status_anterior in status_filter:
+            return 'pedido_removido'
+        return None
+    
+    def dados(self, tipo, modo_publico):
+        if tipo == 'pedido_removido':
+            return {'id': self.pedido['id'], 'status': self.pedido['status']}
+        if modo_publico:
+            return {k: v for k, v in self.pedido.items() if k != 'cliente_nome'}
+        return self.pedido
+    
+    def sse(self, tipo, modo_publico):
+        chave = (tipo, modo_publico)
+        mensagem = self._cache.get(chave)
+        if mensagem is None:
+            with self._lock:
+                mensagem = self._cache.get(chave)
+                if mensagem is None:
+                    dados = json.dumps(self.dados(tipo, modo_publico), ensure_ascii=False)
+                    mensagem = f"id: {self.cursor}\nevent: {tipo}\ndata: {dados}\n\n".encode('utf-8')
+                    self._cache[chave] = mensagem
+        return mensagem
+
+class AssinanteHub:
+    def __init__(self, status_filter, modo_publico):
+        self.status_filter = status_filter
+        self.modo_publico = modo_publico
+        self.fila = queue.Queue(maxsize=HUB_FILA_MAX)
+        self.atrasado = False
+
+class HubPedidos:
+    """
+    Fan-out das mudanças de pedidos para as telas (cozinha, status).
+    publicar() nunca bloqueia: tela que não consome é marcada como atrasada
+    e desconectada (ela reconecta e recebe um snapshot novo).
+    Cursores (id do SSE, ?since=) são '<época>:<seq>': seq recomeça em 0 a
+    cada processo, então cursor de outra época (reinício, outro worker) não
+    vale aqui e leva a um snapshot novo.
+    Se o barramento descartar eventos antes de chegarem aqui, ressincronizar()
+    abre uma época nova: todas as telas voltam a partir de um snapshot.
+    `processo` é a época inicial: única por processo (ex.: boot id + pid).
+    """
+    def __init__(self, processo):
+        self._processo = processo
+        self._geracao = 0
+        self.epoca = self._processo
+        self._seq = 0
+        self._eventos = deque(maxlen=HUB_HISTORICO)
+        self._assinantes = set()
+        self._cond = Condition()
+    
+    @property
+    def seq(self):
+        return self._seq
+    
+    def assinar(self, status_filter, modo_publico):
+        assinante = AssinanteHub(status_filter, modo_publico)
+        with self._cond:
+            self._assinantes.add(assinante)
+        return assinante
+    
+    def cancelar(self, assinante):
+        with self._cond:
+            self._assinantes.discard(assinante)
+    
+    def publicar(self, tipo, pedido, status_anterior=None):
+        with self._cond:
+            self._seq += 1
+            evento = EventoPedido(self._seq, tipo, pedido, status_anterior, self.cursor(self._seq))
+            self._eventos.append(evento)
+            assinantes = list(self._assinantes)
+            self._cond.notify_all()
+        
+        for assinante in assinantes:
+            if assinante.atrasado or evento.para(assinante.status_filter) is None:
+                continue
+            try:
+                assinante.fila.put_nowait(evento)
+            except queue.Full:
+                assinante.atrasado = True
+        return evento
+    
+    def ressincronizar(self):
+        """
+        Invalida cursores e histórico (houve eventos perdidos no caminho) e
+        desconecta as telas: ao reconectar, o cursor da época velha leva a snapshot.
+        """
+        with self._cond:
+            self._geracao += 1
+            self.epoca = f"{self._processo}r{self._geracao}"
+            self._seq += 1  # Long-polls parados em aguardar() acordam e caem no reset
+            self._eventos.clear()
+            assinantes = list(self._assinantes)
+            self._cond.notify_all()
+        
+        for assinante in assinantes:
+            assinante.atrasado = True
+            try:
+                assinante.fila.put_nowait(None)  # Acorda o SSE sem esperar o keep-alive
+            except queue.Full:
+                pass
+    
+    def cursor(self, seq):
+        return f"{self.epoca}:{seq}"
+    
+    def ler_cursor(self, cursor):
+        """
+        seq do cursor, ou None se for de outra época, malformado ou à frente
+        deste processo (nesses casos o cliente precisa de snapshot).
+        """
+        epoca, _, seq = (cursor or '').partition(':')
+        if epoca != self.epoca or not seq.isdigit():
+            return None
+        seq = int(seq)
+        return seq if seq <= self._seq else None
+    
+    def eventos_desde(self, seq):
+        """
+        Eventos com seq > `seq`, ou None se já saíram do histórico
+        (ou se `seq` é de um contador que este processo nunca atingiu).
+        """
+        with self._cond:
+            if seq > self._seq:
+                return None
+            if seq == self._seq:
+                return []
+            if not self._eventos or self._eventos[0].seq > seq + 1:
+                return None
+            return [e for e in self._eventos if e.seq > seq]
+    
+    def aguardar(self, seq, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout=timeout)
+    
+    def conectados(self):
+        with self._cond:
+            return len(self._assinantes)
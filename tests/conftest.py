@@ -0,0 +1,55 @@
+"""
+Fixtures dos testes.
+
+app.py usa caminhos relativos (sorveteria.db, pedidos.db, config.db), então a
+sessão roda numa pasta temporária com CÓPIAS dos bancos versionados no
+repositório: os testes exercitam o esquema real sem nunca alterar os originais.
+"""
+import os
+import shutil
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BANCOS = ('sorveteria.db', 'pedidos.db', 'config.db')
+
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+
+@pytest.fixture(scope='session')
+def pasta_dados(tmp_path_factory):
+    pasta = tmp_path_factory.mktemp('dados')
+    for nome in BANCOS:
+        # O -wal leva commits ainda não transferidos para o arquivo principal
+        for sufixo in ('', '-wal'):
+            origem = os.path.join(RAIZ, nome + sufixo)
+            if os.path.exists(origem):
+                shutil.copy(origem, pasta / (nome + sufixo))
+    return pasta
+
+
+@pytest.fixture(scope='session')
+def modulo_app(pasta_dados):
+    anterior = os.getcwd()
+    os.chdir(pasta_dados)
+    try:
+        import app as modulo
+        modulo.inicializar_bancos()
+        yield modulo
+    finally:
+        os.chdir(anterior)
+
+
+@pytest.fixture
+def cliente(modulo_app):
+    return modulo_app.app.test_client()
+
+
+@pytest.fixture
+def admin(modulo_app):
+    cliente = modulo_app.app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao['logged_in'] = True
+    return cliente
@@ -0,0 +1,64 @@
+"""
+Alertas de estoque chegam ao painel admin por SSE, não só ao terminal.
+"""
+import json
+import time
+
+
+def eventos_sse(resposta):
+    for bloco in resposta.response:
+        bloco = bloco.decode('utf-8')
+        if bloco.startswith('event:'):
+            cabecalho, dados = bloco.strip().split('\n', 1)
+            yield cabecalho[len('event: '):], json.loads(dados[len('data: '):])
+
+
+def esperar(condicao, limite=5.0):
+    fim = time.monotonic() + limite
+    while not condicao() and time.monotonic() < fim:
+        time.sleep(0.01)
+    return condicao()
+
+
+ALERTA = {'tabela': 'produtos', 'id': 99, 'nome': 'Teste', 'estoque': 2,
+          'minutos_restantes': 10.0, 'alerta': 'baixo', 'chave': 'produtos:99'}
+
+
+def test_stream_exige_login(cliente):
+    assert cliente.get('/api/estoque/alertas/stream').status_code == 401
+
+
+def test_stream_entrega_alerta_e_normalizacao(modulo_app, admin):
+    resposta = admin.get('/api/estoque/alertas/stream', buffered=False)
+    eventos = eventos_sse(resposta)
+    try:
+        tipo, dados = next(eventos)
+        assert tipo == 'snapshot'
+        assert all(a['chave'] != 'produtos:99' for a in dados['alertas'])
+        
+        modulo_app.barramento.publicar('estoque.alerta', ALERTA)
+        tipo, dados = next(eventos)
+        assert tipo == 'estoque.alerta'
+        assert dados['nome'] == 'Teste' and dados['alerta'] == 'baixo'
+        
+        modulo_app.barramento.publicar('estoque.normalizado', {'chave': 'produtos:99', 'nome': 'Teste'})
+        tipo, dados = next(eventos)
+        assert tipo == 'estoque.normalizado'
+    finally:
+        resposta.close()
+
+
+def test_snapshot_traz_alertas_ativos(modulo_app, admin):
+    modulo_app.barramento.publicar('estoque.alerta', dict(ALERTA, id=98, chave='produtos:98'))
+    assert esperar(lambda: any(a['chave'] == 'produtos:98' for a in modulo_app.projecao_estoque.alertas()))
+    
+    resposta = admin.get('/api/estoque/alertas/stream', buffered=False)
+    try:
+        tipo, dados = next(eventos_sse(resposta))
+    finally:
+        resposta.close()
+    assert tipo == 'snapshot'
+    assert [a['nome'] for a in dados['alertas'] if a['chave'] == 'produtos:98'] == ['Teste']
+    
+    modulo_app.barramento.publicar('estoque.normalizado', {'chave': 'produtos:98'})
+    assert esperar(lambda: all(a['chave'] != 'produtos:98' for a in modulo_app.projecao_estoque.alertas()))
@@ -0,0 +1,78 @@
+"""
+Backups: arquivo comprimido só aparece quando está completo.
+"""
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import backups
+
+
+def test_compressao_interrompida_nao_deixa_backup(tmp_path, monkeypatch):
+    origem = tmp_path / 'banco.db'
+    origem.write_bytes(os.urandom(4096))
+    
+    def falhar(*args, **kwargs):
+        raise OSError('disco cheio')
+    
+    monkeypatch.setattr(shutil, 'copyfileobj', falhar)
+    with pytest.raises(OSError):
+        backups.comprimir_arquivo(str(origem), str(tmp_path / 'menu_backup.db'))
+    
+    assert sorted(os.listdir(tmp_path)) == ['banco.db']
+
+
+def test_compressao_completa(tmp_path):
+    origem = tmp_path / 'banco.db'
+    origem.write_bytes(b'x' * 4096)
+    
+    destino = backups.comprimir_arquivo(str(origem), str(tmp_path / 'menu_backup.db'))
+    
+    assert destino.endswith(backups.BACKUP_EXTENSOES)
+    assert sorted(os.listdir(tmp_path)) == ['banco.db', os.path.basename(destino)]
+
+
+def test_delta_usa_hashes_registrados_no_manifesto(tmp_path, monkeypatch):
+    monkeypatch.setattr(backups, 'BACKUP_INCREMENTAL_FOLDER', str(tmp_path / 'incremental'))
+    banco = str(tmp_path / 'pedidos_teste.db')
+    conn = sqlite3.connect(banco)
+    conn.execute("CREATE TABLE t (v TEXT)")
+    conn.execute("INSERT INTO t VALUES ('base')")
+    conn.commit()
+    
+    pasta = backups.backup_incremental('teste', banco, '20250101_000000')
+    conn.execute("INSERT INTO t VALUES ('delta 1')")
+    conn.commit()
+    
+    # Queda entre gravar os hashes e o manifesto: hashes novos, manifesto antigo
+    gravar = backups._gravar_atomico
+    
+    def cair_no_manifesto(caminho, dados):
+        if caminho.endswith('manifesto.json'):
+            raise OSError('queda')
+        gravar(caminho, dados)
+    
+    monkeypatch.setattr(backups, '_gravar_atomico', cair_no_manifesto)
+    with pytest.raises(OSError):
+        backups.backup_incremental('teste', banco, '20250101_010000')
+    monkeypatch.setattr(backups, '_gravar_atomico', gravar)
+    
+    backups.backup_incremental('teste', banco, '20250101_020000')
+    conn.execute("INSERT INTO t VALUES ('delta 2')")
+    conn.commit()
+    backups.backup_incremental('teste', banco, '20250101_030000')
+    conn.close()
+    
+    def restaurar(ate):
+        destino = str(tmp_path / f'restaurado_{ate}.db')
+        backups.restaurar_cadeia(os.path.basename(pasta), destino, ate)
+        conn = sqlite3.connect(destino)
+        try:
+            return [row[0] for row in conn.execute("SELECT v FROM t ORDER BY rowid")]
+        finally:
+            conn.close()
+    
+    assert restaurar('20250101_020000') == ['base', 'delta 1']
+    assert restaurar('20250101_030000') == ['base', 'delta 1', 'delta 2']
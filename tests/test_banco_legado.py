@@ -0,0 +1,64 @@
+"""
+Pedidos contra o sorveteria.db versionado (esquema da versão antiga do painel).
+"""
+import sqlite3
+
+import pytest
+
+
+def test_migracao_adapta_colunas_legadas(modulo_app):
+    conn = modulo_app.get_db(modulo_app.MENU_DB_PATH)
+    try:
+        colunas_produtos = [c[1] for c in conn.execute("PRAGMA table_info(produtos)")]
+        colunas_adicionais = [c[1] for c in conn.execute("PRAGMA table_info(adicionais)")]
+        imagem = conn.execute("SELECT imagem FROM produtos WHERE id = 1").fetchone()[0]
+    finally:
+        conn.close()
+    assert 'imagem' in colunas_produtos and 'imagem_path' not in colunas_produtos
+    assert 'categoria_id' in colunas_adicionais
+    assert imagem == '/uploads/loop7.jpg'
+
+
+def test_pedido_no_banco_versionado(modulo_app, cliente):
+    produto = modulo_app.catalogo_menu.obter().produto(nome='Açaí Tradicional 300ml')
+    estoque_antes = produto['estoque']
+    
+    resposta = cliente.post('/api/pedidos', json={
+        'cliente_nome': 'Teste',
+        'itens': [{'produto': 'Açaí Tradicional 300ml', 'quantidade': 1,
+                   'adicionais': [{'nome': 'Granola', 'quantidade': 1}]}],
+    })
+    
+    assert resposta.status_code == 200, resposta.get_json()
+    assert resposta.get_json()['valorTotal'] == 17.0
+    produto = modulo_app.catalogo_menu.obter().produto(nome='Açaí Tradicional 300ml')
+    assert produto['estoque'] == estoque_antes - 1
+
+
+def test_dados_do_totem_no_banco_versionado(cliente):
+    resposta = cliente.get('/api/dados?totem=true')
+    
+    assert resposta.status_code == 200
+    dados = resposta.get_json()
+    assert 'Açaí' in dados['menu']
+    acai = dados['menu']['Açaí'][0]
+    assert acai['imagem_path'] == 'uploads/loop7.jpg'
+    # Calda de Chocolate está sem estoque no banco versionado
+    adicionais = [a['nome'] for a in dados['adicional_categorias']['Açaí']['adicionais']]
+    assert 'Granola' in adicionais and 'Calda de Chocolate' not in adicionais
+
+
+@pytest.mark.parametrize('coluna_imagem, esperado', [
+    ('imagem_path', ['/uploads/a.jpg', 'https://cdn.exemplo.com/b.jpg', '/uploads/c.jpg']),
+    ('imagem', ['uploads/a.jpg', 'https://cdn.exemplo.com/b.jpg', '/uploads/c.jpg']),
+])
+def test_caminho_da_imagem_so_muda_ao_renomear_a_coluna(modulo_app, coluna_imagem, esperado):
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"CREATE TABLE produtos (id INTEGER PRIMARY KEY, categoria_id INTEGER, {coluna_imagem} TEXT)")
+    conn.execute("CREATE TABLE adicionais (id INTEGER PRIMARY KEY, categoria_id INTEGER)")
+    conn.executemany(f"INSERT INTO produtos (id, {coluna_imagem}) VALUES (?, ?)",
+                     enumerate(['uploads/a.jpg', 'https://cdn.exemplo.com/b.jpg', '/uploads/c.jpg'], 1))
+    
+    modulo_app._migracao_menu_colunas_legadas(conn.cursor())
+    
+    assert [r[0] for r in conn.execute("SELECT imagem FROM produtos ORDER BY id")] == esperado
@@ -0,0 +1,114 @@
+"""
+Barramento: políticas das filas de assinante e o transporte entre processos
+(sem token não sobe, token errado não assina).
+"""
+import json
+import socket
+from threading import Event, Thread
+
+import pytest
+
+import barramento
+
+
+def test_endereco_sem_token_impede_a_inicializacao(modulo_app, monkeypatch):
+    monkeypatch.setattr(modulo_app, 'BARRAMENTO_ENDERECO', '127.0.0.1:4010')
+    monkeypatch.setattr(modulo_app, 'BARRAMENTO_TOKEN', '')
+    with pytest.raises(RuntimeError):
+        modulo_app.iniciar_transporte_barramento()
+    assert modulo_app.barramento.transporte is None
+
+
+def test_transporte_exige_token():
+    with pytest.raises(ValueError):
+        barramento.TransporteBarramento(barramento.BarramentoEventos(), '127.0.0.1:4010', '')
+
+
+@pytest.mark.parametrize('token', [None, '', 'errado'])
+def test_token_invalido_e_recusado(token):
+    transporte = barramento.TransporteBarramento(barramento.BarramentoEventos(), '127.0.0.1:4010', 'segredo')
+    servidor, cliente = socket.socketpair()
+    atendimento = Thread(target=transporte._atender, args=(servidor,), daemon=True)
+    atendimento.start()
+    try:
+        cliente.sendall(json.dumps({'assinar': ['*'], 'token': token}).encode('utf-8') + b'\n')
+        resposta = cliente.makefile('rb').readline()
+    finally:
+        cliente.close()
+    atendimento.join(5)
+    
+    assert json.loads(resposta) == {'erro': 'token invalido'}
+
+
+def test_coalescer_nao_mistura_evento_sem_chave_com_pedido():
+    assinatura = barramento.AssinaturaBarramento('teste', ['*'], politica='coalescer', tamanho=10)
+    
+    # O 1º evento sem chave ganharia a chave interna 1, a mesma do pedido 1
+    assinatura.oferecer({'topico': 'estoque.baixo', 'n': 1})
+    assinatura.oferecer({'topico': 'pedido.novo', 'chave': 1, 'status': 'novo'})
+    assinatura.oferecer({'topico': 'estoque.baixo', 'n': 2})
+    assinatura.oferecer({'topico': 'pedido.status', 'chave': 1, 'status': 'pronto'})
+    
+    recebidos = [assinatura.proximo(timeout=0) for _ in range(3)]
+    assert [e.get('n') or e.get('status') for e in recebidos] == [1, 2, 'pronto']
+    assert assinatura.proximo(timeout=0) is None
+    assert assinatura.estatisticas()['coalescidos'] == 1
+
+
+def test_descartar_novo_mantem_a_fila():
+    assinatura = barramento.AssinaturaBarramento('teste', ['*'], politica='descartar_novo', tamanho=2)
+    
+    aceitos = [assinatura.oferecer({'topico': 'pedido.criado', 'n': n}) for n in range(3)]
+    
+    assert aceitos == [True, True, False]
+    assert [assinatura.proximo(timeout=0)['n'] for _ in range(2)] == [0, 1]
+    assert assinatura.estatisticas()['descartados'] == 1
+
+
+def test_descartar_antigo_abre_espaco():
+    assinatura = barramento.AssinaturaBarramento('teste', ['*'], politica='descartar_antigo', tamanho=2)
+    
+    for n in range(3):
+        assert assinatura.oferecer({'topico': 'pedido.criado', 'n': n})
+    
+    assert [assinatura.proximo(timeout=0)['n'] for _ in range(2)] == [1, 2]
+    stats = assinatura.estatisticas()
+    assert (stats['descartados'], stats['entregues'], stats['pendentes']) == (1, 2, 0)
+
+
+def test_coalescer_fica_com_o_ultimo_de_cada_pedido():
+    assinatura = barramento.AssinaturaBarramento('teste', ['*'], politica='coalescer', tamanho=10)
+    
+    for chave, status in [(1, 'recebido'), (2, 'recebido'), (1, 'pronto'), (1, 'retirado')]:
+        assinatura.oferecer({'topico': 'pedido.atualizado', 'chave': chave, 'status': status})
+    
+    recebidos = [assinatura.proximo(timeout=0) for _ in range(2)]
+    assert [(e['chave'], e['status']) for e in recebidos] == [(2, 'recebido'), (1, 'retirado')]
+    assert assinatura.estatisticas()['coalescidos'] == 2
+
+
+def test_politica_invalida():
+    with pytest.raises(ValueError):
+        barramento.AssinaturaBarramento('teste', ['*'], politica='bloquear')
+
+
+def test_assinante_recebe_so_os_topicos_assinados():
+    eventos = barramento.BarramentoEventos(origem='teste')
+    pedidos = eventos.assinar('pedidos', ['pedido.*'])
+    recebidos, chegou = [], Event()
+    com_callback = eventos.assinar('callback', ['estoque.*'],
+                                   callback=lambda evento: (recebidos.append(evento), chegou.set()))
+    
+    eventos.publicar('estoque.baixo', {'id': 7})
+    eventos.publicar('pedido.criado', {'id': 1}, preparar=lambda dados: dict(dados, total=10))
+    eventos.publicar('pedido.pronto', {'id': 1}, preparar=lambda dados: None)  # descartado no preparo
+    
+    evento = pedidos.proximo(timeout=5)
+    assert (evento['topico'], evento['id'], evento['total'], evento['origem']) == ('pedido.criado', 1, 10, 'teste')
+    assert pedidos.proximo(timeout=0.2) is None
+    assert chegou.wait(5)
+    assert [e['topico'] for e in recebidos] == ['estoque.baixo']
+    
+    eventos.cancelar(pedidos)
+    eventos.cancelar(com_callback)
+    assert eventos.estatisticas()['assinantes'] == {}
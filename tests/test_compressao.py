@@ -0,0 +1,113 @@
+"""
+Middleware de compressão: negociação pelo Accept-Encoding e corpo repassado intacto
+quando não comprime.
+"""
+import gzip
+
+import pytest
+from werkzeug.test import Client
+
+
+def app_com_write(tipo='application/json', extras=()):
+    """
+    Aplicação WSGI que manda parte do corpo pelo write() do start_response.
+    """
+    def aplicacao(environ, start_response):
+        corpo = b'{"parte": 1, "resto": 2}'
+        escrever = start_response('200 OK', [('Content-Type', tipo),
+                                             ('Content-Length', str(len(corpo)))] + list(extras))
+        escrever(corpo[:12])
+        return [corpo[12:]]
+    return aplicacao
+
+
+@pytest.mark.parametrize('tipo, extras, metodo', [
+    ('application/json', (), 'GET'),  # abaixo de COMPRESSAO_MIN_BYTES
+    ('application/json', (), 'HEAD'),
+    ('application/json', (('Content-Encoding', 'gzip'),), 'GET'),
+    ('image/png', (), 'GET'),
+])
+def test_write_chega_ao_cliente_sem_compressao(modulo_app, tipo, extras, metodo):
+    cliente = Client(modulo_app.CompressaoRespostas(app_com_write(tipo, extras)))
+    
+    resposta = cliente.open('/', method=metodo, headers={'Accept-Encoding': 'gzip'})
+    
+    if metodo == 'GET':
+        assert resposta.get_data() == b'{"parte": 1, "resto": 2}'
+
+
+def app_json(etag=None):
+    """
+    Aplicação WSGI com um JSON grande o bastante para comprimir.
+    """
+    corpo = b'{"itens": [' + b', '.join(b'{"id": %d, "nome": "Sorvete"}' % i for i in range(200)) + b']}'
+    
+    def aplicacao(environ, start_response):
+        headers = [('Content-Type', 'application/json'), ('Content-Length', str(len(corpo)))]
+        if etag:
+            headers.append(('ETag', etag))
+        start_response('200 OK', headers)
+        return [corpo]
+    return aplicacao, corpo
+
+
+def test_comprime_com_gzip_quando_aceito(modulo_app, monkeypatch):
+    monkeypatch.setattr(modulo_app, 'brotli', None)
+    aplicacao, corpo = app_json()
+    cliente = Client(modulo_app.CompressaoRespostas(aplicacao))
+    
+    resposta = cliente.get('/', headers={'Accept-Encoding': 'br, gzip'})
+    
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+    assert resposta.headers['Vary'] == 'Accept-Encoding'
+    assert int(resposta.headers['Content-Length']) == len(resposta.get_data())
+    assert gzip.decompress(resposta.get_data()) == corpo
+
+
+@pytest.mark.parametrize('aceita', ['', 'identity', 'gzip;q=0', 'deflate, *;q=0'])
+def test_sem_compressao_quando_nao_aceita(modulo_app, aceita):
+    aplicacao, corpo = app_json()
+    cliente = Client(modulo_app.CompressaoRespostas(aplicacao))
+    
+    resposta = cliente.get('/', headers={'Accept-Encoding': aceita})
+    
+    assert 'Content-Encoding' not in resposta.headers
+    assert resposta.headers['Vary'] == 'Accept-Encoding'
+    assert resposta.get_data() == corpo
+
+
+def test_brotli_preferido_quando_instalado(modulo_app):
+    brotli = pytest.importorskip('brotli')
+    aplicacao, corpo = app_json()
+    cliente = Client(modulo_app.CompressaoRespostas(aplicacao))
+    
+    resposta = cliente.get('/', headers={'Accept-Encoding': 'gzip, br'})
+    
+    assert resposta.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(resposta.get_data()) == corpo
+
+
+def test_etag_enfraquecida_e_corpo_reaproveitado(modulo_app, monkeypatch):
+    monkeypatch.setattr(modulo_app, 'brotli', None)
+    aplicacao, corpo = app_json(etag='"v1"')
+    middleware = modulo_app.CompressaoRespostas(aplicacao)
+    cliente = Client(middleware)
+    
+    primeira = cliente.get('/', headers={'Accept-Encoding': 'gzip'})
+    segunda = cliente.get('/', headers={'Accept-Encoding': 'gzip'})
+    
+    assert primeira.headers['ETag'] == 'W/"v1"'
+    assert segunda.get_data() == primeira.get_data()
+    assert middleware._stats['comprimidas'] == 2
+    assert middleware._stats['cache_hits'] == 1
+
+
+def test_rota_real_comprimida(modulo_app, cliente, monkeypatch):
+    monkeypatch.setattr(modulo_app, 'COMPRESSAO_MIN_BYTES', 0)
+    simples = cliente.get('/api/menu')
+    comprimida = cliente.get('/api/menu', headers={'Accept-Encoding': 'gzip'})
+    
+    assert 'Content-Encoding' not in simples.headers
+    assert comprimida.headers['Content-Encoding'] == 'gzip'
+    assert comprimida.headers['ETag'] == 'W/' + simples.headers['ETag'].removeprefix('W/')
+    assert gzip.decompress(comprimida.get_data()) == simples.get_data()
@@ -0,0 +1,25 @@
+"""
+create_app: idempotente por processo e com os locks fora da raiz do repositório.
+"""
+import os
+
+
+def test_create_app_inicializa_uma_vez(modulo_app, monkeypatch):
+    chamadas = []
+    monkeypatch.setattr(modulo_app, '_app_preparado', False)
+    monkeypatch.setattr(modulo_app, 'inicializar_bancos', lambda: chamadas.append('bancos'))
+    monkeypatch.setattr(modulo_app, 'candidatar_lider', lambda tarefa: chamadas.append('lider'))
+    
+    primeiro = modulo_app.create_app()
+    segundo = modulo_app.create_app()
+    
+    assert primeiro is segundo is modulo_app.app
+    assert chamadas == ['bancos', 'lider']
+
+
+def test_locks_ficam_na_pasta_de_backups(modulo_app):
+    for caminho in (modulo_app.LOCK_INIT_PATH, modulo_app.LOCK_LIDER_PATH):
+        assert os.path.dirname(caminho) == modulo_app.BACKUP_FOLDER
+    
+    with modulo_app.TravaArquivo(modulo_app.LOCK_INIT_PATH):
+        assert os.path.exists(modulo_app.LOCK_INIT_PATH)
@@ -0,0 +1,72 @@
+"""
+Arquivos estáticos com fingerprint: referências reescritas, cache imutável e versões gzip.
+"""
+import gzip
+import re
+
+import estaticos
+
+
+def _referencia(html, original):
+    base, ext = original.rsplit('.', 1)
+    achado = re.search(r'["\'/](' + re.escape(base) + r'\.[0-9a-f]{10}\.' + ext + r')["\']', html)
+    assert achado, f'{original} não foi reescrito'
+    return achado.group(1)
+
+
+def test_pagina_reescrita_e_revalidada(cliente):
+    resposta = cliente.get('/')
+    html = resposta.get_data(as_text=True)
+    
+    assert resposta.status_code == 200
+    assert resposta.cache_control.no_cache
+    assert resposta.headers['ETag']
+    assert 'Accept-Encoding' in resposta.headers['Vary']
+    _referencia(html, 'script.js')
+    _referencia(html, 'assets/loop1.jpg')
+    
+    repetida = cliente.get('/', headers={'If-None-Match': resposta.headers['ETag']})
+    assert repetida.status_code == 304
+
+
+def test_nome_com_fingerprint_e_imutavel(cliente):
+    script = _referencia(cliente.get('/').get_data(as_text=True), 'script.js')
+    
+    imutavel = cliente.get('/' + script)
+    original = cliente.get('/script.js')
+    
+    assert imutavel.status_code == 200
+    assert imutavel.cache_control.immutable
+    assert imutavel.cache_control.public
+    assert imutavel.cache_control.max_age == estaticos.ESTATICOS_MAX_AGE
+    assert original.cache_control.no_cache
+    assert not original.cache_control.immutable
+    assert imutavel.get_data() == original.get_data()
+
+
+def test_versao_gzip_precalculada(cliente):
+    simples = cliente.get('/script.js')
+    comprimida = cliente.get('/script.js', headers={'Accept-Encoding': 'gzip'})
+    
+    assert 'Content-Encoding' not in simples.headers
+    assert comprimida.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(comprimida.get_data()) == simples.get_data()
+    assert comprimida.headers['ETag'] != simples.headers['ETag']
+
+
+def test_manifesto_recalcula_quando_arquivo_muda(modulo_app, tmp_path, monkeypatch):
+    (tmp_path / 'app.js').write_text('console.log(1)', encoding='utf-8')
+    (tmp_path / 'index.html').write_text('<script src="app.js"></script>', encoding='utf-8')
+    manifesto = estaticos.ManifestoEstatico(str(tmp_path))
+    monkeypatch.setattr(estaticos, 'ESTATICOS_RECARGA', 0)
+    monkeypatch.setattr(modulo_app.app, 'debug', True)
+    
+    with modulo_app.app.test_request_context('/'):
+        antes = manifesto.obter()
+        assert manifesto.obter() is antes
+        (tmp_path / 'app.js').write_text('console.log(22)', encoding='utf-8')
+        depois = manifesto.obter()
+    
+    assert depois is not antes
+    assert depois['manifesto']['app.js'] != antes['manifesto']['app.js']
+    assert depois['manifesto']['app.js'].encode() in depois['originais']['index.html'].corpo
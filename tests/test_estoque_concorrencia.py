@@ -0,0 +1,87 @@
+"""
+Totens disputando as últimas unidades: a reserva condicional nunca vende além
+do estoque (bancos temporários com o esquema dos bancos da sessão).
+"""
+import sqlite3
+from threading import Barrier, Lock, Thread
+
+import pytest
+
+THREADS = 8
+PEDIDOS_POR_THREAD = 5
+ESTOQUE = 10
+
+
+def criar_banco(modulo_app, origem, destino):
+    conn_origem = sqlite3.connect(origem)
+    ddl = conn_origem.execute(
+        "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+        "ORDER BY type = 'index'"
+    ).fetchall()
+    conn_origem.close()
+    conn = modulo_app.abrir_conexao(str(destino))
+    for (sql,) in ddl:
+        conn.execute(sql)
+    conn.commit()
+    return conn
+
+
+@pytest.fixture
+def bancos(modulo_app, tmp_path):
+    caminho_menu, caminho_pedidos = tmp_path / 'menu.db', tmp_path / 'pedidos.db'
+    conn_menu = criar_banco(modulo_app, modulo_app.MENU_DB_PATH, caminho_menu)
+    criar_banco(modulo_app, modulo_app.PEDIDOS_DB_PATH, caminho_pedidos).close()
+    conn_menu.execute("INSERT INTO categorias (id, nome) VALUES (1, 'Disputa')")
+    conn_menu.execute("INSERT INTO produtos (id, nome, preco, imagem, categoria_id, estoque) "
+                      "VALUES (1, 'Açaí', 10, '', 1, ?)", (ESTOQUE,))
+    conn_menu.commit()
+    catalogo = modulo_app.SnapshotCatalogo(
+        0,
+        conn_menu.execute("SELECT id, nome FROM categorias").fetchall(),
+        conn_menu.execute("SELECT id, nome, preco, imagem, categoria_id, estoque FROM produtos").fetchall(),
+        []
+    )
+    conn_menu.close()
+    return str(caminho_menu), str(caminho_pedidos), catalogo
+
+
+def test_ultimas_unidades_nao_sao_vendidas_duas_vezes(modulo_app, bancos):
+    caminho_menu, caminho_pedidos, catalogo = bancos
+    # Todos planejam com o snapshot "tem estoque", como os totens: quem decide é a reserva
+    plano = modulo_app.planejar_pedido([{'produto_id': 1, 'quantidade': 1}], catalogo)
+    resultado = {'vendidos': 0, 'recusados': 0}
+    erros = []
+    lock = Lock()
+    barreira = Barrier(THREADS)
+    
+    def totem():
+        conn = modulo_app.abrir_conexao(caminho_pedidos, anexos=(('menu', caminho_menu),))
+        try:
+            barreira.wait()
+            for _ in range(PEDIDOS_POR_THREAD):
+                pedido_id, faltantes = modulo_app.registrar_pedido(conn, plano, 'Disputa', 'agora')
+                with lock:
+                    resultado['vendidos' if pedido_id else 'recusados'] += 1
+        except Exception as e:
+            erros.append(e)
+        finally:
+            conn.close()
+    
+    totens = [Thread(target=totem) for _ in range(THREADS)]
+    for t in totens:
+        t.start()
+    for t in totens:
+        t.join()
+    
+    assert not erros
+    conn = modulo_app.abrir_conexao(caminho_pedidos, anexos=(('menu', caminho_menu),))
+    try:
+        estoque = conn.execute("SELECT estoque FROM menu.produtos WHERE id = 1").fetchone()[0]
+        gravados = conn.execute("SELECT COUNT(*) FROM pedidos").fetchone()[0]
+        baixas = conn.execute("SELECT COUNT(*), SUM(delta) FROM menu.movimentos_estoque").fetchone()
+    finally:
+        conn.close()
+    assert resultado == {'vendidos': ESTOQUE, 'recusados': THREADS * PEDIDOS_POR_THREAD - ESTOQUE}
+    assert estoque == 0
+    assert gravados == ESTOQUE
+    assert tuple(baixas) == (ESTOQUE, -ESTOQUE)
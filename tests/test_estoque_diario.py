@@ -0,0 +1,66 @@
+"""
+Diário de estoque: toda baixa de pedido e todo ajuste viram linha em movimentos_estoque.
+"""
+import pytest
+
+
+def movimentos_do_pedido(modulo_app, pedido_id):
+    conn = modulo_app.get_db(modulo_app.MENU_DB_PATH)
+    try:
+        return [dict(row) for row in conn.execute(
+            "SELECT * FROM movimentos_estoque WHERE pedido_id = ? ORDER BY tabela, item_id", (pedido_id,)
+        )]
+    finally:
+        conn.close()
+
+
+def conferir_baixas(movimentos, pedido_id):
+    por_tabela = {m['tabela']: m for m in movimentos}
+    assert set(por_tabela) == {'produtos', 'adicionais'}
+    for movimento in movimentos:
+        assert movimento['delta'] == -1
+        assert movimento['estoque_anterior'] - movimento['estoque_novo'] == 1
+        assert movimento['motivo'] == f"pedido #{pedido_id}"
+
+
+ITENS = [{'produto': 'Açaí Tradicional 300ml', 'quantidade': 1,
+          'adicionais': [{'nome': 'Granola', 'quantidade': 1}]}]
+
+
+def test_pedido_registra_baixas_no_diario(modulo_app, cliente):
+    resposta = cliente.post('/api/pedidos', json={'cliente_nome': 'Diário', 'itens': ITENS})
+    
+    assert resposta.status_code == 200, resposta.get_json()
+    pedido_id = resposta.get_json()['pedidoId']
+    conferir_baixas(movimentos_do_pedido(modulo_app, pedido_id), pedido_id)
+
+
+def test_gravador_registra_baixas_no_diario(modulo_app):
+    catalogo = modulo_app.catalogo_menu.obter()
+    plano = modulo_app.planejar_pedido([{
+        'produto_id': catalogo.produto(nome='Açaí Tradicional 300ml')['id'], 'quantidade': 1,
+        'adicionais': [{'nome': 'Granola', 'quantidade': 1}],
+    }], catalogo)
+    
+    s = modulo_app.GravadorPedidos(ativo=True).gravar(plano, 'Diário', 'local')
+    
+    assert s.codigo == 200, s.erro
+    conferir_baixas(movimentos_do_pedido(modulo_app, s.pedido_id), s.pedido_id)
+
+
+@pytest.mark.parametrize('ajuste', [
+    {'id': 1, 'definir': 1.9},
+    {'id': 1, 'delta': True},
+    {'id': 1, 'delta': '3'},
+    {'id': '1', 'delta': 3},
+    {'id': 1, 'definir': -1},
+])
+def test_validar_ajustes_exige_inteiros(modulo_app, ajuste):
+    with pytest.raises(ValueError):
+        modulo_app.validar_ajustes([ajuste])
+
+
+def test_validar_ajustes_normaliza(modulo_app):
+    assert modulo_app.validar_ajustes([{'tabela': 'adicionais', 'id': 2, 'delta': -3}]) == [
+        ('adicionais', 2, 'delta', -3)
+    ]
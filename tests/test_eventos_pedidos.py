@@ -0,0 +1,71 @@
+"""
+Cursores do long-polling/SSE depois de reinício, troca de worker ou eventos
+perdidos no barramento.
+"""
+import time
+
+
+def _criar_pedido(cliente):
+    resposta = cliente.post('/api/pedidos', json={
+        'cliente_nome': 'Cursor',
+        'itens': [{'produto': 'Água Mineral 500ml', 'quantidade': 1}],
+    })
+    assert resposta.status_code == 200, resposta.get_json()
+    return resposta.get_json()['pedidoId']
+
+
+def _esperar_evento(hub, seq):
+    limite = time.time() + 2
+    while hub.seq <= seq and time.time() < limite:
+        time.sleep(0.01)
+
+
+def test_cursor_da_mesma_epoca_recebe_eventos(modulo_app, cliente):
+    inicial = cliente.get('/api/pedidos/eventos').get_json()
+    seq = modulo_app.hub_pedidos.seq
+    pedido_id = _criar_pedido(cliente)
+    _esperar_evento(modulo_app.hub_pedidos, seq)
+    
+    resposta = cliente.get(f"/api/pedidos/eventos?since={inicial['cursor']}&timeout=0").get_json()
+    
+    assert 'reset' not in resposta
+    assert pedido_id in [e['dados']['id'] for e in resposta['eventos']]
+
+
+def test_cursor_de_outra_epoca_recebe_snapshot(modulo_app, cliente):
+    pedido_id = _criar_pedido(cliente)
+    
+    # Cursor de um processo anterior, com seq muito à frente do contador atual
+    resposta = cliente.get('/api/pedidos/eventos?since=outraepoca:999999&timeout=0').get_json()
+    
+    assert resposta['reset'] is True
+    assert pedido_id in [p['id'] for p in resposta['pedidos']]
+    assert resposta['cursor'].startswith(modulo_app.hub_pedidos.epoca + ':')
+
+
+def test_cursor_a_frente_do_contador_recebe_snapshot(modulo_app, cliente):
+    cursor = modulo_app.hub_pedidos.cursor(modulo_app.hub_pedidos.seq + 50)
+    
+    resposta = cliente.get(f'/api/pedidos/eventos?since={cursor}&timeout=0').get_json()
+    
+    assert resposta['reset'] is True
+
+
+def test_eventos_descartados_no_barramento_forcam_snapshot(modulo_app, cliente):
+    inicial = cliente.get('/api/pedidos/eventos').get_json()
+    assinante = modulo_app.hub_pedidos.assinar(['recebido'], False)
+    
+    # Simula a fila do hub no barramento transbordando antes do próximo evento
+    with modulo_app.assinatura_hub._cond:
+        modulo_app.assinatura_hub._stats['descartados'] += 1
+    seq = modulo_app.hub_pedidos.seq
+    pedido_id = _criar_pedido(cliente)
+    _esperar_evento(modulo_app.hub_pedidos, seq + 1)
+    
+    resposta = cliente.get(f"/api/pedidos/eventos?since={inicial['cursor']}&timeout=0").get_json()
+    
+    assert resposta['reset'] is True
+    assert pedido_id in [p['id'] for p in resposta['pedidos']]
+    assert assinante.atrasado
+    assert assinante.fila.get_nowait() is None
+    modulo_app.hub_pedidos.cancelar(assinante)
@@ -0,0 +1,69 @@
+"""
+Exportação em streaming (CSV/NDJSON) com páginas keyset por after_id/limite.
+"""
+import csv
+import io
+import json
+
+import pytest
+
+
+def linhas_csv(resposta):
+    return list(csv.reader(io.StringIO(resposta.get_data(as_text=True))))
+
+
+def linhas_ndjson(resposta):
+    return [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+
+
+def test_exportacao_exige_login(cliente):
+    assert cliente.get('/api/exportar/pedidos').status_code == 401
+
+
+@pytest.mark.parametrize('url, status', [
+    ('/api/exportar/produtos', 404),
+    ('/api/exportar/pedidos?formato=xlsx', 400),
+    ('/api/exportar/pedidos?limite=0', 400),
+    ('/api/exportar/pedidos?data_inicio=01/01/2024', 400),
+])
+def test_parametros_invalidos(admin, url, status):
+    assert admin.get(url).status_code == status
+
+
+def test_csv_e_ndjson_trazem_as_mesmas_linhas(admin):
+    resposta_csv = admin.get('/api/exportar/pedidos')
+    resposta_ndjson = admin.get('/api/exportar/pedidos?formato=ndjson')
+    
+    assert resposta_csv.mimetype == 'text/csv'
+    assert resposta_ndjson.mimetype == 'application/x-ndjson'
+    assert 'attachment' in resposta_csv.headers['Content-Disposition']
+    cabecalho, *linhas = linhas_csv(resposta_csv)
+    registros = linhas_ndjson(resposta_ndjson)
+    assert cabecalho == ['id', 'cliente_nome', 'tipo_pedido', 'status', 'valor_total', 'data_hora']
+    assert linhas
+    assert [int(linha[0]) for linha in linhas] == [r['id'] for r in registros]
+    assert [r['id'] for r in registros] == sorted(r['id'] for r in registros)
+
+
+def test_paginas_pequenas_nao_perdem_nem_repetem_linhas(modulo_app, admin, monkeypatch):
+    completa = linhas_ndjson(admin.get('/api/exportar/itens_pedido?formato=ndjson'))
+    monkeypatch.setattr(modulo_app, 'EXPORTAR_PAGINA', 2)
+    monkeypatch.setattr(modulo_app, 'EXPORTAR_LOTE', 1)
+    
+    assert linhas_ndjson(admin.get('/api/exportar/itens_pedido?formato=ndjson')) == completa
+    
+    recebidas, after_id = [], 0
+    while True:
+        pagina = linhas_ndjson(admin.get(f'/api/exportar/itens_pedido?formato=ndjson&after_id={after_id}&limite=3'))
+        assert len(pagina) <= 3
+        recebidas.extend(pagina)
+        if len(pagina) < 3:
+            break
+        after_id = pagina[-1]['id']
+    assert recebidas == completa
+
+
+def test_csv_vazio_traz_so_o_cabecalho(admin):
+    resposta = admin.get('/api/exportar/pedidos?data_inicio=1990-01-01&data_fim=1990-01-02')
+    
+    assert linhas_csv(resposta) == [['id', 'cliente_nome', 'tipo_pedido', 'status', 'valor_total', 'data_hora']]
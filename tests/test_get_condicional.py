@@ -0,0 +1,51 @@
+"""
+GET condicional (ETag/If-None-Match) no cardápio, nas configurações e na lista de pedidos.
+"""
+import pytest
+
+
+@pytest.mark.parametrize('url', ['/api/menu', '/api/config', '/api/pedidos?status=recebido'])
+def test_etag_atual_responde_304_sem_corpo(cliente, url):
+    primeira = cliente.get(url)
+    assert primeira.status_code == 200
+    assert primeira.headers['Cache-Control'] == 'no-cache'
+    
+    segunda = cliente.get(url, headers={'If-None-Match': primeira.headers['ETag']})
+    
+    assert segunda.status_code == 304
+    assert segunda.get_data() == b''
+    assert segunda.headers['ETag'] == primeira.headers['ETag']
+
+
+def test_filtros_diferentes_tem_etags_diferentes(cliente):
+    recebidos = cliente.get('/api/pedidos?status=recebido')
+    prontos = cliente.get('/api/pedidos?status=pronto')
+    
+    assert recebidos.headers['ETag'] != prontos.headers['ETag']
+    resposta = cliente.get('/api/pedidos?status=pronto', headers={'If-None-Match': recebidos.headers['ETag']})
+    assert resposta.status_code == 200
+
+
+def test_pedido_novo_invalida_a_lista(cliente):
+    antes = cliente.get('/api/pedidos?status=recebido')
+    criado = cliente.post('/api/pedidos', json={
+        'cliente_nome': 'ETag',
+        'itens': [{'produto': 'Água Mineral 500ml', 'quantidade': 1}],
+    })
+    assert criado.status_code == 200, criado.get_json()
+    
+    depois = cliente.get('/api/pedidos?status=recebido', headers={'If-None-Match': antes.headers['ETag']})
+    
+    assert depois.status_code == 200
+    assert depois.headers['ETag'] != antes.headers['ETag']
+    assert criado.get_json()['pedidoId'] in [p['id'] for p in depois.get_json()]
+
+
+def test_configuracao_salva_invalida_o_etag(cliente, admin):
+    antes = cliente.get('/api/config')
+    assert admin.post('/api/config', json={'teste_etag': 'novo valor'}).status_code == 200
+    
+    depois = cliente.get('/api/config', headers={'If-None-Match': antes.headers['ETag']})
+    
+    assert depois.status_code == 200
+    assert depois.get_json()['teste_etag']['valor'] == 'novo valor'
@@ -0,0 +1,38 @@
+"""
+Thread gravadora: uma falha nunca deixa o pedido esperando para sempre.
+"""
+import sqlite3
+import time
+
+
+def test_falha_ao_abrir_conexao_responde_o_pedido(modulo_app, monkeypatch):
+    def falhar(*args, **kwargs):
+        raise sqlite3.OperationalError('unable to open database file')
+    
+    monkeypatch.setattr(modulo_app, 'abrir_conexao', falhar)
+    monkeypatch.setattr(modulo_app, 'GRAVADOR_PAUSA_FALHA', 0.01)
+    gravador = modulo_app.GravadorPedidos(ativo=True)
+    plano = modulo_app.planejar_pedido([{'produto_id': 1, 'quantidade': 1}], modulo_app.catalogo_menu.obter())
+    
+    inicio = time.perf_counter()
+    s = gravador.gravar(plano, 'Teste', 'local')
+    
+    assert time.perf_counter() - inicio < modulo_app.GRAVADOR_TIMEOUT
+    assert s.pedido_id is None
+    assert s.codigo in (500, 503)
+    stats = gravador.estatisticas()
+    assert stats['falhas'] >= 1
+    assert stats['thread_viva']
+
+
+def test_thread_morta_e_reiniciada(modulo_app, monkeypatch):
+    gravador = modulo_app.GravadorPedidos(ativo=True)
+    monkeypatch.setattr(gravador, '_executar', lambda: None)
+    gravador._iniciar()
+    gravador._thread.join(1)
+    assert not gravador._thread.is_alive()
+    
+    monkeypatch.undo()
+    gravador._iniciar()
+    assert gravador.estatisticas()['reinicios'] == 1
+    assert gravador._thread.is_alive()
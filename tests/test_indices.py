@@ -0,0 +1,44 @@
+"""
+Consultas quentes usam os índices criados pelas migrações (EXPLAIN QUERY PLAN).
+"""
+import pytest
+
+# (banco, consulta quente, parâmetros, índice esperado)
+CONSULTAS_QUENTES = [
+    ('PEDIDOS_DB_PATH', "SELECT * FROM pedidos WHERE status IN (?, ?) ORDER BY id ASC",
+     ('recebido', 'pronto'), 'idx_pedidos_status'),
+    ('PEDIDOS_DB_PATH', "SELECT * FROM pedidos WHERE status IN (?) AND id > ? ORDER BY id ASC LIMIT ?",
+     ('retirado', 0, 50), 'idx_pedidos_status'),
+    ('PEDIDOS_DB_PATH', "SELECT * FROM pedidos WHERE seq_alteracao > ? ORDER BY seq_alteracao",
+     (0,), 'idx_pedidos_seq_alteracao'),
+    ('PEDIDOS_DB_PATH', "SELECT * FROM itens_pedido WHERE pedido_id IN (?, ?) ORDER BY id",
+     (1, 2), 'idx_itens_pedido_pedido'),
+    ('PEDIDOS_DB_PATH', "SELECT * FROM adicionais_pedido WHERE item_pedido_id IN (?, ?) ORDER BY id",
+     (1, 2), 'idx_adicionais_pedido_item'),
+    ('PEDIDOS_DB_PATH', "SELECT * FROM acompanhamentos_vendidos WHERE data >= ? AND data <= ? "
+     "AND categoria_produto = ? ORDER BY data DESC, hora DESC",
+     ('2025-01-01', '2025-01-31', 'Açaí'), 'idx_acompanhamentos_data'),
+    ('PEDIDOS_DB_PATH', "SELECT * FROM vendas_dia WHERE data >= ? AND data <= ? ORDER BY data DESC",
+     ('2025-01-01', '2025-01-31'), 'PRIMARY KEY'),
+    ('PEDIDOS_DB_PATH', "SELECT * FROM vendas_hora WHERE data >= ? AND data <= ? ORDER BY data DESC, hora DESC",
+     ('2025-01-01', '2025-01-31'), 'PRIMARY KEY'),
+    ('MENU_DB_PATH', "SELECT id, estoque FROM produtos WHERE nome = ? COLLATE NOCASE",
+     ('Açaí',), 'idx_produtos_nome'),
+    ('MENU_DB_PATH', "SELECT id, estoque FROM adicionais WHERE nome = ? COLLATE NOCASE",
+     ('Granola',), 'idx_adicionais_nome'),
+    ('MENU_DB_PATH', "SELECT * FROM movimentos_estoque WHERE id > ? AND tabela = ? AND item_id = ? ORDER BY id LIMIT ?",
+     (0, 'produtos', 1, 100), 'idx_movimentos_item'),
+    ('MENU_DB_PATH', "SELECT 1 FROM movimentos_estoque WHERE pedido_id = ?",
+     (1,), 'idx_movimentos_pedido'),
+]
+
+
+@pytest.mark.parametrize('banco, sql, params, indice', CONSULTAS_QUENTES,
+                         ids=[indice for _, _, _, indice in CONSULTAS_QUENTES])
+def test_consulta_quente_usa_indice(modulo_app, banco, sql, params, indice):
+    conn = modulo_app.get_db(getattr(modulo_app, banco))
+    try:
+        plano = ' | '.join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+    finally:
+        conn.close()
+    assert indice in plano, plano
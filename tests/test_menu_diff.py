@@ -0,0 +1,111 @@
+"""
+Salvamento do cardápio por diff: ids estáveis e categorias casadas sem ambiguidade.
+"""
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def menu(modulo_app, tmp_path):
+    # Cópia consistente (inclui o que ainda está no -wal) do cardápio da sessão
+    origem = sqlite3.connect(modulo_app.MENU_DB_PATH)
+    conn = sqlite3.connect(tmp_path / 'menu.db')
+    origem.backup(conn)
+    origem.close()
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    yield conn
+    conn.close()
+
+
+def payload_atual(conn):
+    return {
+        tabela: [dict(linha) for linha in conn.execute(f"SELECT * FROM {tabela}")]
+        for tabela in ('categorias', 'produtos', 'adicionais')
+    }
+
+
+def categorias(conn):
+    return {linha['id']: linha['nome'] for linha in conn.execute("SELECT id, nome FROM categorias")}
+
+
+def test_renomear_e_criar_categoria_com_o_nome_antigo(modulo_app, menu):
+    antes = categorias(menu)
+    data = payload_atual(menu)
+    data['categorias'] = [dict(c, nome='X') if c['id'] == 1 else c for c in data['categorias']]
+    data['categorias'].append({'id': 'temp_9', 'nome': antes[1]})
+    
+    resumo = modulo_app.aplicar_diff_menu(menu.cursor(), data)
+    
+    depois = categorias(menu)
+    assert depois[1] == 'X'
+    assert antes[1] in depois.values()
+    assert resumo['categorias'] == {'inseridos': 1, 'atualizados': 1, 'removidos': 0}
+
+
+def test_categoria_sem_id_reaproveita_a_existente_nao_reivindicada(modulo_app, menu):
+    antes = categorias(menu)
+    data = payload_atual(menu)
+    data['categorias'] = [
+        {'nome': c['nome']} if c['id'] == 2 else c for c in data['categorias']
+    ]
+    
+    resumo = modulo_app.aplicar_diff_menu(menu.cursor(), data)
+    
+    assert categorias(menu) == antes
+    assert resumo['categorias'] == {'inseridos': 0, 'atualizados': 0, 'removidos': 0}
+
+
+def test_categoria_sem_id_nao_casa_com_a_renomeada(modulo_app, menu):
+    antes = categorias(menu)
+    data = payload_atual(menu)
+    data['categorias'] = [dict(c, nome='X') if c['id'] == 1 else c for c in data['categorias']]
+    data['categorias'].append({'nome': antes[1]})
+    
+    modulo_app.aplicar_diff_menu(menu.cursor(), data)
+    
+    depois = categorias(menu)
+    assert depois[1] == 'X'
+    assert len(depois) == len(antes) + 1
+
+
+def test_estoque_de_item_existente_nao_muda_pelo_cardapio(modulo_app, menu):
+    data = payload_atual(menu)
+    estoque = data['produtos'][0]['estoque']
+    # Cardápio aberto antes de uma venda: o payload traz o estoque antigo
+    data['produtos'][0]['estoque'] = estoque + 5
+    data['produtos'].append({
+        'id': 'temp_1', 'nome': 'Produto Novo', 'preco': 9.0,
+        'categoria_id': data['produtos'][0]['categoria_id'], 'estoque': 12,
+    })
+    
+    resumo = modulo_app.aplicar_diff_menu(menu.cursor(), data)
+    
+    assert resumo['produtos']['estoque_ignorado'] == 1
+    assert menu.execute(
+        "SELECT estoque FROM produtos WHERE id = ?", (data['produtos'][0]['id'],)
+    ).fetchone()[0] == estoque
+    novo = menu.execute("SELECT id, estoque FROM produtos WHERE nome = 'Produto Novo'").fetchone()
+    assert novo['estoque'] == 12
+    movimento = menu.execute(
+        "SELECT delta, estoque_anterior, estoque_novo FROM movimentos_estoque WHERE tabela = 'produtos' AND item_id = ?",
+        (novo['id'],)
+    ).fetchone()
+    assert tuple(movimento) == (12, 0, 12)
+
+
+@pytest.mark.parametrize('estoque', [-5, 1.9, True, '3'])
+def test_patch_rejeita_estoque_invalido(admin, estoque):
+    resposta = admin.patch('/api/menu/produtos/2', json={'estoque': estoque})
+    assert resposta.status_code == 400
+
+
+def test_patch_de_estoque_vai_para_o_diario(modulo_app, admin):
+    resposta = admin.patch('/api/menu/produtos/2', json={'estoque': 40})
+    assert resposta.status_code == 200
+    assert resposta.get_json()['estoque'] == 40
+    
+    movimentos = admin.get('/api/estoque/movimentos?tabela=produtos&item_id=2').get_json()
+    assert movimentos[-1]['estoque_novo'] == 40
+    assert movimentos[-1]['motivo'] == 'edição do item'
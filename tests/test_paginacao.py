@@ -0,0 +1,60 @@
+"""
+Paginação keyset (?limit=&after_id=) e projeção (?fields=) do GET /api/pedidos.
+"""
+import pytest
+
+
+@pytest.fixture
+def pedidos_retirados(modulo_app):
+    """
+    Garante alguns pedidos 'retirado' para percorrer em várias páginas.
+    """
+    conn = modulo_app.get_db(modulo_app.PEDIDOS_DB_PATH)
+    try:
+        for n in range(5):
+            conn.execute("""
+                INSERT INTO pedidos (cliente_nome, tipo_pedido, status, valor_total, data_hora)
+                VALUES (?, 'local', 'retirado', 10.0, '2024-01-01 12:00:00')
+            """, (f'Página {n}',))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_percorre_todas_as_paginas(cliente, pedidos_retirados):
+    completa = cliente.get('/api/pedidos?status=retirado').get_json()
+    
+    recebidos, after_id, paginas = [], None, 0
+    while True:
+        url = '/api/pedidos?status=retirado&limit=2' + (f'&after_id={after_id}' if after_id else '')
+        resposta = cliente.get(url)
+        pagina = resposta.get_json()
+        assert len(pagina) <= 2
+        recebidos.extend(pagina)
+        paginas += 1
+        after_id = resposta.headers.get('X-Proximo-After-Id')
+        if after_id is None:
+            break
+        assert after_id == str(pagina[-1]['id'])
+    
+    assert len(completa) >= 5
+    assert recebidos == completa
+    assert paginas >= 3
+
+
+def test_limite_maximo(modulo_app, cliente, pedidos_retirados, monkeypatch):
+    monkeypatch.setattr(modulo_app, 'PEDIDOS_LIMITE_MAX', 3)
+    
+    resposta = cliente.get('/api/pedidos?status=retirado&limit=1000')
+    
+    assert len(resposta.get_json()) == 3
+    assert 'X-Proximo-After-Id' in resposta.headers
+
+
+def test_projecao_de_campos(cliente, pedidos_retirados):
+    completa = cliente.get('/api/pedidos?status=retirado').get_json()
+    
+    projetada = cliente.get('/api/pedidos?status=retirado&fields=status,campo_invalido').get_json()
+    
+    assert [set(p) for p in projetada] == [{'id', 'status'}] * len(completa)
+    assert [p['id'] for p in projetada] == [p['id'] for p in completa]
@@ -0,0 +1,57 @@
+"""
+Cardápio do totem servido da memória: mesmos bytes enquanto o catálogo não muda,
+304 com o ETag atual e nova versão depois de um ajuste de estoque.
+"""
+import pytest
+
+
+def ids_produtos(dados):
+    return {p['id'] for c in dados['categorias'] for p in c['produtos']}
+
+
+@pytest.fixture
+def produto_com_estoque(admin):
+    """
+    Um produto à venda no totem; o estoque original volta no fim do teste.
+    """
+    dados = admin.get('/api/dados').get_json()
+    produto = next(p for c in dados['categorias'] for p in c['produtos'] if p['estoque'])
+    yield produto
+    admin.post('/api/estoque/ajustes', json={
+        'motivo': 'teste', 'ajustes': [{'tabela': 'produtos', 'id': produto['id'], 'definir': produto['estoque']}]})
+
+
+def test_bytes_reaproveitados_enquanto_a_versao_nao_muda(modulo_app):
+    etag, corpo = modulo_app.payload_totem.obter(True)
+    
+    assert modulo_app.payload_totem.obter(True) == (etag, corpo)
+    assert modulo_app.payload_totem.obter(True)[1] is corpo
+    assert modulo_app.payload_totem.obter(False)[0] != etag
+
+
+def test_etag_atual_responde_304(cliente):
+    primeira = cliente.get('/api/dados?totem=true')
+    
+    segunda = cliente.get('/api/dados?totem=true', headers={'If-None-Match': primeira.headers['ETag']})
+    
+    assert primeira.headers['ETag'].startswith('W/')
+    assert primeira.headers['Cache-Control'] == 'no-cache'
+    assert segunda.status_code == 304
+    assert segunda.get_data() == b''
+
+
+def test_estoque_zerado_sai_do_totem(cliente, admin, produto_com_estoque):
+    antes = cliente.get('/api/dados?totem=true')
+    assert produto_com_estoque['id'] in ids_produtos(antes.get_json())
+    
+    resposta = admin.post('/api/estoque/ajustes', json={
+        'motivo': 'teste', 'ajustes': [{'tabela': 'produtos', 'id': produto_com_estoque['id'], 'definir': 0}]})
+    assert resposta.status_code == 200, resposta.get_json()
+    
+    depois = cliente.get('/api/dados?totem=true', headers={'If-None-Match': antes.headers['ETag']})
+    assert depois.status_code == 200
+    assert depois.headers['ETag'] != antes.headers['ETag']
+    assert produto_com_estoque['id'] not in ids_produtos(depois.get_json())
+    # Fora do modo totem o produto continua listado, com estoque 0
+    completo = cliente.get('/api/dados').get_json()
+    assert produto_com_estoque['id'] in ids_produtos(completo)
@@ -0,0 +1,40 @@
+"""
+Quantidades do pedido: só inteiros positivos (negativo devolveria estoque).
+"""
+import pytest
+
+QUANTIDADES_INVALIDAS = [-50, 0, 1.5, '2', True, None]
+
+
+def estoque_agua(modulo_app):
+    return modulo_app.catalogo_menu.obter().produto(nome='Água Mineral 500ml')['estoque']
+
+
+@pytest.mark.parametrize('quantidade', QUANTIDADES_INVALIDAS)
+def test_quantidade_de_item_invalida(modulo_app, cliente, quantidade):
+    antes = estoque_agua(modulo_app)
+    
+    resposta = cliente.post('/api/pedidos', json={
+        'cliente_nome': 'Teste',
+        'itens': [{'produto': 'Água Mineral 500ml', 'quantidade': quantidade}],
+    })
+    
+    assert resposta.status_code == 400
+    assert 'quantidade' in resposta.get_json()['message']
+    assert estoque_agua(modulo_app) == antes
+
+
+@pytest.mark.parametrize('quantidade', QUANTIDADES_INVALIDAS)
+def test_quantidade_de_adicional_invalida(cliente, quantidade):
+    resposta = cliente.post('/api/pedidos', json={
+        'cliente_nome': 'Teste',
+        'itens': [{'produto': 'Açaí Tradicional 300ml', 'quantidade': 1,
+                   'adicionais': [{'nome': 'Granola', 'quantidade': quantidade}]}],
+    })
+    
+    assert resposta.status_code == 400
+
+
+def test_quantidade_omitida_vale_um(modulo_app):
+    plano = modulo_app.planejar_pedido([{'produto': 'Água Mineral 500ml'}], modulo_app.catalogo_menu.obter())
+    assert list(plano['baixas_produtos'].values()) == [1]
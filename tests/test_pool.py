@@ -0,0 +1,72 @@
+"""
+Pool de conexões: reaproveita conexões, nunca devolve transação aberta e
+recusa empréstimo quando esgotado.
+"""
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def pool(modulo_app, tmp_path):
+    caminho = str(tmp_path / 'pool.db')
+    conn = sqlite3.connect(caminho)
+    conn.execute("CREATE TABLE t (v INTEGER)")
+    conn.commit()
+    conn.close()
+    return modulo_app.PoolConexoes(caminho, tamanho=2, timeout=0.05)
+
+
+def test_conexao_devolvida_e_reaproveitada(pool):
+    primeira = pool.adquirir()
+    bruta = primeira._conn
+    primeira.close()
+    
+    segunda = pool.adquirir()
+    try:
+        assert segunda._conn is bruta
+    finally:
+        segunda.close()
+    stats = pool.estatisticas()
+    assert (stats['misses'], stats['hits'], stats['livres']) == (1, 1, 1)
+
+
+def test_transacao_aberta_e_desfeita_ao_devolver(pool):
+    with pool.adquirir() as conn:
+        conn.execute("INSERT INTO t VALUES (1)")
+        assert conn.in_transaction
+    
+    with pool.adquirir() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_conexao_devolvida_nao_pode_ser_usada(pool):
+    conn = pool.adquirir()
+    conn.close()
+    conn.close()  # Segundo close não devolve a mesma conexão duas vezes
+    
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    assert pool.estatisticas()['livres'] == 1
+
+
+def test_pool_esgotado_recusa_emprestimo(pool):
+    emprestadas = [pool.adquirir(), pool.adquirir()]
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            pool.adquirir()
+    finally:
+        for conn in emprestadas:
+            conn.close()
+    
+    assert pool.estatisticas()['esgotado'] == 1
+    pool.adquirir().close()  # Vagas liberadas pelo close()
+
+
+def test_get_db_usa_o_mesmo_pool_por_banco(modulo_app):
+    assert modulo_app.obter_pool(modulo_app.MENU_DB_PATH) is modulo_app.obter_pool(modulo_app.MENU_DB_PATH)
+    
+    with modulo_app.get_db_pedido() as conn:
+        # Pool do caminho de escrita do pedido já vem com o cardápio anexado
+        assert conn.execute("SELECT COUNT(*) FROM menu.produtos").fetchone()[0] > 0
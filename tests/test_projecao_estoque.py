@@ -0,0 +1,54 @@
+"""
+Projeção de estoque: sem alerta por consumo antes de observar o bastante.
+"""
+import time
+
+
+def item_com_estoque(modulo_app):
+    snapshot = modulo_app.catalogo_menu.obter()
+    item_id, item = max(snapshot.produtos_por_id.items(), key=lambda par: par[1]['estoque'] or 0)
+    assert item['estoque'] > modulo_app.PROJECAO_ESTOQUE_MINIMO
+    return item_id, item
+
+
+def projetado(projecao, item_id, agora):
+    return next(i for i in projecao.projetar(agora) if i['tabela'] == 'produtos' and i['id'] == item_id)
+
+
+def test_sem_previsao_logo_apos_iniciar(modulo_app):
+    item_id, item = item_com_estoque(modulo_app)
+    projecao = modulo_app.ProjecaoEstoque()
+    agora = time.time()
+    # Reinício seguido de dois pedidos grandes: antes virava "acaba em minutos"
+    for _ in range(2):
+        projecao.registrar({'produtos': [[item_id, item['estoque'] // 2]]}, agora)
+    
+    resultado = projetado(projecao, item_id, agora + 60)
+    
+    assert resultado['minutos_restantes'] is None
+    assert resultado['alerta'] is None
+
+
+def test_previsao_depois_da_observacao_minima(modulo_app):
+    item_id, item = item_com_estoque(modulo_app)
+    projecao = modulo_app.ProjecaoEstoque()
+    agora = time.time()
+    projecao._inicio = agora - (modulo_app.PROJECAO_OBSERVACAO_MIN + 5) * 60
+    for minuto in range(modulo_app.PROJECAO_AMOSTRAS_MIN):
+        projecao.registrar({'produtos': [[item_id, item['estoque']]]}, agora - minuto * 60)
+    
+    resultado = projetado(projecao, item_id, agora)
+    
+    assert resultado['amostras'] == modulo_app.PROJECAO_AMOSTRAS_MIN
+    assert resultado['minutos_restantes'] is not None
+    assert resultado['alerta'] == 'baixo'
+
+
+def test_monitor_recusa_varios_workers_sem_transporte(modulo_app, monkeypatch):
+    monkeypatch.setattr(modulo_app, 'PROJECAO_WORKERS', 2)
+    monkeypatch.setattr(modulo_app, 'BARRAMENTO_ENDERECO', '')
+    projecao = modulo_app.ProjecaoEstoque()
+    
+    assert projecao.iniciar_monitor() is False
+    assert projecao._monitor is None
+    assert 'BARRAMENTO_ENDERECO' in projecao.monitor_recusado
@@ -0,0 +1,109 @@
+"""
+Reconciliação de pedidos gravados pela metade (COMMIT com ATTACH em WAL não é
+atômico entre os dois arquivos).
+"""
+
+
+VAZIO = {'baixas_aplicadas': [], 'nao_resolvidos': [], 'estornos': []}
+
+
+def plano_acai(modulo_app):
+    catalogo = modulo_app.catalogo_menu.obter()
+    return modulo_app.planejar_pedido([{
+        'produto': 'Açaí Tradicional 300ml', 'quantidade': 2,
+        'adicionais': [{'nome': 'Granola', 'quantidade': 1}],
+    }], catalogo)
+
+
+def estoque(conn, tabela, item_id):
+    return conn.execute(f"SELECT estoque FROM menu.{tabela} WHERE id = ?", (item_id,)).fetchone()[0]
+
+
+def test_pedido_sem_baixa_recebe_a_baixa_uma_vez(modulo_app):
+    plano = plano_acai(modulo_app)
+    produto_id = next(iter(plano['baixas_produtos']))
+    adicional_id = next(iter(plano['baixas_adicionais']))
+    conn = modulo_app.get_db_pedido()
+    try:
+        # Diário já em uso: um pedido completo
+        modulo_app.registrar_pedido(conn, plano, 'Completo', 'local')
+        antes = estoque(conn, 'produtos', produto_id), estoque(conn, 'adicionais', adicional_id)
+        # Só pedidos.db chegou ao disco
+        conn.execute("BEGIN IMMEDIATE")
+        pedido_id = modulo_app.gravar_pedido(conn.cursor(), plano, 'Metade', 'local')
+        conn.commit()
+        
+        resultado = modulo_app.reconciliar_estoque_pedidos()
+        
+        assert resultado['baixas_aplicadas'] == [pedido_id]
+        assert estoque(conn, 'produtos', produto_id) == antes[0] - 2
+        assert estoque(conn, 'adicionais', adicional_id) == antes[1] - 2
+        assert modulo_app.reconciliar_estoque_pedidos() == VAZIO
+    finally:
+        conn.close()
+
+
+def test_baixa_de_pedido_inexistente_e_estornada(modulo_app):
+    plano = plano_acai(modulo_app)
+    produto_id = next(iter(plano['baixas_produtos']))
+    conn = modulo_app.get_db_pedido()
+    try:
+        modulo_app.registrar_pedido(conn, plano, 'Completo', 'local')
+        antes = estoque(conn, 'produtos', produto_id)
+        # Só o cardápio chegou ao disco: baixa de um pedido que não existe
+        fantasma = conn.execute("SELECT MAX(id) FROM pedidos").fetchone()[0] + 1
+        conn.execute("BEGIN IMMEDIATE")
+        modulo_app.reservar_estoque(conn.cursor(), plano, 'menu')
+        modulo_app.registrar_baixas_pedido(conn.cursor(), plano, fantasma, 'menu')
+        conn.commit()
+        
+        resultado = modulo_app.reconciliar_estoque_pedidos()
+        
+        assert resultado['estornos'] == [fantasma]
+        assert estoque(conn, 'produtos', produto_id) == antes
+        assert modulo_app.reconciliar_estoque_pedidos() == VAZIO
+    finally:
+        conn.close()
+
+
+def test_reconcilia_pelo_id_mesmo_com_o_nome_trocado(modulo_app):
+    plano = plano_acai(modulo_app)
+    produto_id = next(iter(plano['baixas_produtos']))
+    conn = modulo_app.get_db_pedido()
+    try:
+        # Estoque folgado: outros testes da sessão já consumiram o açaí
+        conn.execute("UPDATE menu.produtos SET estoque = 50 WHERE id = ?", (produto_id,))
+        conn.commit()
+        modulo_app.registrar_pedido(conn, plano, 'Completo', 'local')
+        antes = estoque(conn, 'produtos', produto_id)
+        conn.execute("BEGIN IMMEDIATE")
+        pedido_id = modulo_app.gravar_pedido(conn.cursor(), plano, 'Metade', 'local')
+        # Nome gravado no item não bate mais com o cardápio
+        conn.execute("UPDATE itens_pedido SET produto_nome = 'Nome Antigo' WHERE pedido_id = ?", (pedido_id,))
+        conn.commit()
+        
+        assert modulo_app.reconciliar_estoque_pedidos()['baixas_aplicadas'] == [pedido_id]
+        assert estoque(conn, 'produtos', produto_id) == antes - 2
+    finally:
+        conn.close()
+
+
+def test_pedido_fora_do_cardapio_e_conferido_uma_vez(modulo_app):
+    plano = plano_acai(modulo_app)
+    conn = modulo_app.get_db_pedido()
+    try:
+        modulo_app.registrar_pedido(conn, plano, 'Completo', 'local')
+        conn.execute("BEGIN IMMEDIATE")
+        pedido_id = modulo_app.gravar_pedido(conn.cursor(), plano, 'Metade', 'local')
+        # Produto e adicional removidos do cardápio depois do pedido
+        conn.execute("UPDATE itens_pedido SET produto_id = -1 WHERE pedido_id = ?", (pedido_id,))
+        conn.execute(
+            "UPDATE adicionais_pedido SET adicional_id = -1 "
+            "WHERE item_pedido_id IN (SELECT id FROM itens_pedido WHERE pedido_id = ?)", (pedido_id,)
+        )
+        conn.commit()
+        
+        assert modulo_app.reconciliar_estoque_pedidos()['nao_resolvidos'] == [pedido_id]
+        assert modulo_app.reconciliar_estoque_pedidos() == VAZIO
+    finally:
+        conn.close()
@@ -0,0 +1,25 @@
+"""
+Ponto de entrada de produção.
+
+    gunicorn -c gunicorn.conf.py wsgi:app     (Linux/macOS)
+    python wsgi.py                            (waitress, também no Windows)
+
+create_app() inicializa os bancos uma vez só e deixa o agendador de
+backups com o worker que ganhar o lock de líder.
+"""
+import os
+
+from app import create_app
+
+app = create_app()
+
+if __name__ == '__main__':
+    from waitress import serve
+    
+    host = os.environ.get('HOST', '0.0.0.0')
+    porta = int(os.environ.get('PORT', '4000'))
+    threads = int(os.environ.get('WEB_THREADS', '16'))
+    print(f'🚀 waitress em http://{host}:{porta} ({threads} threads)')
+    
+    # ✅ send_bytes=1: o waitress não segura eventos SSE pequenos no buffer
+    serve(app, host=host, port=porta, threads=threads, send_bytes=1, channel_timeout=120)